@@ -15,7 +15,7 @@
     # Check https://github.com/odoo/odoo/blob/11.0/odoo/addons/base/module/module_data.xml
     # for the full list
     'category': 'Risk management',
-    'version': '11.0.1.0',
+    'version': '11.0.1.4',
     # any module necessary for this one to work correctly
     'depends': ['base', 'project', 'mail'],
 
@@ -34,6 +34,7 @@
         'report/risk_summary_report.xml',
         'report/risk_profile_wizard.xml',
         'report/risk_profile_report.xml',
+        'report/risk_heatmap_report.xml',
     ],
     # only loaded in demonstration mode
     'demo': [
@@ -1,20 +1,33 @@
 # -*- coding: utf-8 -*-
+import json
+
 from odoo import http
+from odoo.http import request
+
+
+class RiskChartController(http.Controller):
 
-# class RiskManagement(http.Controller):
-#     @http.route('/risk_management/risk_management/', auth='public')
-#     def index(self, **kw):
-#         return "Hello, world"
+    @http.route('/risk_management/chart_data', type='http', auth='user', methods=['GET'])
+    def chart_data(self, ids='', max_points=None, **kw):
+        """
+        Serves in a single response the pre-aggregated series of the risk profile and risk timeline charts.
+        The response carries an ETag fingerprinting the underlying records, so that unchanged charts are answered
+        with a 304 without aggregating anything.
+        :param ids: string: comma separated ids of the risks
+        :param max_points: string: maximum number of points of each time series
+        """
+        try:
+            risk_ids = [int(risk_id) for risk_id in ids.split(',') if risk_id.strip()]
+            max_points = int(max_points) if max_points else None
+        except ValueError:
+            return request.make_response(json.dumps({'error': 'invalid parameters'}), status=400,
+                                         headers=[('Content-Type', 'application/json')])
 
-#     @http.route('/risk_management/risk_management/objects/', auth='public')
-#     def list(self, **kw):
-#         return http.request.render('risk_management.listing', {
-#             'root': '/risk_management/risk_management',
-#             'objects': http.request.env['risk_management.risk_management'].search([]),
-#         })
+        risk_model = request.env['risk_management.business_risk']
+        etag = risk_model._get_chart_fingerprint(risk_ids, max_points)
+        headers = [('ETag', '"%s"' % etag), ('Cache-Control', 'private, no-cache')]
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response('', status=304, headers=headers)
 
-#     @http.route('/risk_management/risk_management/objects/<model("risk_management.risk_management"):obj>/', auth='public')
-#     def object(self, obj, **kw):
-#         return http.request.render('risk_management.object', {
-#             'object': obj
-#         })
\ No newline at end of file
+        data = risk_model.get_chart_data(risk_ids, max_points=max_points)
+        return request.make_response(json.dumps(data), headers=headers + [('Content-Type', 'application/json')])
@@ -0,0 +1,26 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# the pending activities of the risk management process were told apart by their note, they now have a step key
+STEP_NOTES = [
+    ('confirm', 'Check and confirm the existence of the risk%'),
+    ('evaluate', 'Assess the probability of risk occurring and its possible impact%'),
+    ('validate', 'Validate the risk assessment%'),
+    ('treat', 'Select and implement measures to modify risk%'),
+]
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    for step, note in STEP_NOTES:
+        cr.execute("""
+            UPDATE mail_activity activity
+            SET risk_step = %s
+            FROM ir_model model
+            WHERE model.id = activity.res_model_id AND model.model = 'risk_management.business_risk'
+              AND activity.risk_step IS NULL
+              AND regexp_replace(activity.note, '<[^>]*>', '', 'g') ILIKE %s
+        """, (step, note))
+        _logger.info("%d risk management activities set to the step %s", cr.rowcount, step)
@@ -0,0 +1,22 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Fills the asset reference columns of the business risks from `ref_asset_id`, before the module update so that
+    the ORM does not recompute them one risk at a time"""
+    if not version:
+        return
+    cr.execute("""
+        ALTER TABLE risk_management_business_risk
+            ADD COLUMN IF NOT EXISTS asset_model varchar,
+            ADD COLUMN IF NOT EXISTS asset_res_id integer
+    """)
+    cr.execute("""
+        UPDATE risk_management_business_risk
+        SET asset_model = split_part(ref_asset_id, ',', 1),
+            asset_res_id = NULLIF(split_part(ref_asset_id, ',', 2), '')::integer
+        WHERE ref_asset_id IS NOT NULL AND ref_asset_id != ''
+    """)
+    _logger.info("Asset reference columns filled for %d business risks", cr.rowcount)
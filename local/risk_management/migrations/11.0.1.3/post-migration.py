@@ -0,0 +1,9 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # count the evaluations validated before the heat map existed
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['risk_management.risk_heatmap'].rebuild()
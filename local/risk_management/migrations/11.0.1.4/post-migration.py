@@ -0,0 +1,14 @@
+from odoo import api, SUPERUSER_ID
+from odoo.addons.risk_management.models.risk_utils import deferred_priorities
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # the risks kept by the merge of the duplicates may have been handed a more recent evaluation
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    risks = env['risk_management.business_risk'].with_context(active_test=False).search(
+        [('evaluation_ids', '!=', False)])
+    with deferred_priorities(env):
+        risks.modified(['evaluation_ids'])
+        risks.recompute()
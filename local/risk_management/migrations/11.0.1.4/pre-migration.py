@@ -0,0 +1,74 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+RISK_MODEL = 'risk_management.business_risk'
+
+
+def migrate(cr, version):
+    """Merges the business risks reported more than once per company and asset, before the module update creates the
+    unique index `risk_management_business_risk_report_unique`. The risk kept is the one reviewed last, the others
+    hand their evaluations, treatment tasks, messages, activities, attachments and followers over to it."""
+    if not version:
+        return
+    cr.execute("""
+        CREATE TEMPORARY TABLE risk_management_business_risk_duplicate ON COMMIT DROP AS
+        SELECT id, keep_id
+        FROM (SELECT id, first_value(id) OVER (PARTITION BY company_id, risk_info_id, risk_type,
+                                                            COALESCE(ref_asset_id, '')
+                                               ORDER BY review_date DESC NULLS LAST, id) AS keep_id
+              FROM risk_management_business_risk
+              -- as for the unique index, risks with an empty key are all distinct
+              WHERE company_id IS NOT NULL AND risk_info_id IS NOT NULL AND risk_type IS NOT NULL) AS risk
+        WHERE id != keep_id
+    """)
+    if not cr.rowcount:
+        return
+    _logger.info("Merging %d business risks reported more than once", cr.rowcount)
+
+    cr.execute("""
+        UPDATE risk_management_business_risk_evaluation evaluation SET business_risk_id = duplicate.keep_id
+        FROM risk_management_business_risk_duplicate duplicate
+        WHERE evaluation.business_risk_id = duplicate.id
+    """)
+    cr.execute("""
+        UPDATE project_task task SET business_risk_id = duplicate.keep_id
+        FROM risk_management_business_risk_duplicate duplicate
+        WHERE task.business_risk_id = duplicate.id
+    """)
+    for table, model_column in (('mail_message', 'model'), ('mail_activity', 'res_model'),
+                                ('ir_attachment', 'res_model')):
+        cr.execute("""
+            UPDATE {table} record SET res_id = duplicate.keep_id
+            FROM risk_management_business_risk_duplicate duplicate
+            WHERE record.{model_column} = %s AND record.res_id = duplicate.id
+        """.format(table=table, model_column=model_column), (RISK_MODEL,))
+
+    # a partner or channel follows a risk once: the followers of the duplicates already following the risk kept, or
+    # following several of its duplicates, are dropped
+    cr.execute("""
+        UPDATE mail_followers follower SET res_id = duplicate.keep_id
+        FROM risk_management_business_risk_duplicate duplicate
+        WHERE follower.res_model = %s AND follower.res_id = duplicate.id
+          AND follower.id IN (SELECT min(other.id)
+                              FROM mail_followers other
+                              JOIN risk_management_business_risk_duplicate other_duplicate
+                                   ON other_duplicate.id = other.res_id
+                              WHERE other.res_model = %s
+                              GROUP BY other_duplicate.keep_id, other.partner_id, other.channel_id)
+          AND NOT EXISTS (SELECT 1
+                          FROM mail_followers kept
+                          WHERE kept.res_model = follower.res_model AND kept.res_id = duplicate.keep_id
+                            AND kept.partner_id IS NOT DISTINCT FROM follower.partner_id
+                            AND kept.channel_id IS NOT DISTINCT FROM follower.channel_id)
+    """, (RISK_MODEL, RISK_MODEL))
+    cr.execute("""
+        DELETE FROM mail_followers
+        WHERE res_model = %s AND res_id IN (SELECT id FROM risk_management_business_risk_duplicate)
+    """, (RISK_MODEL,))
+
+    cr.execute("""
+        DELETE FROM risk_management_business_risk
+        WHERE id IN (SELECT id FROM risk_management_business_risk_duplicate)
+    """)
+    _logger.info("%d duplicate business risks merged", cr.rowcount)
@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
-from . import process, risks, project, res_users, res_config_settings, risk_utils
+from . import process, risks, project, res_users, res_company, res_config_settings, risk_utils, risk_import, \
+    mail_activity, risk_heatmap, risk_simulation, process_graph, risk_propagation
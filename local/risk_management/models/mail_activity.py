@@ -0,0 +1,11 @@
+from odoo import models, fields
+
+
+class MailActivity(models.Model):
+    _inherit = 'mail.activity'
+
+    # keys of `risk_utils.RISK_STEPS`
+    risk_step = fields.Selection(selection=[('confirm', 'Confirm'), ('evaluate', 'Evaluate'),
+                                            ('validate', 'Validate Evaluation'), ('treat', 'Treat')],
+                                 string='Risk Management Step', index=True, readonly=True,
+                                 help='Step of the risk management process this activity stands for')
@@ -2,7 +2,11 @@
 
 import logging
 import math
-from odoo import models, fields, api, exceptions, _
+from collections import deque
+
+from odoo import models, fields, api, exceptions, tools, _
+from .process_graph import ProcessGraph, PROCESS_GRAPH_FIELDS, PROCESS_GRAPH_IO_FIELDS
+from .risk_utils import attachment_domain, attachment_index, grouped_count
 
 _logger = logging.getLogger(__name__)
 
@@ -91,9 +95,8 @@ class BusinessProcess(models.Model):
     def _check_output_not_in_input(self):
         """This is further enforced by the `input_data_ids` field domain"""
         for process in self:
-            for data in process.input_data_ids:
-                if data in process.output_data_ids:
-                    raise exceptions.ValidationError(_("A process cannot consume its own output"))
+            if process.input_data_ids & process.output_data_ids:
+                raise exceptions.ValidationError(_("A process cannot consume its own output"))
 
     @api.returns('self')
     def get_provider_processes(self):
@@ -149,15 +152,16 @@ class BusinessProcess(models.Model):
 
     @api.multi
     def _compute_risks(self):
+        risks_by_asset = self.env['risk_management.business_risk']._get_risks_by_asset(self)
         for rec in self:
-            rec.risk_ids = self.env['risk_management.business_risk'].search([
-                ('asset', '=', self._name + ',' + str(rec.id))
-            ])
+            rec.risk_ids = risks_by_asset.get(rec.id, False)
 
-    @api.depends('risk_ids')
+    @api.multi
     def _compute_risk_count(self):
+        counts = grouped_count(self.env['risk_management.business_risk'],
+                               [('asset_model', '=', self._name), ('asset_res_id', 'in', self.ids)], 'asset_res_id')
         for rec in self:
-            rec.risk_count = len(rec.risk_ids)
+            rec.risk_count = counts.get(rec.id, 0)
 
     @api.depends('output_data_ids.is_customer_voice', 'input_data_ids.dest_partner_ids')
     def _compute_is_core(self):
@@ -175,44 +179,241 @@ class BusinessProcess(models.Model):
             else:
                 rec.is_core = False
 
-    @api.depends("process_type", 'is_core', 'output_data_ids')
+    @api.depends('process_type', 'is_core', 'output_data_ids', 'input_data_ids')
     def _compute_sequence(self):
         """
         The sequence of a process depends on its type: operations come first and are ordered according to their proximity
-        to external clients; then management processes and finally support processes.
+        to external clients; then management processes and finally support processes. All the processes of the
+        companies of self are ranked at once, see `_get_process_ranks`, and the ranks of the other processes of these
+        companies are stored as well.
         :return: int
         """
-        proc = self.env['risk_management.business_process']
-        op = proc.search(['|', ('process_type', '=', 'O'), ('is_core', '=', True)])
-        mp = proc.search([('process_type', '=', 'M'), ('is_core', '=', False)])
-        sp = proc.search([('process_type', '=', 'S'), ('is_core', '=', False)])
+        ranks = self._get_process_ranks(self.mapped('company_id').ids)
         for rec in self:
-            if rec.process_type == 'O' or rec.is_core:
-                default = 10
-                if rec.get_customers()['external']:
-                    rec.sequence = default
-                elif rec.get_customers()['internal']:
-                    rec.sequence = 1 + min([proc.sequence for proc in rec.get_customers()['internal']])
-                else:
-                    rec.sequence = 100
-            elif rec.process_type == 'M':
-                default = max([rec.sequence for rec in op]) if op else 30
-                if rec.output_data_ids:
-                    rec.sequence = default + math.floor(default * (1 / len(rec.output_data_ids)))
-                else:
-                    rec.sequence = default + 150
-            elif rec.process_type == 'S':
-                default = max([rec.sequence for rec in mp]) if mp else 50
-                if rec.output_data_ids:
-                    rec.sequence = default + math.floor(default * (1 / len(rec.output_data_ids)))
-                else:
-                    rec.sequence = default + 300
-            else:
-                default = max([rec.sequence for rec in sp]) if sp else 70
-                if rec.output_data_ids:
-                    rec.sequence = default + math.floor(default * (1 / len(rec.output_data_ids)))
+            rec.sequence = ranks.get(rec.id, rec.sequence or 10)
+        others = {pid: rank for pid, rank in ranks.items() if pid not in self._ids}
+        if others:
+            self.env.cr.execute("""
+                UPDATE {table} AS process SET sequence = ranked.rank
+                FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::int[]) AS rank) AS ranked
+                WHERE process.id = ranked.id AND process.sequence IS DISTINCT FROM ranked.rank
+                RETURNING process.id
+            """.format(table=self._table), (list(others), list(others.values())))
+            changed_ids = [row[0] for row in self.env.cr.fetchall()]
+            if changed_ids:
+                self.invalidate_cache(['sequence'], changed_ids)
+
+    @api.model
+    def _get_process_ranks(self, company_ids):
+        """
+        Ranks the processes of the companies from their data-flow graph, built once, in a single pass:
+            - operations (and core processes) with external customers are ranked 10, the other operations are ranked
+              one more than their closest internal customer, with a breadth-first traversal of the graph; operations
+              with no customer, or that no customer can reach, are ranked 100, and their suppliers after them
+            - management processes come after the last operation, support processes after the last management
+              process, and any other process after the last support process; the more outputs, the closer to the
+              previous group
+        The customers of the operations, as returned by `get_customers`, are read from the `customer voice` data with a
+        single query. The processes are read as superuser, since the ranks of all of them are stored.
+        :param company_ids: list: ids of the companies whose processes are ranked
+        :return: dict: the rank by id of process
+        """
+        processes = self.sudo().search([('company_id', 'in', company_ids)])
+        operations = processes.filtered(lambda proc: proc.process_type == 'O' or proc.is_core)
+        core_ids = set(processes.filtered('is_core').ids)
+        ranks = {}
+
+        # customers of each operation: external if it uses customer voice input by a partner category, internal if
+        # it is core and uses customer voice output by a core process
+        voice_data = self.env['risk_management.business_process.input_output'].sudo().search_read(
+            [('is_customer_voice', '=', True), ('user_process_ids', 'in', operations.ids)],
+            ['business_process_id', 'source_part_cat_id', 'user_process_ids'])
+        # the data may come from the processes of other companies
+        producer_ids = {data['business_process_id'][0] for data in voice_data if data['business_process_id']}
+        core_ids |= set(self.sudo().search([('id', 'in', list(producer_ids - set(processes.ids))),
+                                            ('is_core', '=', True)]).ids)
+        with_external, internal_customers = set(), {}
+        for data in voice_data:
+            for user_id in data['user_process_ids']:
+                if data['source_part_cat_id']:
+                    with_external.add(user_id)
+                elif data['business_process_id'] and user_id in core_ids \
+                        and data['business_process_id'][0] in core_ids:
+                    internal_customers.setdefault(user_id, set()).add(data['business_process_id'][0])
+
+        # suppliers of each operation, ie the operations it is an internal customer of
+        suppliers = {proc.id: [] for proc in operations}
+        from_external, from_nowhere = deque(), deque()
+        for proc in operations:
+            for customer_id in sorted(internal_customers.get(proc.id, ())):
+                if customer_id in suppliers:
+                    suppliers[customer_id].append(proc.id)
+            if proc.id in with_external:
+                from_external.append(proc.id)
+            elif proc.id not in internal_customers:
+                from_nowhere.append(proc.id)
+        for roots, root_rank in ((from_external, 10), (from_nowhere, 100)):
+            for pid in roots:
+                ranks[pid] = root_rank
+            while roots:
+                pid = roots.popleft()
+                for supplier_id in suppliers[pid]:
+                    if supplier_id not in ranks:
+                        ranks[supplier_id] = ranks[pid] + 1
+                        roots.append(supplier_id)
+        for proc in operations:
+            ranks.setdefault(proc.id, 100)
+
+        others = processes - operations
+        default = max(ranks.values()) if ranks else 30
+        for process_types, offset, fallback in ((('M',), 150, 50), (('S',), 300, 70), (('PM',), 600, None)):
+            group_ranks = {}
+            for proc in others.filtered(lambda proc: proc.process_type in process_types):
+                if proc.output_data_ids:
+                    group_ranks[proc.id] = default + math.floor(default * (1 / len(proc.output_data_ids)))
                 else:
-                    rec.sequence = default + 600
+                    group_ranks[proc.id] = default + offset
+            ranks.update(group_ranks)
+            default = max(group_ranks.values()) if group_ranks else fallback
+        return ranks
+
+    @api.model
+    @tools.ormcache('company_id', 'self.env.lang')
+    def _get_process_graph(self, company_id):
+        """
+        The data-flow graph of the processes of a company, kept in the ORM cache, cleared by the changes of the
+        processes, their data, the partner categories and the channels. See `_build_process_graph`.
+        For read-only callers only: the cache is not cleared when a transaction rolls back, so a graph read while
+        validating or making changes could outlive them; these callers use `_build_process_graph` instead
+        :param company_id: int: id of the company
+        :return: ProcessGraph
+        """
+        return self._build_process_graph(company_id)
+
+    @api.model
+    def _build_process_graph(self, company_id):
+        """
+        Builds the data-flow graph of the processes of a company, with one query per kind of record. It is built as
+        superuser, the methods reading it filter the processes the user cannot read. The constraints use a graph
+        built on purpose: they read the rows being written, which a rollback would leave in the cached graph
+        :param company_id: int: id of the company
+        :return: ProcessGraph
+        """
+        graph = ProcessGraph()
+        processes = self.sudo().with_context(active_test=False).search_read(
+            [('company_id', '=', company_id)], ['name', 'process_type', 'is_core'])
+        for proc in processes:
+            graph.add_node(('process', proc['id']), proc['name'], process_type=proc['process_type'],
+                           is_core=proc['is_core'])
+
+        process_ids = [proc['id'] for proc in processes]
+        data = self.env['risk_management.business_process.input_output'].sudo().search_read(
+            ['|', ('business_process_id', 'in', process_ids), ('user_process_ids', 'in', process_ids)],
+            ['name', 'business_process_id', 'source_part_cat_id', 'user_process_ids', 'dest_partner_ids',
+             'ref_input_ids', 'channel_ids', 'is_customer_voice'])
+        category_ids = {cat_id for rec in data for cat_id in rec['dest_partner_ids']} | {
+            rec['source_part_cat_id'][0] for rec in data if rec['source_part_cat_id']}
+        for category_id, name in self.env['res.partner.category'].sudo().browse(category_ids).name_get():
+            graph.add_node(('partner', category_id), name)
+        for rec in data:
+            graph.add_node(('data', rec['id']), rec['name'], is_customer_voice=rec['is_customer_voice'],
+                           channel_ids=rec['channel_ids'])
+        for rec in data:
+            node = ('data', rec['id'])
+            if rec['business_process_id']:
+                graph.add_edge(('process', rec['business_process_id'][0]), node)
+            elif rec['source_part_cat_id']:
+                graph.add_edge(('partner', rec['source_part_cat_id'][0]), node)
+            for proc_id in rec['user_process_ids']:
+                graph.add_edge(node, ('process', proc_id))
+            for category_id in rec['dest_partner_ids']:
+                graph.add_edge(node, ('partner', category_id))
+            for ref_id in rec['ref_input_ids']:
+                graph.add_edge(('data', ref_id), node)
+        channel_ids = {channel_id for rec in data for channel_id in rec['channel_ids']}
+        graph.channels = dict(self.env['risk_management.business_process.channel'].sudo().browse(
+            channel_ids).name_get())
+        graph.index_customer_voice()
+        return graph
+
+    @api.model
+    def _describe_graph_path(self, graph, path):
+        """
+        :param graph: ProcessGraph: the graph of the path
+        :param path: list: nodes of the graph, or records not in it yet
+        :return: list: the steps of the path, as dicts {'kind': kind, 'id': id, 'name': name}
+        """
+        models = {'process': self._name, 'data': 'risk_management.business_process.input_output',
+                  'partner': 'res.partner.category'}
+        steps = []
+        for kind, res_id in path:
+            node = graph.nodes.get((kind, res_id))
+            name = node['name'] if node else self.env[models[kind]].sudo().browse(res_id).display_name
+            steps.append({'kind': kind, 'id': res_id, 'name': name})
+        return steps
+
+    @api.multi
+    def get_impact(self, direction='downstream'):
+        """
+        Returns the processes and the external partner categories a failure of self affects (downstream), or whose
+        failure affects self (upstream), and the documents through which, along the shortest path
+        :param direction: string: downstream or upstream
+        :return: dict: {'processes': [{'id': id, 'name': name, 'data_ids': [ids of the documents on the path]}, ...],
+                        'partners': [...]}, the closest first
+        """
+        self.ensure_one()
+        graph = self._get_process_graph(self.company_id.id)
+        paths = graph.reachable(('process', self.id), direction)
+        visible = set(self.search([('id', 'in', [node[1] for node in paths if node[0] == 'process'])]).ids)
+        impact = {'processes': [], 'partners': []}
+        for node, path in sorted(paths.items(), key=lambda item: (len(item[1]), item[0])):
+            kind, res_id = node
+            if kind == 'data' or (kind == 'process' and res_id not in visible):
+                continue
+            impact['processes' if kind == 'process' else 'partners'].append({
+                'id': res_id,
+                'name': graph.nodes[node]['name'],
+                'data_ids': [step[1] for step in path if step[0] == 'data'],
+            })
+        return impact
+
+    @api.multi
+    def get_path(self, target_id, target_kind='process', direction='downstream'):
+        """
+        Returns a shortest path of documents between self and a process or a partner category
+        :param target_id: int: id of the process or partner category
+        :param target_kind: string: process or partner
+        :param direction: string: downstream or upstream
+        :return: list: the steps of the path, as dicts {'kind': kind, 'id': id, 'name': name}, empty if there is none
+        """
+        self.ensure_one()
+        graph = self._get_process_graph(self.company_id.id)
+        path = graph.shortest_path(('process', self.id), (target_kind, target_id), direction) or []
+        return self._describe_graph_path(graph, path)
+
+    @api.model
+    def export_process_graph(self, company_id=None):
+        """
+        Exports the data-flow graph of the processes of a company, see `ProcessGraph.to_dict`
+        :param company_id: int: id of the company, the one of the user by default
+        :return: dict
+        """
+        company_id = company_id or self.env.user.company_id.id
+        graph = self._get_process_graph(company_id)
+        visible = set(self.search([('company_id', '=', company_id)]).ids)
+        return graph.to_dict({node for node in graph.nodes if node[0] != 'process' or node[1] in visible})
+
+    @api.model
+    def validate_process_map(self, company_id=None):
+        """
+        Validates the whole data-flow graph of the processes of a company at once, in linear time: the customer voice
+        must go through the company in one direction only, see `ProcessGraph.find_voice_cycles`
+        :param company_id: int: id of the company, the one of the user by default
+        :return: list: the cycles of customer voice, each as the list of its steps {'kind': kind, 'id': id,
+                 'name': name}, starting and ending at the same process; empty if the map is valid
+        """
+        graph = self._get_process_graph(company_id or self.env.user.company_id.id)
+        return [self._describe_graph_path(graph, cycle) for cycle in graph.find_voice_cycles()]
 
     @api.model
     def _message_get_auto_subscribe_fields(self, updated_fields, auto_follow_fields=None):
@@ -277,6 +478,8 @@ class BusinessProcess(models.Model):
             super(BusinessProcess, to_change).write({'color': color})
 
         res = super(BusinessProcess, self).write(vals)
+        if PROCESS_GRAPH_FIELDS.intersection(vals):
+            self.clear_caches()
 
         return res
 
@@ -288,7 +491,9 @@ class BusinessProcess(models.Model):
         if same_type:
             vals.update({'color': same_type.exists()[0].color})
 
-        return super(BusinessProcess, self).create(vals)
+        res = super(BusinessProcess, self).create(vals)
+        self.clear_caches()
+        return res
 
     @api.multi
     def unlink(self):
@@ -299,6 +504,7 @@ class BusinessProcess(models.Model):
         res = super(BusinessProcess, self).unlink()
         if res:
             analytic_accounts_to_delete.unlink()
+        self.clear_caches()
         return res
 
 
@@ -342,6 +548,29 @@ class AccountAnalyticAccount(models.Model):
         return result
 
 
+class PartnerCategory(models.Model):
+    _inherit = 'res.partner.category'
+
+    @api.multi
+    def write(self, vals):
+        res = super(PartnerCategory, self).write(vals)
+        if 'parent_id' in vals:
+            # moving a category in or out of the customer subtree changes the `customer voice` data
+            self.env['risk_management.business_process.input_output']._refresh_customer_voice()
+        if {'name', 'parent_id'} & set(vals):
+            # the process graphs hold the full names of the categories
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(PartnerCategory, self).unlink()
+        # the data input by the categories are deleted with them, and so are their references
+        self.env['risk_management.business_process.input_output']._refresh_customer_voice()
+        self.clear_caches()
+        return res
+
+
 class BusinessProcessIO(models.Model):
     _name = 'risk_management.business_process.input_output'
     _description = 'Business Process input/output'
@@ -360,9 +589,8 @@ class BusinessProcessIO(models.Model):
     ]
     name = fields.Char(required=True, index=True, translate=True, copy=False)
     description = fields.Html('Description', translate=True)
-    is_customer_voice = fields.Boolean('Customer Voice?', compute='_compute_is_customer_voice',
-                                       help="Does this data relay the customer voice?",
-                                       search='_search_is_customer_voice')
+    is_customer_voice = fields.Boolean('Customer Voice?', compute='_compute_is_customer_voice', store=True,
+                                       index=True, help="Does this data relay the customer voice?")
     business_process_id = fields.Many2one(comodel_name='risk_management.business_process', string='Internal source',
                                           ondelete='cascade',
                                           default=lambda self: self.env.context.get('default_business_process_id'))
@@ -397,7 +625,7 @@ class BusinessProcessIO(models.Model):
     default_partner_cat_parent_id = fields.Many2one('res.partner.category', default=lambda self: self.env.ref(
         'risk_management.process_partner_cat'), readonly=True)
     attachment_ids = fields.One2many('ir.attachment', string='Attached Documents', compute='_compute_attachments')
-    doc_count = fields.Integer(compute='_compute_attached_docs_count', string="Attachments")
+    doc_count = fields.Integer(compute='_compute_attachments', string="Attachments")
 
     @api.depends('source_part_cat_id', 'business_process_id')
     def _compute_origin(self):
@@ -411,43 +639,110 @@ class BusinessProcessIO(models.Model):
             else:
                 rec.origin_id = False
 
-    @api.depends('source_part_cat_id', 'ref_input_ids.is_customer_voice')
-    def _compute_is_customer_voice(self):
-        """a data is `customer voice` if it was input by an Customer or if it relays another `customer voice`."""
-        customers = self.env[
-            'res.partner.category'
-        ].search([('id', 'child_of', self.env.ref('risk_management.process_partner_cat_customer').id)])
+    @api.model
+    def _get_customer_voice_query(self):
+        """
+        Recursive query of the closure of the `customer voice` data: the data input by the customer partner category
+        or one of its descendants, and the data referencing them, transitively
+        :return: tuple: the `WITH RECURSIVE` clause defining the `customer_voice` table, and its parameters
+        """
+        query = """
+            WITH RECURSIVE customer_category(id) AS (
+                SELECT %s
+                UNION
+                SELECT category.id FROM res_partner_category category
+                JOIN customer_category ON category.parent_id = customer_category.id
+            ), customer_voice(id) AS (
+                SELECT data.id FROM {table} data
+                JOIN customer_category ON customer_category.id = data.source_part_cat_id
+                UNION
+                SELECT ref.input_id FROM risk_management_data_ref_rel ref
+                JOIN customer_voice ON customer_voice.id = ref.output_id
+            )
+        """.format(table=self._table)
+        return query, [self.env.ref('risk_management.process_partner_cat_customer').id]
 
+    @api.model
+    def _get_customer_voice_ids(self, ids=None):
+        """Returns the ids of the `customer voice` data among `ids`, or all of them"""
+        query, params = self._get_customer_voice_query()
+        if ids is not None:
+            if not ids:
+                return []
+            query += 'SELECT id FROM customer_voice WHERE id IN %s'
+            params.append(tuple(ids))
+        else:
+            query += 'SELECT id FROM customer_voice'
+        self.env.cr.execute(query, params)
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.depends('source_part_cat_id', 'ref_input_ids')
+    def _compute_is_customer_voice(self):
+        """a data is `customer voice` if it was input by an Customer or if it relays another `customer voice`.
+        The data downstream of a change are updated by `_refresh_customer_voice`."""
+        saved = self.filtered('id')
+        voice_ids = set(self._get_customer_voice_ids(saved.ids))
+        customers = None
         for rec in self:
-            if (rec.source_part_cat_id and rec.source_part_cat_id.id in customers.ids) \
-                    or rec.ref_input_ids.filtered('is_customer_voice'):
-                rec.is_customer_voice = True
+            if rec.id:
+                rec.is_customer_voice = rec.id in voice_ids
             else:
-                rec.is_customer_voice = False
+                # a record being edited is not in the database yet, its references are
+                if customers is None:
+                    customers = self.env['res.partner.category'].search(
+                        [('id', 'child_of', self.env.ref('risk_management.process_partner_cat_customer').id)])
+                rec.is_customer_voice = rec.source_part_cat_id in customers or bool(
+                    rec.ref_input_ids.filtered('is_customer_voice'))
 
-    def _search_is_customer_voice(self, operator, value):
-        customers = self.env[
-            'res.partner.category'
-        ].search([('id', 'child_of', self.env.ref('risk_management.process_partner_cat_customer').id)])
+    @api.model
+    def _refresh_customer_voice(self):
+        """
+        Store the closure of the `customer voice` data with a single update, recompute what depends on the data
+        whose flag changed, e.g. `is_core` of the processes using them, and check the data now relaying the customer
+        voice: their recipients were not checked by the constraints of the data changed, upstream or in the partner
+        categories
+        :return: recordset: the data whose flag changed
+        """
+        query, params = self._get_customer_voice_query()
+        self.env.cr.execute(query + """
+            UPDATE {table} data SET is_customer_voice = data.id IN (SELECT id FROM customer_voice)
+            WHERE data.is_customer_voice IS DISTINCT FROM (data.id IN (SELECT id FROM customer_voice))
+            RETURNING data.id
+        """.format(table=self._table), params)
+        changed = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if changed:
+            self.invalidate_cache(['is_customer_voice'], changed.ids)
+            changed.modified(['is_customer_voice'])
+            changed.recompute()
+            changed.filtered('is_customer_voice')._check_customer_voice_dont_u_turn()
+        return changed
 
-        def customer_voice(rec):
-            return (rec.source_part_cat_id and rec.source_part_cat_id.id in customers.ids) or (
-                    rec.ref_input_ids and rec.ref_input_ids.filtered(customer_voice)
-            )
+    @api.model
+    def create(self, vals):
+        res = super(BusinessProcessIO, self).create(vals)
+        if vals.get('ref_output_ids'):
+            self._refresh_customer_voice()
+        # the data are nodes of the process graphs
+        if PROCESS_GRAPH_IO_FIELDS.intersection(vals):
+            self.clear_caches()
+        return res
 
-        if operator not in ('=', '!=') or value not in (0, 1):
-            recs = self
-        elif operator == '=':
-            if value:
-                recs = self.filtered(customer_voice)
-            else:
-                recs = self.filtered(lambda rec: not customer_voice(rec))
-        else:
-            if value:
-                recs = self.filtered(lambda rec: not customer_voice(rec))
-            else:
-                recs = self.filtered(customer_voice)
-        return [('id', 'in', [rec.id for rec in recs])]
+    @api.multi
+    def write(self, vals):
+        res = super(BusinessProcessIO, self).write(vals)
+        changed = self.browse()
+        if {'source_part_cat_id', 'ref_input_ids', 'ref_output_ids'} & set(vals):
+            changed = self._refresh_customer_voice()
+        if changed or PROCESS_GRAPH_IO_FIELDS.intersection(vals):
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(BusinessProcessIO, self).unlink()
+        self._refresh_customer_voice()
+        self.clear_caches()
+        return res
 
     @api.onchange('is_customer_voice')
     def _onchange_is_customer_voice(self):
@@ -466,23 +761,17 @@ class BusinessProcessIO(models.Model):
                         ('company_id', '=', self.business_process_id.company_id.id)]
                 }}
 
+    @api.multi
     def _compute_attachments(self):
-        attachment = self.env['ir.attachment']
-        for io in self:
-            self.attachment_ids = attachment.search([
-                ('res_model', '=', 'risk_management.business_process.input_output'), ('res_id', '=', io.id)
-            ])
-
-    def _compute_attached_docs_count(self):
+        attachments = attachment_index(self)
         for io in self:
+            io.attachment_ids = attachments.get((io._name, io.id), False)
             io.doc_count = len(io.attachment_ids)
 
     @api.multi
     def attachment_tree_view(self):
         self.ensure_one()
-        domain = [
-            ('res_model', '=', 'risk_management.business_process.input_output'), ('res_id', '=', self.id)
-        ]
+        domain = attachment_domain(self)
         return {
             'name': _('Attachments'),
             'domain': domain,
@@ -518,19 +807,34 @@ class BusinessProcessIO(models.Model):
         if self.source_part_cat_id and self.dest_partner_ids:
             raise exceptions.ValidationError(_("Input from partner can't have other partners as recipients"))
 
-    @api.constrains('user_process_ids')
+    @api.constrains('user_process_ids', 'business_process_id', 'source_part_cat_id', 'ref_input_ids')
     def _check_customer_voice_dont_u_turn(self):
         """
         The customer-supplier relationship is not reciprocal between the business processes, hence customer's voice
-        goes through the company in one direction only
+        goes through the company in one direction only: only the edges of self are checked against the graph of the
+        company, whatever the length of the cycle they would close. The data becoming `customer voice` as a side
+        effect of a change are checked by `_refresh_customer_voice`
         """
-        if self.is_customer_voice and self.business_process_id:
-            if self.business_process_id.get_customers()['internal'] & self.user_process_ids:
-                intersect = self.business_process_id.get_customers()['internal'] & self.user_process_ids
-                processes = ', '.join([rec.name for rec in intersect])
-                raise exceptions.ValidationError(
-                    _('This document cannot have among its recipients the following process(es): %s') % processes
-                )
+        process_model = self.env['risk_management.business_process']
+        added_by_company = {}
+        for data in self.filtered(lambda rec: rec.is_customer_voice and rec.business_process_id):
+            added = added_by_company.setdefault(data.business_process_id.company_id.id, {})
+            for user in data.user_process_ids - data.business_process_id:
+                added.setdefault(data.business_process_id.id, {})[user.id] = data.id
+        for company_id, added in added_by_company.items():
+            graph = process_model._build_process_graph(company_id)
+            for process_id, customers in added.items():
+                for customer_id, data_id in customers.items():
+                    path = graph.find_voice_path(customer_id, process_id, added=added, removed=set(self.ids))
+                    if path:
+                        # the rows rolled back may have been read by a graph cached meanwhile
+                        self.clear_caches()
+                        steps = process_model._describe_graph_path(graph, [('process', process_id),
+                                                                           ('data', data_id)] + path)
+                        raise exceptions.ValidationError(
+                            _('This document cannot have among its recipients the process %s, the customer voice '
+                              'would come back through: %s') % (steps[2]['name'],
+                                                                 ' > '.join(step['name'] for step in steps)))
 
 
 class ProcessDataChannel(models.Model):
@@ -547,6 +851,20 @@ class ProcessDataChannel(models.Model):
                                 relation='risk_management_data_channel_rel', column1='channel_id',
                                 column2='data_id', string='Process Data')
 
+    @api.multi
+    def write(self, vals):
+        res = super(ProcessDataChannel, self).write(vals)
+        # the process graphs hold the channels of the data
+        if {'name', 'data_ids'} & set(vals):
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(ProcessDataChannel, self).unlink()
+        self.clear_caches()
+        return res
+
 
 class BusinessProcessTask(models.Model):
     _name = 'risk_management.business_process.task'
@@ -602,12 +920,15 @@ class BusinessProcessMethod(models.Model):
                                     ],
                                     help='Output Reference', required=True)
     author_name = fields.Char('From process', related='output_ref_id.business_process_id.name', readonly=True)
-    attachment_ids = fields.One2many('ir.attachment', string='Attached documents',
-                                     related='output_ref_id.attachment_ids')
-    doc_count = fields.Integer(compute='_compute_attached_docs_count', string="Number of documents attached")
+    attachment_ids = fields.One2many('ir.attachment', string='Attached documents', compute='_compute_attachments')
+    doc_count = fields.Integer(compute='_compute_attachments', string="Number of documents attached")
 
-    def _compute_attached_docs_count(self):
+    @api.multi
+    def _compute_attachments(self):
+        """The documents attached to the output referenced, indexed for all the methods at once"""
+        attachments = attachment_index(self.mapped('output_ref_id'))
         for method in self:
+            method.attachment_ids = attachments.get((method.output_ref_id._name, method.output_ref_id.id), False)
             method.doc_count = len(method.attachment_ids)
 
     @api.multi
@@ -0,0 +1,182 @@
+from collections import defaultdict, deque
+
+# fields of the processes, and of their data, drawn in their data-flow graph, whose change clears the graphs cached
+PROCESS_GRAPH_FIELDS = {'name', 'process_type', 'is_core', 'company_id', 'output_data_ids', 'input_data_ids'}
+PROCESS_GRAPH_IO_FIELDS = {'name', 'business_process_id', 'source_part_cat_id', 'user_process_ids',
+                           'dest_partner_ids', 'ref_input_ids', 'ref_output_ids', 'channel_ids'}
+PROCESS_GRAPH_DIRECTIONS = ('downstream', 'upstream')
+
+
+class ProcessGraph(object):
+    """
+    Adjacency index of the data flow between the business processes of a company. A node is a `(kind, id)` tuple,
+    the kind being `process`, `data` (an input/output document) or `partner` (a partner category). The edges follow
+    the data: a process or a partner category outputs a data, which is used by processes, sent to partner categories
+    and relayed by the data referencing it. The channels of the data are attributes of their nodes.
+    The flow of customer voice between the processes is indexed apart, to validate that it goes one way only.
+    The graphs are shared through the ORM cache, they must not be modified once built.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.successors = defaultdict(set)
+        self.predecessors = defaultdict(set)
+        self.channels = {}
+        # {process id: {customer process id: ids of the customer voice data passed on}}
+        self.voice_successors = {}
+
+    def add_node(self, node, name, **attributes):
+        self.nodes[node] = dict(attributes, name=name)
+
+    def add_edge(self, source, target):
+        if source in self.nodes and target in self.nodes:
+            self.successors[source].add(target)
+            self.predecessors[target].add(source)
+
+    def traverse(self, source, direction='downstream'):
+        """
+        Breadth-first traversal of the graph
+        :param source: tuple: the node the traversal starts from
+        :param direction: string: downstream to follow the data, upstream to go back to their sources
+        :return: dict: the nodes reachable from `source`, with their parent on one of their shortest paths from it
+        """
+        if direction not in PROCESS_GRAPH_DIRECTIONS:
+            raise ValueError('Unknown direction: %s' % direction)
+        neighbours = self.successors if direction == 'downstream' else self.predecessors
+        parents = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            # sorted, for the paths to be the same from one build of the graph to the other
+            for neighbour in sorted(neighbours.get(node, ())):
+                if neighbour not in parents:
+                    parents[neighbour] = node
+                    queue.append(neighbour)
+        return parents
+
+    @staticmethod
+    def _get_path(parents, node):
+        path = []
+        while node is not None:
+            path.append(node)
+            node = parents[node]
+        return path[::-1]
+
+    def reachable(self, source, direction='downstream'):
+        """
+        :return: dict: the shortest path from `source` to each node reachable from it, `source` excluded; upstream,
+                 the path goes back from `source` to the node
+        """
+        parents = self.traverse(source, direction)
+        return {node: self._get_path(parents, node) for node in parents if node != source}
+
+    def shortest_path(self, source, target, direction='downstream'):
+        """:return: list: the nodes of a shortest path from `source` to `target`, None if there is none"""
+        if source not in self.nodes or target not in self.nodes:
+            return None
+        parents = self.traverse(source, direction)
+        return self._get_path(parents, target) if target in parents else None
+
+    def index_customer_voice(self):
+        """Indexes the processes passing customer voice data on to other processes, once all the edges are added"""
+        self.voice_successors = {}
+        for node, attributes in self.nodes.items():
+            if node[0] != 'data' or not attributes.get('is_customer_voice'):
+                continue
+            for producer in self.predecessors.get(node, ()):
+                if producer[0] != 'process':
+                    continue
+                for user in self.successors.get(node, ()):
+                    if user[0] == 'process':
+                        self.voice_successors.setdefault(producer[1], {}).setdefault(user[1], set()).add(node[1])
+
+    def find_voice_path(self, source, target, added=None, removed=()):
+        """
+        Breadth-first search of a path of customer voice from a process to another
+        :param source: int: id of the process the path starts from
+        :param target: int: id of the process the path ends at
+        :param added: dict: edges of customer voice not in the graph yet, {process id: {customer id: data id}}
+        :param removed: set: ids of the data whose edges in the graph are ignored, as they were changed since
+        :return: list: the nodes of the path, processes and data alternating, None if there is none
+        """
+        added = added or {}
+        parents = {source: None}
+        queue = deque([source])
+        while queue:
+            process_id = queue.popleft()
+            if process_id == target:
+                path = [('process', target)]
+                while parents[process_id]:
+                    process_id, data_id = parents[process_id]
+                    path[:0] = [('process', process_id), ('data', data_id)]
+                return path
+            successors = dict(added.get(process_id, {}))
+            for customer_id, data_ids in self.voice_successors.get(process_id, {}).items():
+                data_ids = data_ids.difference(removed)
+                if data_ids and customer_id not in successors:
+                    successors[customer_id] = min(data_ids)
+            for customer_id in sorted(successors):
+                if customer_id not in parents:
+                    parents[customer_id] = (process_id, successors[customer_id])
+                    queue.append(customer_id)
+        return None
+
+    def find_voice_cycles(self):
+        """
+        Depth-first search of the cycles of customer voice between the processes, in linear time: every edge is
+        followed once, and each edge back to a process of the current path closes a cycle reported once
+        :return: list: the cycles, each a list of nodes, processes and data alternating, starting and ending at the
+                 same process
+        """
+        cycles = []
+        done = set()
+        for root in sorted(self.voice_successors):
+            if root in done:
+                continue
+            # path[i] passes the data via[i] on to path[i + 1]
+            path, via, positions = [root], [], {root: 0}
+            stack = [iter(sorted(self.voice_successors[root].items()))]
+            while stack:
+                for customer_id, data_ids in stack[-1]:
+                    if customer_id in positions:
+                        cycle = []
+                        for index in range(positions[customer_id], len(path)):
+                            cycle += [('process', path[index]),
+                                      ('data', via[index] if index < len(via) else min(data_ids))]
+                        cycles.append(cycle + [('process', customer_id)])
+                    elif customer_id not in done:
+                        via.append(min(data_ids))
+                        positions[customer_id] = len(path)
+                        path.append(customer_id)
+                        stack.append(iter(sorted(self.voice_successors.get(customer_id, {}).items())))
+                        break
+                else:
+                    stack.pop()
+                    process_id = path.pop()
+                    del positions[process_id]
+                    done.add(process_id)
+                    if via:
+                        via.pop()
+        return cycles
+
+    @staticmethod
+    def node_id(node):
+        return '%s_%d' % node
+
+    def to_dict(self, nodes=None):
+        """
+        JSON-serializable export of the graph
+        :param nodes: set: the nodes exported, all of them by default
+        :return: dict: {'nodes': [{'id': 'process_1', 'kind': 'process', 'res_id': 1, 'name': name, ...}, ...],
+                        'links': [{'source': 'process_1', 'target': 'data_2'}, ...],
+                        'channels': [{'id': id, 'name': name}, ...]}
+        """
+        nodes = set(self.nodes) if nodes is None else nodes & set(self.nodes)
+        return {
+            'nodes': [dict(self.nodes[node], id=self.node_id(node), kind=node[0], res_id=node[1])
+                      for node in sorted(nodes)],
+            'links': [{'source': self.node_id(source), 'target': self.node_id(target)}
+                      for source in sorted(nodes) for target in sorted(self.successors.get(source, ()))
+                      if target in nodes],
+            'channels': [{'id': channel_id, 'name': name} for channel_id, name in sorted(self.channels.items())],
+        }
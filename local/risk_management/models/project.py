@@ -1,8 +1,5 @@
-import datetime
 from odoo import models, fields, api
-from .risk_utils import add_risk_activity
-
-RISK_ACT_DELAY = 15
+from .risk_utils import grouped_count, set_risk_step
 
 
 class Project(models.Model):
@@ -13,15 +10,16 @@ class Project(models.Model):
 
     @api.multi
     def _compute_risk(self):
+        risks_by_asset = self.env['risk_management.business_risk']._get_risks_by_asset(self)
         for project in self:
-            project.risk_ids = self.env['risk_management.business_risk'].search([
-                ('asset', '=', self._name + ',' + str(project.id))
-            ])
+            project.risk_ids = risks_by_asset.get(project.id, False)
 
     @api.multi
     def _compute_risk_count(self):
+        counts = grouped_count(self.env['risk_management.business_risk'],
+                               [('asset_model', '=', self._name), ('asset_res_id', 'in', self.ids)], 'asset_res_id')
         for project in self:
-            project.risk_count = len(project.risk_ids)
+            project.risk_count = counts.get(project.id, 0)
 
     @api.multi
     def message_subscribe(self, partner_ids=None, channel_ids=None, subtype_ids=None, force=True):
@@ -61,13 +59,8 @@ class Task(models.Model):
     def write(self, vals):
         res = super(Task, self).write(vals)
         if res and vals.get('active', False):
-            # task has been reactivated
-            act_deadline_date = datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY)
-            deadline = fields.Date.to_string(act_deadline_date)
-            note = "Select and implement measures to modify risk."
-            for rec in self:
-                if rec.business_risk_id:
-                    # If it's a risk treatment task: this means the status of the risk changed to `Not acceptable`
-                    add_risk_activity(self.env, rec.business_risk_id, note, deadline)
+            # task has been reactivated: if it's a risk treatment task, this means the status of the risk changed to
+            # `Not acceptable`
+            set_risk_step(self.mapped('business_risk_id'), 'treat')
 
         return res
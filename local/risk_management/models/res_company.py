@@ -0,0 +1,17 @@
+from odoo import api, models, fields
+
+
+class Company(models.Model):
+    _inherit = 'res.company'
+
+    risk_priority_scope = fields.Selection([('company', 'Company'), ('asset', 'Asset')], string='Risk Priority Scope',
+                                           default='company', required=True,
+                                           help='Rank the priorities of the business risks of the company as a whole, '
+                                                'or separately for each asset affected by the risks.')
+
+    @api.multi
+    def write(self, vals):
+        res = super(Company, self).write(vals)
+        if 'risk_priority_scope' in vals:
+            self.env['risk_management.business_risk'].compute_priorities(self.ids)
+        return res
@@ -0,0 +1,124 @@
+import logging
+
+from odoo import models, fields, api
+from odoo.tools.sql import index_exists
+
+_logger = logging.getLogger(__name__)
+
+# fields of the evaluations, and of the risks, whose change moves the evaluations to another cell of the heat map
+RISK_HEATMAP_EVALUATION_FIELDS = {'business_risk_id', 'is_valid', 'eval_date', 'occurrence', 'severity',
+                                  'detectability'}
+RISK_HEATMAP_RISK_FIELDS = {'company_id', 'risk_info_id', 'risk_type', 'ref_asset_id'}
+# dimensions of a cell of the heat map; the nullable ones are coalesced so that the cells are unique
+RISK_HEATMAP_KEY = ('company_id', "COALESCE(asset_model, '')", 'COALESCE(risk_category_id, 0)',
+                    "COALESCE(risk_type, '')", "COALESCE(occurrence, '')", "COALESCE(severity, '')",
+                    "COALESCE(detectability, '')", 'period')
+
+
+class RiskHeatmap(models.Model):
+    """Number of validated risk evaluations by company, asset model, risk category, risk type, criteria levels and
+    month. The cells are maintained incrementally as the evaluations are created, validated, changed or deleted, so
+    that any slice or roll-up of the heat map is a read_group over a few hundred rows."""
+    _name = 'risk_management.risk_heatmap'
+    _description = 'Risk heat map'
+    _order = 'period desc, company_id'
+
+    company_id = fields.Many2one('res.company', string='Company', readonly=True, ondelete='cascade')
+    asset_model = fields.Char(string='Asset Model', readonly=True)
+    risk_category_id = fields.Many2one('risk_management.risk.category', string='Category', readonly=True,
+                                       ondelete='cascade')
+    risk_type = fields.Selection(selection=(('T', 'Threat'), ('O', 'Opportunity')), string='Type', readonly=True)
+    occurrence = fields.Selection(selection=lambda self: self._get_criteria_levels('occurrence'),
+                                  string='Occurrence', readonly=True)
+    severity = fields.Selection(selection=lambda self: self._get_criteria_levels('severity'), string='Impact',
+                                readonly=True)
+    detectability = fields.Selection(selection=lambda self: self._get_criteria_levels('detectability'),
+                                     string='Detectability', readonly=True)
+    period = fields.Date(string='Month', readonly=True)
+    evaluation_count = fields.Integer(string='Evaluations', readonly=True)
+
+    @api.model
+    def _get_criteria_levels(self, criterion):
+        return getattr(self.env['risk_management.risk_criteria.mixin'], '_get_%s' % criterion)()
+
+    @api.model_cr
+    def init(self):
+        index_name = 'risk_management_risk_heatmap_cell_unique'
+        if not index_exists(self._cr, index_name):
+            self._cr.execute('CREATE UNIQUE INDEX {index} ON {table} ({key})'.format(
+                index=index_name, table=self._table, key=', '.join(RISK_HEATMAP_KEY)))
+
+    @api.model
+    def _add_evaluations(self, evaluation_ids, sign=1):
+        """
+        Add (or remove) validated evaluations to the cells of the heat map, with a single upsert
+        :param evaluation_ids: list: ids of the evaluations, the ones not validated are ignored
+        :param sign: int: 1 to add the evaluations, -1 to remove them
+        :return: None
+        """
+        if not evaluation_ids:
+            return
+        self.env.cr.execute("""
+            INSERT INTO {heatmap} (company_id, asset_model, risk_category_id, risk_type, occurrence, severity,
+                                   detectability, period, evaluation_count)
+            SELECT risk.company_id, risk.asset_model, info.risk_category_id, risk.risk_type, evaluation.occurrence,
+                   evaluation.severity, evaluation.detectability, date_trunc('month', evaluation.eval_date)::date,
+                   %s * count(*)
+            FROM {evaluation} evaluation
+            JOIN {risk} risk ON risk.id = evaluation.business_risk_id
+            LEFT JOIN {info} info ON info.id = risk.risk_info_id
+            WHERE evaluation.id IN %s AND evaluation.is_valid
+            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+            ON CONFLICT ({key})
+            DO UPDATE SET evaluation_count = {heatmap}.evaluation_count + EXCLUDED.evaluation_count
+        """.format(heatmap=self._table, key=', '.join(RISK_HEATMAP_KEY),
+                   evaluation=self.env['risk_management.business_risk.evaluation']._table,
+                   risk=self.env['risk_management.business_risk']._table,
+                   info=self.env['risk_management.risk.info']._table), (sign, tuple(evaluation_ids)))
+        if sign < 0:
+            self.env.cr.execute('DELETE FROM {heatmap} WHERE evaluation_count <= 0'.format(heatmap=self._table))
+        self.invalidate_cache()
+
+    @api.model
+    def _remove_evaluations(self, evaluation_ids):
+        self._add_evaluations(evaluation_ids, sign=-1)
+
+    @api.model
+    def rebuild(self):
+        """Recount the whole heat map from the validated evaluations"""
+        self.env.cr.execute('DELETE FROM {heatmap}'.format(heatmap=self._table))
+        self.env.cr.execute('SELECT id FROM {evaluation} WHERE is_valid'.format(
+            evaluation=self.env['risk_management.business_risk.evaluation']._table))
+        self._add_evaluations([row[0] for row in self.env.cr.fetchall()])
+        _logger.info('Risk heat map rebuilt: %s cells', self.search_count([]))
+
+    @api.model
+    def get_slice(self, domain=None, groupby=()):
+        """
+        Read a slice (domain) or roll-up (groupby) of the heat map
+        :param domain: list: domain on the dimensions of the heat map
+        :param groupby: list: the dimensions kept, e.g. ['company_id', 'period:year']; the others are summed up
+        :return: list: a dict per cell of the roll-up, holding the values of the dimensions kept and its
+                 `evaluation_count`
+        """
+        groupby = list(groupby)
+        groups = self.read_group(domain or [], groupby + ['evaluation_count'], groupby, lazy=False)
+        return [dict({name: group[name] for name in groupby}, evaluation_count=group['evaluation_count'] or 0)
+                for group in groups]
+
+    @api.model
+    def get_matrix(self, domain=None, rows='occurrence', columns='severity'):
+        """
+        Read the heat map as a matrix of two criteria
+        :param domain: list: domain on the dimensions of the heat map
+        :param rows: string: criterion of the rows of the matrix
+        :param columns: string: criterion of the columns of the matrix
+        :return: list: the number of evaluations of each level of `rows` (list index 0 for level '1') and of each
+                 level of `columns`
+        """
+        size = len(self._get_criteria_levels(rows)), len(self._get_criteria_levels(columns))
+        matrix = [[0] * size[1] for __ in range(size[0])]
+        for cell in self.get_slice(domain, [rows, columns]):
+            if cell[rows] and cell[columns]:
+                matrix[int(cell[rows]) - 1][int(cell[columns]) - 1] += cell['evaluation_count']
+        return matrix
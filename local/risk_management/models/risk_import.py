@@ -0,0 +1,274 @@
+import base64
+import csv
+import io
+import itertools
+import logging
+import threading
+import time
+
+import psycopg2
+
+from odoo import models, fields, api, exceptions, _
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+RISK_IMPORT_DEFAULT_CHUNK_SIZE = 500
+# columns of the register, the first row of the file must hold these names
+RISK_IMPORT_COLUMNS = ('category', 'subcategory', 'risk', 'description', 'risk_type', 'asset', 'detectability',
+                       'occurrence', 'severity')
+RISK_IMPORT_CRITERIA = ('detectability', 'occurrence', 'severity')
+
+
+class RiskImport(models.Model):
+    """Imports a risk register from a CSV or XLSX file. The file is streamed row by row and the risks are reported in
+    chunks, each chunk being committed on a cursor of its own, so that an import which has failed can be resumed where
+    it stopped."""
+    _name = 'risk_management.risk_import'
+    _description = 'Risk register import'
+    _order = 'create_date desc'
+
+    name = fields.Char(required=True, default=lambda self: _('Risk register import'))
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 default=lambda self: self.env.user.company_id)
+    file = fields.Binary(string='File', attachment=True, required=True,
+                         help='CSV (UTF-8, comma separated) or XLSX file, whose first row holds the columns: %s'
+                              % ', '.join(RISK_IMPORT_COLUMNS))
+    file_name = fields.Char(string='File Name')
+    chunk_size = fields.Integer(string='Chunk Size', default=RISK_IMPORT_DEFAULT_CHUNK_SIZE, required=True,
+                                help='Number of rows imported and committed at once')
+    state = fields.Selection([('draft', 'Draft'), ('failed', 'Failed'), ('done', 'Done')], string='Status',
+                             default='draft', readonly=True, copy=False)
+    row_offset = fields.Integer(string='Rows Processed', readonly=True, copy=False,
+                                help='Number of rows of the file already imported, an import resumes after them')
+    created_count = fields.Integer(string='Created', readonly=True, copy=False)
+    reactivated_count = fields.Integer(string='Reactivated', readonly=True, copy=False)
+    duplicate_count = fields.Integer(string='Duplicates', readonly=True, copy=False)
+    error_count = fields.Integer(string='Errors', readonly=True, copy=False)
+    duration = fields.Float(string='Duration (s)', readonly=True, copy=False)
+    rows_per_second = fields.Float(compute='_compute_rows_per_second', string='Rows per Second')
+    log = fields.Text(string='Log', readonly=True, copy=False)
+
+    @api.depends('row_offset', 'duration')
+    def _compute_rows_per_second(self):
+        for rec in self:
+            rec.rows_per_second = rec.row_offset / rec.duration if rec.duration else 0.0
+
+    @api.constrains('chunk_size')
+    def _check_chunk_size(self):
+        for rec in self:
+            if rec.chunk_size < 1:
+                raise exceptions.ValidationError(_('The chunk size must be positive.'))
+
+    @api.multi
+    def action_import(self):
+        """Imports the file, or resumes the import after the rows already processed"""
+        testing = getattr(threading.currentThread(), 'testing', False)
+        for rec in self:
+            if testing:
+                rec._import()
+                continue
+            # the chunks are committed on a dedicated cursor, not to commit or discard the caller's transaction
+            with api.Environment.manage(), self.pool.cursor() as cr:
+                rec.with_env(rec.env(cr=cr))._import(commit=True)
+        self.invalidate_cache()
+        return True
+
+    @api.multi
+    def action_reset(self):
+        """Restarts the import from the first row of the file"""
+        self.write({'state': 'draft', 'row_offset': 0, 'created_count': 0, 'reactivated_count': 0,
+                    'duplicate_count': 0, 'error_count': 0, 'duration': 0.0, 'log': False})
+        return True
+
+    @api.multi
+    def _import(self, commit=False):
+        """
+        Imports the rows of the file after `row_offset`, chunk by chunk
+        :param commit: bool: commit each chunk, and the failure of the import; only on a cursor of its own
+        """
+        self.ensure_one()
+        risk_model = self.env['risk_management.business_risk'].with_context(tracking_disable=True)
+        categories, risk_infos = self._get_lookup_maps()
+        try:
+            rows = itertools.islice(self._read_rows(), self.row_offset, None)
+            for chunk in iter(lambda: list(itertools.islice(rows, self.chunk_size)), []):
+                start = time.time()
+                batch, outcomes, errors = [], [], []
+                for index, row in enumerate(chunk, self.row_offset + 2):
+                    try:
+                        vals, catalog = self._prepare_risk_vals(row, categories, risk_infos)
+                    except exceptions.UserError as e:
+                        errors.append((index, e.name))
+                        continue
+                    if catalog:
+                        outcomes.append((index, self._report_with_catalog(risk_model, vals, catalog, categories,
+                                                                          risk_infos)))
+                    else:
+                        batch.append((index, vals))
+                outcomes += zip([index for index, __ in batch],
+                                risk_model.create_batch([vals for __, vals in batch]))
+                counts = dict.fromkeys(('created', 'reactivated', 'duplicate', 'error'), 0)
+                counts['error'] = len(errors)
+                for index, outcome in outcomes:
+                    counts[outcome['status']] += 1
+                    if outcome['status'] == 'error':
+                        errors.append((index, outcome['message']))
+                self.write({
+                    'row_offset': self.row_offset + len(chunk),
+                    'created_count': self.created_count + counts['created'],
+                    'reactivated_count': self.reactivated_count + counts['reactivated'],
+                    'duplicate_count': self.duplicate_count + counts['duplicate'],
+                    'error_count': self.error_count + counts['error'],
+                    'duration': self.duration + time.time() - start,
+                    'log': '\n'.join(filter(None, [self.log] + [_('Row %d: %s') % error for error in sorted(
+                        errors, key=lambda error: error[0])])) or False,
+                })
+                if commit:
+                    self.env.cr.commit()
+                _logger.info("Risk import %s: %d rows processed, %.1f rows/s", self.id, self.row_offset,
+                             self.rows_per_second)
+        except Exception as e:
+            if not commit:
+                raise
+            # keep the chunks already committed, the import resumes from there
+            self.env.cr.rollback()
+            self.invalidate_cache()
+            _logger.exception("Risk import %s failed after %d rows", self.id, self.row_offset)
+            self.write({'state': 'failed', 'log': '\n'.join(filter(None, [self.log, str(e)]))})
+            self.env.cr.commit()
+            return
+        self.state = 'done'
+
+    @api.multi
+    def _get_lookup_maps(self):
+        """Maps the names of the categories, and the category, subcategory and name of the risk infos, to their ids,
+        reading each model once"""
+        categories = {rec['name']: rec['id']
+                      for rec in self.env['risk_management.risk.category'].search_read([], ['name'])}
+        risk_infos = {(rec['risk_category_id'][0], rec['subcategory'] or '', rec['name']): rec['id']
+                      for rec in self.env['risk_management.risk.info'].search_read(
+                          [], ['risk_category_id', 'subcategory', 'name'])}
+        return categories, risk_infos
+
+    @api.multi
+    def _read_rows(self):
+        """Yields the rows of the file as dicts, without loading the whole file in memory"""
+        self.ensure_one()
+        attachment = self.env['ir.attachment'].sudo().search([('res_model', '=', self._name),
+                                                              ('res_field', '=', 'file'),
+                                                              ('res_id', '=', self.id)], limit=1)
+        if not attachment:
+            raise exceptions.UserError(_('There is no file to import.'))
+        if attachment.store_fname:
+            stream = open(attachment._full_path(attachment.store_fname), 'rb')
+        else:
+            stream = io.BytesIO(base64.b64decode(attachment.db_datas or b''))
+
+        with stream:
+            if (self.file_name or '').lower().endswith('.xlsx'):
+                if openpyxl is None:
+                    raise exceptions.UserError(_('The python library openpyxl is required to import XLSX files.'))
+                workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+                try:
+                    rows = workbook.active.iter_rows()
+                    header = [str(cell.value or '').strip().lower() for cell in next(rows, [])]
+                    for row in rows:
+                        yield dict(zip(header, (cell.value for cell in row)))
+                finally:
+                    workbook.close()
+            else:
+                reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+                header = [column.strip().lower() for column in next(reader, [])]
+                for row in reader:
+                    yield dict(zip(header, row))
+
+    @api.multi
+    def _report_with_catalog(self, risk_model, vals, catalog, categories, risk_infos):
+        """
+        Reports the risk of a row along with its category and risk info not known yet, in a single savepoint: a row
+        which fails leaves no catalog entry behind
+        :param risk_model: recordset: the business risk model
+        :param vals: dict: values of the business risk, but its risk info
+        :param catalog: dict: the category, subcategory, name and description of the risk info
+        :param categories: dict: the ids of the categories by name, updated with the category created
+        :param risk_infos: dict: the ids of the risk infos by category, subcategory and name, updated with the risk
+        info created
+        :return: dict: the outcome of the row, as the ones of `BusinessRisk.create_batch`
+        """
+        try:
+            with self.env.cr.savepoint():
+                category_id = categories.get(catalog['category']) or self.env['risk_management.risk.category'].create(
+                    {'name': catalog['category']}).id
+                risk_info = self.env['risk_management.risk.info'].create({
+                    'risk_category_id': category_id,
+                    'subcategory': catalog['subcategory'] or False,
+                    'name': catalog['name'],
+                    'description': catalog['description'],
+                })
+                outcome = risk_model.create_batch([dict(vals, risk_info_id=risk_info.id)], raise_on_error=True)[0]
+        except (exceptions.UserError, exceptions.ValidationError, exceptions.AccessError, psycopg2.Error) as e:
+            return {'status': 'error', 'id': False, 'message': getattr(e, 'name', None) or str(e)}
+        categories[catalog['category']] = category_id
+        risk_infos[(category_id, catalog['subcategory'], catalog['name'])] = risk_info.id
+        return outcome
+
+    @api.multi
+    def _check_asset(self, asset):
+        """
+        :param asset: string: the reference of the asset of a row, as `model,id`
+        :return: string: the reference, False if empty
+        :raise UserError: if it is not the reference of an existing record
+        """
+        if not asset:
+            return False
+        model, __, res_id = asset.partition(',')
+        model, res_id = model.strip(), res_id.strip()
+        if model not in self.env or not res_id.isdigit() or not self.env[model].browse(int(res_id)).exists():
+            raise exceptions.UserError(_('The asset %s is not a reference to an existing record, as model,id.')
+                                       % asset)
+        return '%s,%s' % (model, res_id)
+
+    @api.multi
+    def _prepare_risk_vals(self, row, categories, risk_infos):
+        """
+        Converts and validates a row of the file, without creating anything
+        :param row: dict: the values of the row by column
+        :param categories: dict: the ids of the categories by name
+        :param risk_infos: dict: the ids of the risk infos by category, subcategory and name
+        :return: tuple: values for `BusinessRisk.create_batch`, and the values of the category and risk info to
+                 create with the risk if they are not known yet, see `_report_with_catalog`, None otherwise
+        """
+        def cell(column):
+            value = row.get(column)
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return str(value).strip() if value is not None else ''
+
+        category, name = cell('category'), cell('risk')
+        if not category or not name:
+            raise exceptions.UserError(_('The category and the risk are required.'))
+        risk_info_id = risk_infos.get((categories.get(category), cell('subcategory'), name))
+
+        vals = {
+            'company_id': self.company_id.id,
+            'risk_type': cell('risk_type').upper()[:1] or 'T',
+            'ref_asset_id': self._check_asset(cell('asset')),
+        }
+        if vals['risk_type'] not in ('T', 'O'):
+            raise exceptions.UserError(_('The risk type must be T (threat) or O (opportunity).'))
+        for criterion in RISK_IMPORT_CRITERIA:
+            value = cell(criterion)
+            if value and value not in ('1', '2', '3', '4', '5'):
+                raise exceptions.UserError(_('The %s must be between 1 and 5.') % criterion)
+            if value:
+                vals[criterion] = value
+        if risk_info_id:
+            vals['risk_info_id'] = risk_info_id
+            return vals, None
+        return vals, {'category': category, 'subcategory': cell('subcategory'), 'name': name,
+                      'description': cell('description') or name}
@@ -0,0 +1,133 @@
+import logging
+import time
+
+from odoo import models, fields, api, exceptions, _
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# share of the exposure of a process passed on to the processes using its output, below 1 for the propagation to
+# converge when the data flow has cycles
+RISK_PROPAGATION_DAMPING = 0.5
+RISK_PROPAGATION_TOLERANCE = 1e-6
+RISK_PROPAGATION_MAX_ITERATIONS = 100
+
+
+def propagate_exposure(seeds, sources, targets, weights, damping=RISK_PROPAGATION_DAMPING,
+                       tolerance=RISK_PROPAGATION_TOLERANCE, max_iterations=RISK_PROPAGATION_MAX_ITERATIONS):
+    """
+    Propagate the exposure of the processes along their data flow: the exposure of a process is its own exposure
+    plus the damped share of the exposure of each of its suppliers, ie x = s + damping * W.x, solved by fixed-point
+    iteration on the sparse matrix W given as the list of its non-zero entries.
+    :param seeds: array: own exposure of each process
+    :param sources: array: index of the supplier of each edge
+    :param targets: array: index of the customer of each edge
+    :param weights: array: share of the exposure of the supplier passed on by each edge, the shares of a supplier
+                    summing up to 1 at most
+    :param damping: float: share of the exposure passed on, lower than 1
+    :param tolerance: float: largest change of an exposure between two iterations at convergence
+    :param max_iterations: int: maximum number of iterations
+    :return: array: the propagated exposure of each process, its own exposure included
+    """
+    exposure = seeds.copy()
+    if not len(seeds):
+        return exposure
+    for __ in range(max_iterations):
+        inflow = numpy.bincount(targets, weights=weights * exposure[sources], minlength=len(seeds))
+        updated = seeds + damping * inflow
+        if numpy.abs(updated - exposure).max() <= tolerance:
+            return updated
+        exposure = updated
+    return exposure
+
+
+class BusinessProcess(models.Model):
+    _inherit = 'risk_management.business_process'
+
+    risk_exposure = fields.Float(string='Own Risk Exposure', readonly=True, digits=(16, 2),
+                                 help='Sum of the levels of the active threats to the process, relative to their '
+                                      'thresholds')
+    propagated_risk_exposure = fields.Float(string='Risk Exposure', readonly=True, digits=(16, 2),
+                                            help='Own risk exposure of the process, plus the exposure flowing in '
+                                                 'from its suppliers through their output data')
+
+    @api.model
+    def _get_propagation_graph(self):
+        """
+        Load the processes, their own exposure and their data flow, with one query each
+        :return: tuple: the list of the ids of the processes, and the arrays of the own exposure of each process and
+                 of the supplier index, customer index and weight of each edge
+        """
+        cr = self.env.cr
+        cr.execute('SELECT id FROM {table} ORDER BY id'.format(table=self._table))
+        ids = [row[0] for row in cr.fetchall()]
+        position = {pid: index for index, pid in enumerate(ids)}
+
+        seeds = numpy.zeros(len(ids))
+        cr.execute("""
+            SELECT asset_res_id, SUM(latest_level_value::float / threshold_value)
+            FROM {risk}
+            WHERE asset_model = %s AND risk_type = 'T' AND review_date > %s AND threshold_value > 0
+            GROUP BY asset_res_id
+        """.format(risk=self.env['risk_management.business_risk']._table),
+                   (self._name, fields.Date.context_today(self)))
+        for pid, exposure in cr.fetchall():
+            if pid in position:
+                seeds[position[pid]] = exposure or 0.0
+
+        # the exposure of a supplier is split between its customers according to the number of data they use
+        cr.execute("""
+            SELECT data.business_process_id, usage.business_process_id,
+                   count(*)::float / sum(count(*)) OVER (PARTITION BY data.business_process_id)
+            FROM {data} data
+            JOIN risk_management_input_ids_user_ids_rel usage ON usage.input_id = data.id
+            WHERE data.business_process_id IS NOT NULL AND data.business_process_id != usage.business_process_id
+            GROUP BY data.business_process_id, usage.business_process_id
+        """.format(data=self.env['risk_management.business_process.input_output']._table))
+        edges = [(position[source], position[target], weight) for source, target, weight in cr.fetchall()
+                 if source in position and target in position]
+        sources = numpy.array([edge[0] for edge in edges], dtype=numpy.int64)
+        targets = numpy.array([edge[1] for edge in edges], dtype=numpy.int64)
+        weights = numpy.array([edge[2] for edge in edges], dtype=numpy.float64)
+        return ids, seeds, sources, targets, weights
+
+    @api.model
+    def _cron_compute_risk_exposure(self):
+        """Scheduled computation of the risk exposure, skipped without numpy rather than failing every day"""
+        if numpy is None:
+            _logger.warning('The python library numpy is not installed, the risk exposure of the processes is not '
+                            'propagated.')
+            return 0
+        return self.compute_risk_exposure()
+
+    @api.model
+    def compute_risk_exposure(self, damping=RISK_PROPAGATION_DAMPING):
+        """
+        Computes the risk exposure of all the processes at once, and stores the ones that changed with a single
+        update; run by a scheduled action, see `_cron_compute_risk_exposure`
+        :param damping: float: share of the exposure of a process passed on to its customers
+        :return: int: the number of processes whose exposure changed
+        """
+        if numpy is None:
+            raise exceptions.UserError(_('The python library numpy is required to propagate the risk exposure.'))
+        start = time.time()
+        ids, seeds, sources, targets, weights = self._get_propagation_graph()
+        exposure = propagate_exposure(seeds, sources, targets, weights, damping=damping)
+        self.env.cr.execute("""
+            UPDATE {table} AS process
+            SET risk_exposure = computed.own, propagated_risk_exposure = computed.propagated
+            FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::float8[]) AS own, unnest(%s::float8[]) AS propagated)
+                 AS computed
+            WHERE process.id = computed.id
+                  AND (process.risk_exposure IS DISTINCT FROM computed.own
+                       OR process.propagated_risk_exposure IS DISTINCT FROM computed.propagated)
+        """.format(table=self._table), (ids, numpy.round(seeds, 2).tolist(), numpy.round(exposure, 2).tolist()))
+        changed = self.env.cr.rowcount
+        self.invalidate_cache(['risk_exposure', 'propagated_risk_exposure'])
+        _logger.info('Risk exposure propagated across %d processes in %.2fs, %d changed', len(ids),
+                     time.time() - start, changed)
+        return changed
@@ -0,0 +1,159 @@
+import logging
+import time
+
+from odoo import models, api, exceptions, _
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# yearly probability of occurrence of a risk, by level of the occurrence scale, see `_get_occurrence`
+RISK_SIMULATION_PROBABILITIES = (0.01, 0.1, 0.3, 0.6, 0.9)
+RISK_SIMULATION_DEFAULT_ITERATIONS = 10000
+RISK_SIMULATION_DEFAULT_PERCENTILES = (50, 90, 95, 99)
+# number of iterations sampled at once, bounds the memory used to iterations x risks floats per batch
+RISK_SIMULATION_BATCH_SIZE = 64
+RISK_SIMULATION_GROUPBY = ('company_id', 'asset', 'risk_category_id')
+
+
+def simulate_exposure(occurrence, severity, detection, boundaries, iterations, seed=None,
+                      batch_size=RISK_SIMULATION_BATCH_SIZE):
+    """
+    Sample the exposure of groups of risks. In each iteration a risk occurs with the probability of its occurrence
+    level; when it does, its impact is its severity level, shifted one level down or up a quarter of the times each,
+    and its exposure is its impact times its detection factor, as in `_compute_value_threat`.
+    :param occurrence: array: occurrence level (1 to 5) of each risk
+    :param severity: array: severity level (1 to 5) of each risk
+    :param detection: array: detection factor of each risk, negative for the opportunities
+    :param boundaries: array: index of the first risk of each group, the risks being sorted by group
+    :param iterations: int: number of iterations
+    :param seed: int: seed of the random generator, for reproducible simulations
+    :param batch_size: int: number of iterations sampled at once
+    :return: array: the exposure of each group (columns) in each iteration (rows)
+    """
+    random = numpy.random.RandomState(seed)
+    probabilities = numpy.asarray(RISK_SIMULATION_PROBABILITIES)[occurrence - 1]
+    exposures = numpy.empty((iterations, len(boundaries)), dtype=numpy.float32)
+    for start in range(0, iterations, batch_size):
+        size = min(batch_size, iterations - start)
+        draws = random.random_sample((size, len(probabilities)))
+        occurred = draws < probabilities
+        # given the occurrence, draws / probabilities is uniform on [0, 1): its quarter gives the shift of the impact
+        quarter = numpy.floor(draws / probabilities * 4)
+        impact = numpy.clip(severity + (quarter == 3) - (quarter == 0), 1, 5)
+        exposure = numpy.where(occurred, impact * detection, 0)
+        exposures[start:start + size] = numpy.add.reduceat(exposure, boundaries, axis=1)
+    return exposures
+
+
+class BusinessRisk(models.Model):
+    _inherit = 'risk_management.business_risk'
+
+    @api.model
+    def _get_simulation_criteria(self, domain, groupby):
+        """
+        Load the criteria of the latest evaluation of the active risks, with a single query
+        :return: tuple: the list of the groups, and the arrays of the group index, occurrence, severity and detection
+                 factor of each risk
+        """
+        self.check_access_rights('read')
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+        group_columns = {
+            'company_id': '{table}.company_id',
+            'asset': "{table}.asset_model || ',' || {table}.asset_res_id",
+            'risk_category_id': 'info.risk_category_id',
+        }
+        self.env.cr.execute("""
+            SELECT {group}, {table}.risk_type,
+                   COALESCE(NULLIF(evaluation.occurrence, '')::int, 1),
+                   COALESCE(NULLIF(evaluation.severity, '')::int, 1),
+                   COALESCE(NULLIF(evaluation.detectability, '')::int, 1)
+            FROM {from_clause}
+            JOIN {evaluation} evaluation ON evaluation.id = {table}.latest_evaluation_id
+            LEFT JOIN {info} info ON info.id = {table}.risk_info_id
+            WHERE {where}
+        """.format(group=group_columns[groupby].format(table=self._table), table=self._table,
+                   from_clause=from_clause, where=where_clause or 'TRUE',
+                   evaluation=self.env['risk_management.business_risk.evaluation']._table,
+                   info=self.env['risk_management.risk.info']._table), where_params)
+        rows = self.env.cr.fetchall()
+
+        groups, group_index = [], {}
+        indexes = numpy.empty(len(rows), dtype=numpy.int64)
+        criteria = numpy.empty((len(rows), 3), dtype=numpy.int64)
+        for position, (group, risk_type, occurrence, severity, detectability) in enumerate(rows):
+            if group not in group_index:
+                group_index[group] = len(groups)
+                groups.append(group)
+            indexes[position] = group_index[group]
+            # the detectability of an opportunity is inverted, and its exposure is a gain
+            if risk_type == 'O':
+                detectability = -(6 - detectability)
+            criteria[position] = occurrence, severity, detectability
+        return groups, indexes, criteria[:, 0], criteria[:, 1], criteria[:, 2]
+
+    @api.model
+    def simulate_exposure(self, domain=None, groupby='company_id', iterations=RISK_SIMULATION_DEFAULT_ITERATIONS,
+                          percentiles=RISK_SIMULATION_DEFAULT_PERCENTILES, seed=None):
+        """
+        Monte Carlo simulation of the exposure of the portfolio of active, evaluated risks. The criteria of all the
+        risks are loaded in arrays, and the iterations are sampled by vectorized batches in the server process: it
+        must not be forked while it holds a cursor. The exposure of the threats counts positively and the one of the
+        opportunities negatively.
+        :param domain: list: domain of the risks simulated
+        :param groupby: string: company_id, asset or risk_category_id, the dimension the exposure is broken down by
+        :param iterations: int: number of iterations
+        :param percentiles: list: the percentiles of the exposure distributions returned
+        :param seed: int: seed of the random generator, for reproducible simulations
+        :return: dict: {'risk_count': n, 'iterations': n, 'duration': seconds,
+                        'portfolio': {'mean': float, 'percentiles': {percentile: float}},
+                        'groups': [{'group': value, 'risk_count': n, 'mean': float, 'percentiles': {...}}, ...]}
+        """
+        if numpy is None:
+            raise exceptions.UserError(_('The python library numpy is required to simulate the risk exposure.'))
+        if groupby not in RISK_SIMULATION_GROUPBY:
+            raise exceptions.UserError(_('The exposure can only be broken down by %s.')
+                                       % ', '.join(RISK_SIMULATION_GROUPBY))
+        start = time.time()
+        groups, indexes, occurrence, severity, detection = self._get_simulation_criteria(domain or [], groupby)
+        result = {'risk_count': len(indexes), 'iterations': iterations, 'groups': [],
+                  'portfolio': {'mean': 0.0, 'percentiles': dict.fromkeys(percentiles, 0.0)}}
+        if not groups or iterations < 1:
+            result['duration'] = time.time() - start
+            return result
+
+        order = numpy.argsort(indexes, kind='mergesort')
+        indexes, occurrence, severity, detection = indexes[order], occurrence[order], severity[order], detection[order]
+        boundaries = numpy.searchsorted(indexes, numpy.arange(len(groups)))
+        exposures = simulate_exposure(occurrence, severity, detection, boundaries, iterations, seed=seed)
+
+        means = exposures.mean(axis=0)
+        values = numpy.percentile(exposures, percentiles, axis=0)
+        counts = numpy.bincount(indexes, minlength=len(groups))
+        if groupby != 'asset':
+            comodel = {'company_id': 'res.company', 'risk_category_id': 'risk_management.risk.category'}[groupby]
+            names = dict(self.env[comodel].browse([group for group in groups if group]).name_get())
+            groups = [(group, names.get(group)) if group else False for group in groups]
+        for position, group in enumerate(groups):
+            result['groups'].append({
+                'group': group,
+                'risk_count': int(counts[position]),
+                'mean': float(means[position]),
+                'percentiles': {percentile: float(values[rank][position])
+                                for rank, percentile in enumerate(percentiles)},
+            })
+        totals = exposures.sum(axis=1, dtype=numpy.float64)
+        values = numpy.percentile(totals, percentiles)
+        result['portfolio'] = {
+            'mean': float(totals.mean()),
+            'percentiles': {percentile: float(values[rank]) for rank, percentile in enumerate(percentiles)},
+        }
+        result['duration'] = time.time() - start
+        _logger.info('Risk exposure simulated: %d risks x %d iterations in %.2fs',
+                     len(indexes), iterations, result['duration'])
+        return result
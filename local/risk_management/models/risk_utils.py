@@ -1,37 +1,164 @@
-from odoo import _
+import datetime
+from contextlib import contextmanager
 
+from odoo import fields
 
-def add_risk_activity(env, risk, note, deadline, act_to_close=None, summary=None):
+# name of the cursor attribute holding the priority rankings postponed by `deferred_priorities`
+_PENDING_PRIORITIES = '_risk_pending_priorities'
+
+
+# steps of the risk management process, with the activity scheduled for each of them, and the steps whose pending
+# activities it supersedes (None for all the pending activities of the risk)
+RISK_STEPS = {
+    'confirm': {
+        'summary': "Next step in Risk Management: Confirm",
+        'note': "Check and confirm the existence of the risk.",
+        'supersedes': None,
+    },
+    'evaluate': {
+        'summary': "Next step in Risk Management: Evaluation",
+        'note': "Assess the probability of risk occurring and its possible impact, "
+                "as well as the company's ability to detect it should it occur.",
+        'supersedes': ('confirm',),
+    },
+    'validate': {
+        'summary': "Next step in Risk Management: Validate Evaluation",
+        'note': "Validate the risk assessment.",
+        'supersedes': (),
+    },
+    'treat': {
+        'summary': "Next step in Risk Management: Treat risk",
+        'note': "Select and implement measures to modify risk.",
+        'supersedes': None,
+    },
+}
+RISK_ACT_DELAY = 15
+
+
+def close_risk_steps(risks, steps=None):
     """
-    Create the next activity to be done in the risk management process
-    :param env: odoo environment
-    :param risk: record: an object representing the risk to which the activity is being added
-    :param note: string: Activity note
-    :param deadline: string: the deadline of the activity
-    :param act_to_close: record: an object representing an activity to close before adding the new one
-    :param summary: string: Activity summary
+    Mark as done the pending activities of the risks, with a single search
+    :param risks: recordset: the risks whose activities are closed
+    :param steps: iterable: keys of the steps whose activities are closed, None for all the activities
     :return: None
     """
-    activity = env['mail.activity']
-    res_model_id = env['ir.model']._get_id('risk_management.business_risk')
-
-    # close any preceding activities on business risk
-    if act_to_close:
-        act_to_close.action_done()
-    else:
-        activity.search([
-            ('res_id', '=', risk.id),
-            ('res_model_id', '=', res_model_id),
-        ]).action_done()
-
-    # Add a new activity
-    risk.write({
-        'activity_ids': [(0, False, {
-            'res_id': risk.id,
-            'res_model_id': res_model_id,
-            'activity_type_id': env.ref('risk_management.risk_activity_todo').id,
-            'summary': summary,
-            'note': '<p>%s</p>' % note,
-            'date_deadline': deadline
-        })]
-    })
\ No newline at end of file
+    if not risks or steps is not None and not steps:
+        return
+    domain = [('res_model_id', '=', risks.env['ir.model']._get_id(risks._name)), ('res_id', 'in', risks.ids)]
+    if steps is not None:
+        domain.append(('risk_step', 'in', list(steps)))
+    risks.env['mail.activity'].search(domain).action_done()
+
+
+def set_risk_step(risks, step, deadline=None):
+    """
+    Move the risks to the next step of the risk management process: close the activities the step supersedes and
+    schedule the activity of the step, for all the risks at once
+    :param risks: recordset: the risks moving to the step
+    :param step: string: key of the step in RISK_STEPS
+    :param deadline: string: the deadline of the activities, RISK_ACT_DELAY days from today by default
+    :return: recordset: the activities created
+    """
+    activity = risks.env['mail.activity']
+    if not risks:
+        return activity
+    close_risk_steps(risks, RISK_STEPS[step]['supersedes'])
+
+    if not deadline:
+        deadline = fields.Date.to_string(datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY))
+    values = {
+        'res_model_id': risks.env['ir.model']._get_id(risks._name),
+        'activity_type_id': risks.env.ref('risk_management.risk_activity_todo').id,
+        'risk_step': step,
+        'summary': RISK_STEPS[step]['summary'],
+        'note': '<p>%s</p>' % RISK_STEPS[step]['note'],
+        'date_deadline': deadline,
+    }
+    for risk_id in risks.ids:
+        activity |= activity.create(dict(values, res_id=risk_id))
+    return activity
+
+
+def grouped_count(model, domain, groupby):
+    """
+    Count the records of a model by value of one of its fields, with a single grouped query
+    :param model: recordset: an empty recordset of the model whose records are counted
+    :param domain: list: the domain of the records to count
+    :param groupby: string: name of the many2one (or integer) field to group the records by
+    :return: dict: the number of records by id (or value) of the group
+    """
+    counts = {}
+    for group in model.read_group(domain, [groupby], [groupby], lazy=False):
+        value = group[groupby]
+        counts[value[0] if isinstance(value, tuple) else value] = group['__count']
+    return counts
+
+
+def attachment_domain(records):
+    """The domain of the attachments of the records"""
+    return [('res_model', '=', records._name), ('res_id', 'in', [rid for rid in records.ids if isinstance(rid, int)])]
+
+
+def attachment_index(records):
+    """
+    Index the attachments of the records, with a single search
+    :param records: recordset: the records whose attachments are indexed
+    :return: dict: the attachments of each record, keyed by (res_model, res_id); the records without attachment have
+             no entry
+    """
+    attachment_ids = {}
+    if records.ids:
+        for attachment in records.env['ir.attachment'].search_read(attachment_domain(records), ['res_model', 'res_id']):
+            attachment_ids.setdefault((attachment['res_model'], attachment['res_id']), []).append(attachment['id'])
+    return {key: records.env['ir.attachment'].browse(ids) for key, ids in attachment_ids.items()}
+
+
+def downsample(points, max_points):
+    """
+    Reduce a series to at most `max_points` points evenly spread over it, keeping its first and last points
+    :param points: list: the points of the series
+    :param max_points: int: the maximum number of points to keep, no limit if falsy
+    :return: list: the points kept, in their original order
+    """
+    if not max_points or len(points) <= max_points:
+        return points
+    if max_points == 1:
+        return points[:1]
+    step = (len(points) - 1) / (max_points - 1)
+    return [points[int(round(index * step))] for index in range(max_points)]
+
+
+@contextmanager
+def deferred_priorities(env):
+    """
+    Postpone the ranking of risk priorities until the end of the block, where each partition is ranked once
+    whatever the number of risks written inside the block. Nested blocks are merged into the outermost one.
+    :param env: odoo environment
+    """
+    cr = env.cr
+    if getattr(cr, _PENDING_PRIORITIES, None) is not None:
+        yield
+        return
+    pending = {}
+    setattr(cr, _PENDING_PRIORITIES, pending)
+    try:
+        yield
+    finally:
+        setattr(cr, _PENDING_PRIORITIES, None)
+    for model, company_ids in pending.items():
+        env[model].compute_priorities(None if None in company_ids else list(company_ids))
+
+
+def defer_priorities(env, model, company_ids=None):
+    """
+    Record that the priorities of `model` must be ranked again, if the ranking is being deferred
+    :param env: odoo environment
+    :param model: string: name of the risk model
+    :param company_ids: list: ids of the companies whose risks must be ranked again, None for all the companies
+    :return: True if the ranking has been deferred, False if it must be done right away
+    """
+    pending = getattr(env.cr, _PENDING_PRIORITIES, None)
+    if pending is None:
+        return False
+    pending.setdefault(model, set()).update([None] if company_ids is None else company_ids)
+    return True
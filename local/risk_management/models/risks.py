@@ -1,13 +1,33 @@
 import datetime
+import hashlib
+import re
+import threading
 import uuid
 import logging
 
-from odoo import models, fields, api, exceptions, _
-from .risk_utils import add_risk_activity
+import psycopg2
+
+from odoo import models, fields, api, exceptions, tools, _
+from odoo.tools import html2plaintext, split_every
+from odoo.tools.sql import create_index, create_unique_index, index_exists
+from .risk_heatmap import RISK_HEATMAP_EVALUATION_FIELDS, RISK_HEATMAP_RISK_FIELDS
+from .risk_utils import close_risk_steps, defer_priorities, deferred_priorities, downsample, grouped_count, \
+    set_risk_step
 
 RISK_REPORT_DEFAULT_MAX_AGE = 90
-RISK_ACT_DELAY = 15
 RISK_EVALUATION_DEFAULT_MAX_AGE = 30
+RISK_ROLLOVER_CHUNK_SIZE = 1000
+RISK_ROLLOVER_PARAM = 'risk_management.date_rollover_last_run'
+RISK_SEARCH_TABLE = 'risk_management_risk_info_search'
+RISK_SEARCH_CHUNK_SIZE = 1000
+# fields of the risk infos indexed for `RiskInfo._name_search`
+RISK_SEARCH_FIELDS = {'name', 'subcategory', 'description', 'control', 'action'}
+# text search configurations of PostgreSQL, by language code
+RISK_SEARCH_CONFIGS = {
+    'da': 'danish', 'de': 'german', 'en': 'english', 'es': 'spanish', 'fi': 'finnish', 'fr': 'french',
+    'hu': 'hungarian', 'it': 'italian', 'nl': 'dutch', 'no': 'norwegian', 'pt': 'portuguese', 'ro': 'romanian',
+    'ru': 'russian', 'sv': 'swedish', 'tr': 'turkish',
+}
 
 _logger = logging.getLogger(__name__)
 
@@ -31,12 +51,14 @@ class RiskCategory(models.Model):
     name = fields.Char(translate=True, required=True)
     risk_info_ids = fields.One2many(comodel_name='risk_management.risk.info', inverse_name='risk_category_id',
                                     string='Risks')
-    risk_count = fields.Integer(compute='_compute_risk_count', string='Risks')
+    risk_count = fields.Integer(compute='_compute_risk_count', string='Risks', store=True)
 
-    @api.multi
+    @api.depends('risk_info_ids')
     def _compute_risk_count(self):
+        counts = grouped_count(self.env['risk_management.risk.info'], [('risk_category_id', 'in', self.ids)],
+                               'risk_category_id')
         for category in self:
-            category.risk_count = len(category.risk_info_ids)
+            category.risk_count = counts.get(category.id, 0)
 
 
 class RiskInfo(models.Model):
@@ -67,7 +89,8 @@ class RiskInfo(models.Model):
     business_risk_ids = fields.One2many(comodel_name='risk_management.business_risk', inverse_name='risk_info_id',
                                         string='Occurrence(Business)')
     occurrences = fields.Integer(
-        string='Occurrences', compute="_compute_occurrences")
+        string='Occurrences', compute="_compute_occurrences", search='_search_occurrences',
+        help='Number of the active business risks of this kind the current user can read')
 
     @api.depends('name')
     def _compute_short_name(self):
@@ -77,22 +100,189 @@ class RiskInfo(models.Model):
             else:
                 rec.short_name = rec.name
 
+    @api.model_cr
+    def init(self):
+        cr = self._cr
+        # names are matched by similarity if pg_trgm is available, the database user may not be allowed to create it
+        try:
+            with cr.savepoint():
+                cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except psycopg2.Error:
+            _logger.warning("The extension pg_trgm could not be created, risks will not be searched by similarity")
+        self.clear_caches()
+
+        # one row per risk and installed language, see `_index_for_search`
+        cr.execute("""
+            CREATE TABLE IF NOT EXISTS {search} (
+                lang varchar NOT NULL,
+                risk_info_id integer NOT NULL REFERENCES {table} (id) ON DELETE CASCADE,
+                name varchar,
+                document tsvector,
+                PRIMARY KEY (lang, risk_info_id)
+            )
+        """.format(search=RISK_SEARCH_TABLE, table=self._table))
+        if not index_exists(cr, 'risk_management_risk_info_search_document_index'):
+            cr.execute("CREATE INDEX risk_management_risk_info_search_document_index ON {search} USING gin (document)"
+                       .format(search=RISK_SEARCH_TABLE))
+        if self._search_trigram_enabled() and not index_exists(cr, 'risk_management_risk_info_search_name_index'):
+            cr.execute("CREATE INDEX risk_management_risk_info_search_name_index ON {search} "
+                       "USING gin (name gin_trgm_ops)".format(search=RISK_SEARCH_TABLE))
+        # index the catalog of a database upgraded from a version without the index
+        cr.execute("SELECT 1 FROM {search} LIMIT 1".format(search=RISK_SEARCH_TABLE))
+        if not cr.fetchone():
+            self.refresh_search_index()
+
+    @api.model
+    def create(self, vals):
+        risk = super(RiskInfo, self).create(vals)
+        risk._index_for_search()
+        return risk
+
+    @api.multi
+    def write(self, vals):
+        res = super(RiskInfo, self).write(vals)
+        if RISK_SEARCH_FIELDS.intersection(vals):
+            self._index_for_search()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _search_trigram_enabled(self):
+        self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _search_config(self, lang):
+        """The text search configuration of the language, e.g. `french` for fr_FR"""
+        return RISK_SEARCH_CONFIGS.get((lang or 'en_US').split('_')[0], 'simple')
+
+    @api.multi
+    def _index_for_search(self):
+        """(Re)indexes the risks in every installed language: their name for trigram matching, and a text search
+        vector of their name, subcategory, description, control and action, in this order of weight"""
+        cr = self.env.cr
+        if not self.ids:
+            return
+        cr.execute("DELETE FROM {search} WHERE risk_info_id IN %s".format(search=RISK_SEARCH_TABLE), (tuple(self.ids),))
+        for lang, _lang_name in self.env['res.lang'].get_installed():
+            for chunk_ids in split_every(RISK_SEARCH_CHUNK_SIZE, self.ids):
+                risks = self.sudo().with_context(lang=lang).browse(chunk_ids)
+                cr.execute("""
+                    INSERT INTO {search} (lang, risk_info_id, name, document)
+                    SELECT %s, risk.id, risk.name,
+                           setweight(to_tsvector(%s::regconfig, risk.name), 'A') ||
+                           setweight(to_tsvector(%s::regconfig, risk.subcategory), 'B') ||
+                           setweight(to_tsvector(%s::regconfig, risk.body), 'C')
+                    FROM unnest(%s::integer[], %s::text[], %s::text[], %s::text[])
+                         AS risk(id, name, subcategory, body)
+                """.format(search=RISK_SEARCH_TABLE), [lang] + [self._search_config(lang)] * 3 + [
+                    risks.ids,
+                    [risk.name or '' for risk in risks],
+                    [risk.subcategory or '' for risk in risks],
+                    [' '.join(html2plaintext(html) for html in (risk.description, risk.control, risk.action) if html)
+                     for risk in risks],
+                ])
+
+    @api.model
+    def refresh_search_index(self):
+        """Rebuilds the search index of the whole catalog, e.g. after translations were loaded or a language was
+        installed"""
+        self.env.cr.execute("DELETE FROM {search}".format(search=RISK_SEARCH_TABLE))
+        self.sudo().search([])._index_for_search()
+
+    @api.model
+    def _search_indexed(self, name, args=None, limit=100, access_rights_uid=None):
+        """
+        Searches the risks matching `name` through the search index of the current language: by prefix of the words of
+        their text search vector, by similarity or inclusion of their name; ranked by relevance then similarity
+        :param name: string: the text searched
+        :param args: list: domain restricting the risks
+        :param limit: int: maximum number of risks returned
+        :param access_rights_uid: int: id of the user whose access rights are checked
+        :return: list: ids of the risks, None if some risks are not indexed in the current language
+        """
+        cr = self.env.cr
+        lang = self.env.lang or 'en_US'
+        cr.execute("SELECT (SELECT count(*) FROM {search} WHERE lang = %s) < (SELECT count(*) FROM {table})".format(
+            search=RISK_SEARCH_TABLE, table=self._table), (lang,))
+        if cr.fetchone()[0]:
+            return None
+
+        model = self.sudo(access_rights_uid or self._uid)
+        model.check_access_rights('read')
+        query = model._where_calc(args or [])
+        model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+
+        config = self._search_config(lang)
+        tsquery = ' & '.join('%s:*' % word for word in re.findall(r'\w+', name))
+        conditions, condition_params = ['search.name ILIKE %s'], ['%' + name + '%']
+        order, order_params = [], []
+        if tsquery:
+            conditions.append('search.document @@ to_tsquery(%s::regconfig, %s)')
+            condition_params += [config, tsquery]
+            order.append('ts_rank(search.document, to_tsquery(%s::regconfig, %s)) DESC')
+            order_params += [config, tsquery]
+        if self._search_trigram_enabled():
+            conditions.append('search.name %% %s')
+            condition_params.append(name)
+            order.append('similarity(search.name, %s) DESC')
+            order_params.append(name)
+        order.append('{table}.id'.format(table=self._table))
+
+        cr.execute("""
+            SELECT {table}.id
+            FROM {from_clause}, {search} search
+            WHERE search.risk_info_id = {table}.id AND search.lang = %s AND {where} AND ({conditions})
+            ORDER BY {order}
+            {limit}
+        """.format(table=self._table, from_clause=from_clause, search=RISK_SEARCH_TABLE,
+                   where=where_clause or 'TRUE', conditions=' OR '.join(conditions), order=', '.join(order),
+                   limit='LIMIT %d' % limit if limit else ''),
+            [lang] + where_params + condition_params + order_params)
+        return [row[0] for row in cr.fetchall()]
+
     @api.model
     def _name_search(self, name='', args=None, operator='ilike', limit=100, name_get_uid=None):
         """Searches risk by name or description"""
         args = [] if args is None else args.copy()
+        if name and operator == 'ilike':
+            ids = self._search_indexed(name, args, limit=limit, access_rights_uid=name_get_uid)
+            if ids is not None:
+                return self.browse(ids).sudo(name_get_uid or self._uid).name_get()
         if not (name == '' and operator == 'ilike'):
             args += ['|', ('name', operator, name),
                      ('description', operator, name)]
         return super(RiskInfo, self)._name_search(name='', args=args, operator='ilike', limit=limit,
                                                   name_get_uid=name_get_uid)
 
-    @api.multi
+    @api.depends('business_risk_ids', 'business_risk_ids.review_date')
     def _compute_occurrences(self):
+        """Number of active business risks of each risk info, counted under the record rules of the current user"""
+        counts = grouped_count(self.env['risk_management.business_risk'], [('risk_info_id', 'in', self.ids)],
+                               'risk_info_id')
         for risk in self:
-            br = self.env['risk_management.business_risk'].search(
-                [('risk_info_id', '=', risk.id)])
-            risk.occurrences = len(br)
+            risk.occurrences = counts.get(risk.id, 0)
+
+    def _search_occurrences(self, operator, value):
+        """Search on the number of occurrences, from a single grouped count of the risks the user can read"""
+        comparators = {
+            '=': lambda count: count == value,
+            '!=': lambda count: count != value,
+            '<': lambda count: count < value,
+            '<=': lambda count: count <= value,
+            '>': lambda count: count > value,
+            '>=': lambda count: count >= value,
+        }
+        if operator not in comparators:
+            raise exceptions.UserError(_('Unsupported operator %s on the occurrences.') % operator)
+        compare = comparators[operator]
+        counts = grouped_count(self.env['risk_management.business_risk'], [('risk_info_id', '!=', False)],
+                               'risk_info_id')
+        # the risk infos without any occurrence are not counted, they match if 0 does
+        if compare(0):
+            return [('id', 'not in', [info_id for info_id, count in counts.items() if not compare(count)])]
+        return [('id', 'in', [info_id for info_id, count in counts.items() if compare(count)])]
 
 
 class RiskCriteriaMixin(models.AbstractModel):
@@ -129,36 +319,38 @@ class RiskCriteriaMixin(models.AbstractModel):
     value_threat = fields.Integer(compute='_compute_value_threat')
     value_opportunity = fields.Integer(compute='_compute_value_opportunity')
 
+    @api.model
+    def _get_criteria_value(self, risk_type, detectability, occurrence, severity):
+        """
+        Returns the risk factor of the criteria scores: their product, where a missing score counts for 1. If the risk
+        is an opportunity, the detectability score is inverted first; ie a `continuous` capacity to detect an
+        opportunity corresponds to 5. This is the contrary of the threat case where the higher the ability to detect
+        the threat occurrence the less the risk factor
+        :param risk_type: string: 'T' for a threat, 'O' for an opportunity
+        :return: int: the risk factor, False if no criterion is scored
+        """
+        if not (detectability or occurrence or severity):
+            return False
+        if risk_type == 'O':
+            detectability = 6 - int(detectability) if detectability else 1
+        return (int(detectability or 0) or 1) * (int(occurrence or 0) or 1) * (int(severity or 0) or 1)
+
     @api.depends('detectability', 'occurrence', 'severity')
     def _compute_value_threat(self):
         """
        if the risk is a threat, return the product of the criteria scores,
        """
         for rec in self:
-            if rec.detectability or rec.occurrence or rec.severity:
-                rec.value_threat = (int(rec.detectability) or 1) * \
-                    (int(rec.occurrence) or 1) * (int(rec.severity) or 1)
-            else:
-                rec.value_threat = False
+            rec.value_threat = self._get_criteria_value('T', rec.detectability, rec.occurrence, rec.severity)
 
     @api.depends('detectability', 'occurrence', 'severity')
     def _compute_value_opportunity(self):
         """
         if the risk is an opportunity, invert the value of self.detectability before computing the product of
-        the scores; ie a `continuous` capacity to detect an opportunity corresponds to 5. This is the contrary of the
-        threat case where the higher the ability to detect the threat occurrence the less the risk factor
+        the scores, see `_get_criteria_value`
         """
-        inv_detectability_score = [str(x) for x in range(1, 6)]
-        opp_detectability_dict = dict((x, y) for x, y in zip(
-            inv_detectability_score, range(5, 0, -1)))
         for rec in self:
-            if rec.detectability or rec.occurrence or rec.severity:
-                detectability_opp = opp_detectability_dict.get(
-                    rec.detectability, 1)
-                rec.value_opportunity = detectability_opp * \
-                    (int(rec.occurrence) or 1) * (int(rec.severity) or 1)
-            else:
-                rec.value_opportunity = False
+            rec.value_opportunity = self._get_criteria_value('O', rec.detectability, rec.occurrence, rec.severity)
 
 
 class RiskIdentificationMixin(models.AbstractModel):
@@ -234,7 +426,7 @@ class RiskIdentificationMixin(models.AbstractModel):
         default=125, readonly=True, string='Max. Level')
     last_evaluate_date = fields.Date(
         compute='_compute_latest_eval', string='Last Evaluation Date', store=True)
-    review_date = fields.Date(default=_compute_default_review_date,
+    review_date = fields.Date(default=_compute_default_review_date, index=True,
                               string="Review Date", track_visibility="onchange")
     user_id = fields.Many2one(comodel_name='res.users', ondelete='set null', string='Assigned to', index=True,
                               track_visibility="onchange")
@@ -244,7 +436,7 @@ class RiskIdentificationMixin(models.AbstractModel):
                               compute='_compute_status', string='Status', search='_search_status',
                               track_visibility="onchange")
     state = fields.Selection(selection=_get_stage_select,
-                             compute='_compute_stage', string='Stage', compute_sudo=True)
+                             compute='_compute_stage', string='Stage', compute_sudo=True, store=True)
     stage = fields.Char(compute='_compute_stage_str', string='Stage', store=True, copy=False,
                         track_visibility="onchange", translate=True,  compute_sudo=True)
     priority = fields.Integer(
@@ -261,22 +453,124 @@ class RiskIdentificationMixin(models.AbstractModel):
         if self.treatment_task_id:
             self.treatment_task_id.user_id = self.user_id
 
-    @api.depends('latest_level_value', 'threshold_value')
+    @api.depends('latest_level_value', 'threshold_value', 'company_id', 'asset')
     def _compute_priority(self):
-        self.compute_priorities()
+        self.compute_priorities(self.mapped('company_id').ids)
+        ids = tuple(rid for rid in self._ids if isinstance(rid, int))
+        priorities = {}
+        if ids:
+            self.env.cr.execute('SELECT id, priority FROM %s WHERE id IN %%s' % self._table, (ids,))
+            priorities = dict(self.env.cr.fetchall())
+        for rec in self:
+            rec.priority = priorities.get(rec.id) or 0
 
     @api.model
-    def compute_priorities(self):
-        """Computes priorities for all the risks in the database; called after any update that
-        modifies the risk level or the risk threshold
+    def compute_priorities(self, company_ids=None):
+        """Computes the priorities of the risks of the given companies, or of all the companies; called after any
+        update that modifies the risk level or the risk threshold.
+        Priorities are ranked within each company, or within each asset of the company if the company's priority
+        scope is `asset`, by decreasing margin between the risk level and the risk threshold, the oldest first on a
+        tie. The ranking is a single statement that only rewrites the rows whose rank changed. Inside a
+        `deferred_priorities` block the ranking is postponed to the end of the block.
+        :param company_ids: list of ids of the companies whose risks are ranked, None for all the companies
         """
-        risks = self.env[self._name].with_context(
-            active_test=False).search([]).sorted('create_date')
-        sorted_risks = risks.sorted(
-            lambda rec: rec.latest_level_value - rec.threshold_value, reverse=True).ids
+        if company_ids is not None and not company_ids:
+            return
+        if defer_priorities(self.env, self._name, company_ids):
+            return
+        where, params = '', []
+        if company_ids is not None:
+            where, params = 'WHERE risk.company_id IN %s', [tuple(company_ids)]
+        self.env.cr.execute("""
+            UPDATE {table} AS risk SET priority = ranked.rank
+            FROM (
+                SELECT risk.id, row_number() OVER (
+                    PARTITION BY risk.company_id,
+                                 CASE WHEN company.risk_priority_scope = 'asset' THEN risk.asset END
+                    ORDER BY COALESCE(risk.latest_level_value, 0) - COALESCE(risk.threshold_value, 0) DESC,
+                             risk.create_date, risk.id
+                ) AS rank
+                FROM {table} AS risk
+                JOIN res_company AS company ON company.id = risk.company_id
+                {where}
+            ) AS ranked
+            WHERE risk.id = ranked.id AND risk.priority IS DISTINCT FROM ranked.rank
+            RETURNING risk.id
+        """.format(table=self._table, where=where), params)
+        changed_ids = [row[0] for row in self.env.cr.fetchall()]
+        if changed_ids:
+            self.invalidate_cache(['priority'], changed_ids)
 
-        for risk in risks:
-            risk.priority = list(sorted_risks).index(risk.id) + 1
+    @api.multi
+    def preview_thresholds(self, criteria):
+        """
+        What-if analysis of new threshold criteria for the risks: computes, without writing anything, their new
+        threshold values and statuses, and the priorities of all the risks of their companies once ranked again
+        :param criteria: dict: the proposed `detectability`, `occurrence` and/or `severity` levels, the criteria left
+                         out keep their current level
+        :return: list: a dict per risk whose threshold, status or priority would change: {'id': risk id,
+                 'threshold_value': (old, new), 'status': (old, new), 'priority': (old, new)}
+        """
+        if not self:
+            return []
+        thresholds = [
+            self._get_criteria_value(rec.risk_type, criteria.get('detectability', rec.detectability),
+                                     criteria.get('occurrence', rec.occurrence), criteria.get('severity', rec.severity))
+            or 0 for rec in self
+        ]
+        statuses = []
+        for alias in ('risk', 'ranked'):
+            conditions = [self._get_status_condition(status, alias) for status in ('A', 'N')]
+            statuses.append(("CASE WHEN {0} THEN 'A' WHEN {1} THEN 'N' ELSE 'U' END".format(
+                conditions[0][0], conditions[1][0]), conditions[0][1] + conditions[1][1]))
+        # the ranking of `compute_priorities`, over the proposed thresholds
+        self.env.cr.execute("""
+            WITH proposed AS (
+                SELECT unnest(%s::int[]) AS id, unnest(%s::int[]) AS threshold_value
+            ), ranked AS (
+                SELECT risk.id, risk.risk_type, risk.review_date, risk.latest_level_value,
+                       COALESCE(proposed.threshold_value, risk.threshold_value) AS threshold_value,
+                       row_number() OVER (
+                           PARTITION BY risk.company_id,
+                                        CASE WHEN company.risk_priority_scope = 'asset' THEN risk.asset END
+                           ORDER BY COALESCE(risk.latest_level_value, 0)
+                                    - COALESCE(proposed.threshold_value, risk.threshold_value, 0) DESC,
+                                    risk.create_date, risk.id
+                       ) AS priority
+                FROM {table} AS risk
+                JOIN res_company AS company ON company.id = risk.company_id
+                LEFT JOIN proposed ON proposed.id = risk.id
+                WHERE risk.company_id IN %s
+            )
+            SELECT risk.id, risk.threshold_value, ranked.threshold_value, {old_status}, {new_status},
+                   risk.priority, ranked.priority
+            FROM ranked
+            JOIN {table} AS risk ON risk.id = ranked.id
+            WHERE COALESCE(risk.threshold_value, 0) != ranked.threshold_value
+               OR risk.priority IS DISTINCT FROM ranked.priority
+            ORDER BY ranked.priority, risk.id
+        """.format(table=self._table, old_status=statuses[0][0], new_status=statuses[1][0]),
+            [self.ids, thresholds, tuple(self.mapped('company_id').ids)] + statuses[0][1] + statuses[1][1])
+        return [{
+            'id': row[0],
+            'threshold_value': (row[1] or 0, row[2] or 0),
+            'status': (row[3], row[4]),
+            'priority': (row[5], row[6]),
+        } for row in self.env.cr.fetchall()]
+
+    @api.multi
+    def apply_thresholds(self, criteria):
+        """
+        Applies new threshold criteria to the risks in bulk: a single write of the criteria, whose cascade is
+        set-based (see `_propagate_thresholds`), and a single ranking of the priorities
+        :param criteria: dict: the `detectability`, `occurrence` and/or `severity` levels, see `preview_thresholds`
+        :return: list: the changes, as returned by `preview_thresholds`
+        """
+        diff = self.preview_thresholds(criteria)
+        if self:
+            with deferred_priorities(self.env):
+                self.write(criteria)
+        return diff
 
     @api.depends('uuid', 'risk_type')
     def _compute_name(self):
@@ -307,25 +601,14 @@ class RiskIdentificationMixin(models.AbstractModel):
     def _inverse_active(self):
         pass
 
-    @api.multi
     def _search_active(self, operator, value):
-        # active_test=False in context serves to prevent an infinite loop in the search function
-
-        recs = self.with_context(active_test=False)
-        today = fields.Date.context_today(self)
+        """A risk is active as long as its review date is ahead of today"""
         if operator not in ('=', '!=') or value not in (1, 0):
-            recs = recs.search([])
-        elif value:
-            if operator == '=':
-                recs = recs.search([('review_date', '>', today)])
-            elif operator == '!=':
-                recs = recs.search([('review_date', '<=', today)])
-        else:
-            if operator == '=':
-                recs = recs.search([('review_date', '<=', today)])
-            elif operator == '!=':
-                recs = recs.search([('review_date', '>', today)])
-        return [('id', 'in', [rec.id for rec in recs])]
+            return []
+        today = fields.Date.context_today(self)
+        if (operator == '=') == bool(value):
+            return [('review_date', '>', today)]
+        return ['|', ('review_date', '<=', today), ('review_date', '=', False)]
 
     @api.depends('active', 'latest_level_value', 'threshold_value')
     def _compute_status(self):
@@ -344,68 +627,106 @@ class RiskIdentificationMixin(models.AbstractModel):
             else:
                 rec.status = 'U'
 
-    def _search_status(self, operator, value):
-        recs = self.with_context(active_test=False)
-
-        def acceptable(rec):
-            # is the risk acceptable?
-            if rec.risk_type == 'T':
-                return rec.active and rec.latest_level_value and rec.threshold_value and \
-                    rec.latest_level_value <= rec.threshold_value
-            elif rec.risk_type == 'O':
-                return rec.active and rec.latest_level_value and rec.threshold_value and \
-                    rec.threshold_value <= rec.latest_level_value
-
-        def unacceptable(rec):
-            # is the risk unacceptable?
-            if rec.risk_type == 'T':
-                return rec.active and rec.latest_level_value and rec.threshold_value and \
-                    rec.latest_level_value > rec.threshold_value
-            elif rec.risk_type == 'O':
-                return rec.active and rec.latest_level_value and rec.threshold_value and \
-                    rec.threshold_value > rec.latest_level_value
-
-        def unknown_status(rec):
-            # is the risk status unknown?
-            return not rec.active or not rec.latest_level_value or not rec.threshold_value
-
-        if operator not in ('=', '!=') or value not in ('A', 'N', 'U'):
-            recs = recs.search([])
+    @api.model
+    def _get_status_condition(self, status, alias):
+        """
+        Returns the SQL condition matching the risks of the given status; the SQL counterpart of `_compute_status`
+        :param status: string: one of 'A', 'N' or 'U'
+        :param alias: string: alias of the risk table in the query
+        :return: tuple (condition, params)
+        """
+        today = fields.Date.context_today(self)
+        level = 'COALESCE({0}.latest_level_value, 0)'.format(alias)
+        threshold = 'COALESCE({0}.threshold_value, 0)'.format(alias)
+        if status == 'U':
+            return "{0}.review_date IS NULL OR {0}.review_date <= %s OR {1} = 0 OR {2} = 0".format(
+                alias, level, threshold), [today]
+        known = "{0}.review_date > %s AND {1} != 0 AND {2} != 0".format(alias, level, threshold)
+        if status == 'A':
+            compare = "({0}.risk_type = 'T' AND {1} <= {2}) OR ({0}.risk_type = 'O' AND {1} >= {2})"
         else:
-            if operator == '=':
-                if value == 'A':
-                    recs = recs.filtered(acceptable)
-                elif value == 'N':
-                    recs = recs.filtered(unacceptable)
-                elif value == 'U':
-                    recs = recs.filtered(unknown_status)
-            if operator == '!=':
-                if value == 'A':
-                    recs = recs.filtered(
-                        unacceptable) | recs.filtered(unknown_status)
-                elif value == 'N':
-                    recs = recs.filtered(
-                        acceptable) | recs.filtered(unknown_status)
-                elif value == 'U':
-                    recs = recs.filtered(
-                        acceptable) | recs.filtered(unacceptable)
+            compare = "({0}.risk_type = 'T' AND {1} > {2}) OR ({0}.risk_type = 'O' AND {1} < {2})"
+        return "{0} AND ({1})".format(known, compare.format(alias, level, threshold)), [today]
 
-        return [('id', 'in', [rec.id for rec in recs])]
+    def _search_status(self, operator, value):
+        statuses = {'A', 'N', 'U'}
+        if operator in ('=', '!='):
+            values = {value}
+        elif operator in ('in', 'not in') and isinstance(value, (list, tuple)):
+            values = set(value)
+        else:
+            return []
+        if operator in ('!=', 'not in'):
+            values = statuses - values
+        values &= statuses
+        if not values:
+            return [('id', '=', False)]
+        if values == statuses:
+            return []
+
+        conditions, params = [], []
+        for status in sorted(values):
+            condition, condition_params = self._get_status_condition(status, 'risk')
+            conditions.append('(%s)' % condition)
+            params += condition_params
+        query = 'SELECT risk.id FROM {0} AS risk WHERE {1}'.format(self._table, ' OR '.join(conditions))
+        return [('id', 'inselect', (query, params))]
 
-    @api.depends('active', 'is_confirmed', 'treatment_task_id', 'treatment_task_id.child_ids', 'treatment_task_count',
-                 'evaluation_ids')
+    @api.multi
+    def _get_stage_counts(self):
+        """
+        Counts, for all the risks at once, the evaluations and the treatment sub-tasks the stage depends on
+        :return: tuple of two dicts: - risk id: (number of up-to-date evaluations, number of validated ones)
+                                     - treatment task id: (number of sub-tasks, number of open sub-tasks)
+        """
+        eval_counts, task_counts = {}, {}
+        risk_ids = tuple(rid for rid in self._ids if isinstance(rid, int))
+        task_ids = tuple(tid for tid in self.mapped('treatment_task_id')._ids if isinstance(tid, int))
+        if risk_ids:
+            # an evaluation is up to date until its review date, see `_compute_is_obsolete`
+            self.env.cr.execute("""
+                SELECT business_risk_id,
+                       count(CASE WHEN review_date IS NULL OR review_date >= %s THEN 1 END),
+                       count(CASE WHEN (review_date IS NULL OR review_date >= %s) AND is_valid THEN 1 END)
+                FROM {table}
+                WHERE business_risk_id IN %s
+                GROUP BY business_risk_id
+            """.format(table=self.env['risk_management.business_risk.evaluation']._table),
+                (fields.Date.today(), fields.Date.today(), risk_ids))
+            eval_counts = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        if task_ids:
+            self.env.cr.execute("""
+                SELECT task.parent_id, count(*), count(CASE WHEN stage.fold IS NOT TRUE THEN 1 END)
+                FROM project_task AS task
+                LEFT JOIN project_task_type AS stage ON stage.id = task.stage_id
+                WHERE task.parent_id IN %s AND task.active
+                GROUP BY task.parent_id
+            """, (task_ids,))
+            task_counts = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+        # records not in database yet, e.g. in onchanges
+        for risk in self.filtered(lambda rec: not isinstance(rec.id, int)):
+            up_to_date_evals = risk.evaluation_ids.filtered(lambda ev: not ev.is_obsolete)
+            eval_counts[risk.id] = (len(up_to_date_evals), len(up_to_date_evals.filtered('is_valid')))
+            sub_tasks = risk.treatment_task_id.child_ids
+            task_counts[risk.treatment_task_id.id] = (
+                len(sub_tasks), len(sub_tasks.filtered(lambda task: not task.stage_id.fold)))
+        return eval_counts, task_counts
+
+    @api.depends('review_date', 'is_confirmed', 'evaluation_ids', 'evaluation_ids.is_valid',
+                 'evaluation_ids.review_date', 'treatment_task_id', 'treatment_task_id.child_ids',
+                 'treatment_task_id.child_ids.active', 'treatment_task_id.child_ids.stage_id',
+                 'treatment_task_id.child_ids.stage_id.fold')
     def _compute_stage(self):
+        eval_counts, task_counts = self._get_stage_counts()
         for risk in self:
-            # non-obsolete evaluations
-            up_to_date_evals = risk.evaluation_ids and risk.evaluation_ids.filtered(
-                lambda ev: not ev.is_obsolete)
-            # validated non-obsolete evaluations
-            valid_evals = up_to_date_evals and up_to_date_evals.filtered(
-                'is_valid')
+            # non-obsolete evaluations, validated non-obsolete evaluations
+            up_to_date_evals, valid_evals = eval_counts.get(risk.id, (0, 0))
+            # risk treatment tasks, ongoing risk treatment tasks
+            treatment_tasks, ongoing_treatment_tasks = task_counts.get(risk.treatment_task_id.id, (0, 0))
 
             if not risk.active:
                 risk.state = False
-                risk.stage = 'New'
             elif not risk.is_confirmed:
                 # risk has been reported but not confirmed
                 risk.state = '1'  # still in identification stage
@@ -418,15 +739,15 @@ class RiskIdentificationMixin(models.AbstractModel):
                 # there are evaluations of the risk but none has been validated
                 risk.state = '3'  # still in evaluation stage
 
-            elif not risk.treatment_task_id or not risk.treatment_task_id.child_ids:
+            elif not treatment_tasks:
                 # there is at least one valid risk evaluation
                 risk.state = '4'  # Risk evaluation completed
 
-            elif risk.treatment_task_id.child_ids.filtered(lambda task: not task.stage_id.fold):
+            elif ongoing_treatment_tasks:
                 # there is at least one ongoing risk treatment task
                 risk.state = '5'  # ongoing risk treatment
 
-            elif not risk.treatment_task_id.child_ids.filtered(lambda task: not task.stage_id.fold):
+            else:
                 # risk treatment done
                 risk.state = '6'
 
@@ -475,16 +796,16 @@ class RiskIdentificationMixin(models.AbstractModel):
         else:
             self.sudo().write({'user_id': self.env.user.id})
 
-    @api.depends('evaluation_ids')
+    @api.depends('latest_evaluation_id', 'latest_evaluation_id.review_date', 'latest_evaluation_id.detectability',
+                 'latest_evaluation_id.occurrence', 'latest_evaluation_id.severity', 'risk_type')
     def _compute_latest_eval(self):
         for rec in self:
-            if not rec.evaluation_ids.exists():
+            latest_evaluation = rec.latest_evaluation_id
+            if not latest_evaluation:
                 rec.latest_level_value = 0
                 rec.last_evaluate_date = False
                 rec.last_evaluator_id = False
             else:
-                # get the latest evaluation
-                latest_evaluation = rec.evaluation_ids.exists().sorted()[0]
                 rec.last_evaluate_date = latest_evaluation.eval_date
                 rec.last_evaluator_id = latest_evaluation.create_uid
                 if latest_evaluation.is_obsolete:
@@ -554,61 +875,71 @@ class RiskIdentificationMixin(models.AbstractModel):
                 self.with_context(active_test=False).mapped(
                     'treatment_task_id').write({'active': active})
 
-        res = super(RiskIdentificationMixin, self).write(vals)
-        if res and (vals.get('detectability', False) or vals.get('occurrence', False) or vals.get('severity', False) or
-                    vals.get('evaluation_ids', False)):
-            self.invalidate_cache(ids=self.ids)
-            updated_self = self.env[self._name].browse(self.ids)
-            for rec in updated_self:
-                # update record's latest evaluation's threshold value
-                if rec.evaluation_ids:
-                    latest_evaluation = rec.evaluation_ids.exists().sorted()[0]
-                    latest_evaluation.write({
-                        "threshold_value": rec.threshold_value
-                    })
-                if rec.status == 'N':
-                    if not rec.treatment_task_id:
-                        task = self.env['project.task'].create({
-                            'name': 'Treatment for %s' % rec.name,
-                            'description': """
-                                <p>
-                                    The purpose of this task is to select and implement measures to modify %s.
-                                    These measures can include avoiding, optimizing, transferring or retaining risk.
-                                </p>
-                                        """ % rec.name,
-                            'project_id': rec.treatment_project_id.id,
-                            'priority': '1'
-                        })
-                        rec.write({
-                            'treatment_task_id': task.id
-                        })
-
-                    elif not rec.treatment_task_id.active:
-                        rec.treatment_task_id.active = True
-                elif rec.treatment_task_id and rec.treatment_task_id.active:
-                    rec.treatment_task_id.active = False
-            self.compute_priorities()
-
-        activity = self.env['mail.activity']
-        act_deadline_date = datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY)
-        act_deadline = fields.Date.to_string(act_deadline_date)
-        note = "Assess the probability of risk occurring and its possible impact," \
-               "as well as the company's ability to detect it should it occur."
-        summary = 'Next step in Risk Management: Evaluation'
+        companies = self.mapped('company_id').ids
+        with deferred_priorities(self.env):
+            res = super(RiskIdentificationMixin, self).write(vals)
+            if res and (vals.get('detectability', False) or vals.get('occurrence', False) or
+                        vals.get('severity', False) or vals.get('evaluation_ids', False)):
+                self.invalidate_cache(ids=self.ids)
+                self.env[self._name].browse(self.ids)._propagate_thresholds()
+                self.compute_priorities(self.mapped('company_id').ids)
+            if 'company_id' in vals:
+                # the risks left their companies' rankings
+                self.compute_priorities(list(set(companies + [vals['company_id']])))
 
         if vals.get('is_confirmed', False):
-            act_to_close = activity.search([
-                ('res_id', 'in', self.ids),
-                ('note', 'ilike', 'Check and confirm the existence of the risk'),
-                ('summary', 'ilike', 'Next step in Risk Management:')
-            ])
-
-            # add next activities
-            for rec in self:
-                add_risk_activity(self.env, rec, note, act_deadline, act_to_close, summary)
+            # the risks have been confirmed, they have to be evaluated
+            set_risk_step(self, 'evaluate')
 
         return res
 
+    @api.multi
+    def _propagate_thresholds(self):
+        """
+        Propagates the new thresholds of the risks, by phase for all the risks at once: the threshold of their latest
+        evaluations is updated with a single statement, then the risks are partitioned by status, the missing
+        treatment tasks of the unacceptable risks are created, and their treatment tasks are reactivated, or
+        archived for the other risks, with one write per state
+        """
+        if not self:
+            return
+        # the new thresholds are read through the ORM, which recomputes them if their recomputation is pending, e.g.
+        # under `recompute=False`, and passed to the statement rather than read from their stored column
+        evaluated = self.filtered('latest_evaluation_id')
+        evaluation = self.env['risk_management.business_risk.evaluation']
+        self.env.cr.execute("""
+            UPDATE {evaluation} AS evaluation SET threshold_value = latest.threshold_value
+            FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::int[]) AS threshold_value) AS latest
+            WHERE evaluation.id = latest.id AND evaluation.threshold_value IS DISTINCT FROM latest.threshold_value
+            RETURNING evaluation.id
+        """.format(evaluation=evaluation._table),
+            ([rec.latest_evaluation_id.id for rec in evaluated], [rec.threshold_value or None for rec in evaluated]))
+        evaluation.invalidate_cache(['threshold_value'], [row[0] for row in self.env.cr.fetchall()])
+
+        unacceptable = self.filtered(lambda rec: rec.status == 'N')
+        # Odoo 11 has no multi-create: the tasks are still created one by one, from values prepared beforehand
+        task_model = self.env['project.task']
+        for vals in [rec._prepare_treatment_task_vals() for rec in unacceptable if not rec.treatment_task_id]:
+            task_model.create(vals)
+        unacceptable.mapped('treatment_task_id').filtered(lambda task: not task.active).write({'active': True})
+        (self - unacceptable).mapped('treatment_task_id').filtered('active').write({'active': False})
+
+    @api.multi
+    def _prepare_treatment_task_vals(self):
+        self.ensure_one()
+        return {
+            'name': 'Treatment for %s' % self.name,
+            'description': """
+                <p>
+                    The purpose of this task is to select and implement measures to modify %s.
+                    These measures can include avoiding, optimizing, transferring or retaining risk.
+                </p>
+                    """ % self.name,
+            'project_id': self.treatment_project_id.id,
+            'business_risk_id': self.id,
+            'priority': '1'
+        }
+
 
 class BusinessRisk(models.Model):
     _name = 'risk_management.business_risk'
@@ -622,12 +953,49 @@ class BusinessRisk(models.Model):
     ref_asset_id = fields.Reference(
         selection='_ref_models', string='Affected Asset')
     asset = fields.Char(compute='_compute_asset', store=True)
+    asset_model = fields.Char(compute='_compute_asset', store=True, string='Asset Model')
+    asset_res_id = fields.Integer(compute='_compute_asset', store=True, string='Asset ID')
     asset_desc = fields.Char(compute='_compute_asset', string='Asset Type')
     evaluation_ids = fields.One2many(comodel_name='risk_management.business_risk.evaluation',
                                      inverse_name='business_risk_id')
+    latest_evaluation_id = fields.Many2one('risk_management.business_risk.evaluation', string='Latest Evaluation',
+                                           compute='_compute_latest_evaluation', store=True, ondelete='set null')
     treatment_task_ids = fields.One2many(
         'project.task', inverse_name='business_risk_id')
 
+    @api.model_cr
+    def init(self):
+        # supports the searches on `status`, which compare the level and the threshold of the active risks
+        create_index(self._cr, 'risk_management_business_risk_status_index', self._table,
+                     ['review_date', 'risk_type', 'latest_level_value', 'threshold_value'])
+        # supports the lookups of the risks of an asset, see `_get_risks_by_asset`
+        create_index(self._cr, 'risk_management_business_risk_asset_index', self._table,
+                     ['asset_model', 'asset_res_id'])
+        # a risk is reported only once per company and asset, see `create_batch`; the risks reported more than once
+        # before are merged by the migration to 11.0.1.4
+        create_unique_index(self._cr, 'risk_management_business_risk_report_unique', self._table,
+                            ['company_id', 'risk_info_id', 'risk_type', "COALESCE(ref_asset_id, '')"])
+
+    @api.depends('evaluation_ids')
+    def _compute_latest_evaluation(self):
+        """The most recent evaluation of each risk, looked up for all the risks with a single query"""
+        evaluation = self.env['risk_management.business_risk.evaluation']
+        ids = tuple(rid for rid in self._ids if isinstance(rid, int))
+        latest = {}
+        if ids:
+            self.env.cr.execute("""
+                SELECT DISTINCT ON (business_risk_id) business_risk_id, id
+                FROM {table}
+                WHERE business_risk_id IN %s
+                ORDER BY business_risk_id, create_date DESC, id DESC
+            """.format(table=evaluation._table), (ids,))
+            latest = dict(self.env.cr.fetchall())
+        for rec in self:
+            if isinstance(rec.id, int):
+                rec.latest_evaluation_id = evaluation.browse(latest.get(rec.id))
+            else:
+                rec.latest_evaluation_id = rec.evaluation_ids.sorted()[:1]
+
     @api.depends('ref_asset_id')
     def _compute_asset(self):
         """This field is used to search risk on `ref_asset_id`"""
@@ -636,6 +1004,133 @@ class BusinessRisk(models.Model):
                 rec.asset_desc = rec.ref_asset_id._description
                 rec.asset = rec.ref_asset_id._name + \
                     ',' + str(rec.ref_asset_id.id)
+                rec.asset_model = rec.ref_asset_id._name
+                rec.asset_res_id = rec.ref_asset_id.id
+            else:
+                rec.asset_model = False
+                rec.asset_res_id = False
+
+    @api.model
+    def _get_risks_by_asset(self, assets):
+        """
+        Looks up the risks affecting each of the assets with a single search
+        :param assets: recordset: the assets, e.g. processes or projects
+        :return: dict: the risks of each asset, by asset id
+        """
+        risks_by_asset = {asset_id: self.browse() for asset_id in assets.ids}
+        if assets.ids:
+            for risk in self.search([('asset_model', '=', assets._name), ('asset_res_id', 'in', assets.ids)]):
+                risks_by_asset[risk.asset_res_id] |= risk
+        return risks_by_asset
+
+    @api.model
+    def _get_profile_summary(self, domain=None, by_company=False):
+        """
+        Counts the risks matching `domain` for every cell of the risk profile summary at once, with a single query
+        grouped by company, type, confirmation and status
+        :param domain: list: the domain of the risks, the active risks the user can read by default
+        :param by_company: bool: count the risks of each company separately
+        :return: dict: the counts by cell name, e.g. `confirmed_threat_num`; a dict of such dicts by company id if
+        `by_company`
+        """
+        query = self._where_calc(domain or [])
+        self._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+        unacceptable, unacceptable_params = self._get_status_condition('N', '"%s"' % self._table)
+        self.env.cr.execute("""
+            SELECT "{table}".company_id, "{table}".risk_type, COALESCE("{table}".is_confirmed, FALSE),
+                   COALESCE({unacceptable}, FALSE), count(*)
+            FROM {from_clause}
+            WHERE {where}
+            GROUP BY 1, 2, 3, 4
+        """.format(table=self._table, unacceptable=unacceptable, from_clause=from_clause,
+                   where=where_clause or 'TRUE'), unacceptable_params + where_params)
+
+        cells = ('total_num', 'total_threat_num', 'total_opp_num', 'confirmed_num', 'confirmed_threat_num',
+                 'confirmed_opp_num', 'unacceptable_num', 'unacceptable_threat_num', 'unacceptable_opp_num')
+        summaries = {}
+        for company_id, risk_type, is_confirmed, is_unacceptable, count in self.env.cr.fetchall():
+            summary = summaries.setdefault(company_id if by_company else False, dict.fromkeys(cells, 0))
+            kind = {'T': 'threat', 'O': 'opp'}[risk_type]
+            for row, included in (('total', True), ('confirmed', is_confirmed), ('unacceptable', is_unacceptable)):
+                if included:
+                    summary['%s_num' % row] += count
+                    summary['%s_%s_num' % (row, kind)] += count
+        if by_company:
+            return summaries
+        return summaries.get(False, dict.fromkeys(cells, 0))
+
+    @api.model
+    def _get_chart_fingerprint(self, ids, max_points=None):
+        """
+        Fingerprints the data of `get_chart_data` without computing it, to validate the caches of the charts
+        :param ids: list: ids of the risks
+        :param max_points: int: maximum number of points of the time series
+        :return: string: changes whenever the risks, their evaluations or their treatment tasks change
+        """
+        ids = tuple(ids) or (0,)
+        self.env.cr.execute("""
+            SELECT (SELECT ROW(max(write_date), count(*)) FROM {risk} WHERE id IN %s),
+                   (SELECT ROW(max(write_date), count(*)) FROM {evaluation} WHERE business_risk_id IN %s),
+                   (SELECT ROW(max(task.write_date), count(*))
+                    FROM project_task task LEFT JOIN project_task parent ON parent.id = task.parent_id
+                    WHERE task.business_risk_id IN %s OR parent.business_risk_id IN %s)
+        """.format(risk=self._table, evaluation=self.env['risk_management.business_risk.evaluation']._table),
+            (ids, ids, ids, ids))
+        state = repr((self.env.cr.fetchone(), ids, max_points, self.env.uid, self.env.lang))
+        return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+    @api.model
+    def get_chart_data(self, ids, max_points=None):
+        """
+        Aggregates the series of the risk charts: the number of risks per category and per stage, the number of
+        treatment sub-tasks per risk and task stage, and the level and threshold time series of each risk
+        :param ids: list: ids of the risks
+        :param max_points: int: maximum number of points of each time series, evenly downsampled, no limit by default
+        :return: dict: {'categories': {'labels': [...], 'counts': [...]}, 'stages': idem,
+                        'treatments': {'labels': [risk names], 'datasets': [{'label': task stage, 'data': [...]}]},
+                        'timelines': [{'id': risk id, 'name': risk name, 'evaluations': [{...}, ...]}]}
+        """
+        domain = [('id', 'in', list(ids))]
+        risks = self.search(domain)
+
+        categories = self.read_group(domain, ['risk_info_category'], ['risk_info_category'])
+        stages = self.read_group(domain, ['stage'], ['stage'])
+
+        # sub-tasks of the treatment tasks, counted by treatment task and stage
+        task_groups = self.env['project.task'].read_group(
+            [('parent_id.business_risk_id', 'in', risks.ids)], ['parent_id', 'stage_id'],
+            ['parent_id', 'stage_id'], lazy=False)
+        treatment_tasks = self.env['project.task'].browse(
+            sorted({group['parent_id'][0] for group in task_groups if group['parent_id']}))
+        task_index = {task.id: index for index, task in enumerate(treatment_tasks)}
+        datasets = {}
+        for group in task_groups:
+            if not group['parent_id']:
+                continue
+            label = group['stage_id'][1] if group['stage_id'] else _('Undefined')
+            data = datasets.setdefault(label, [0] * len(treatment_tasks))
+            data[task_index[group['parent_id'][0]]] += group['__count']
+
+        # validated evaluations of each risk, the most recent first
+        evaluations = {risk.id: [] for risk in risks}
+        for evaluation in self.env['risk_management.business_risk.evaluation'].search_read(
+                [('business_risk_id', 'in', risks.ids), ('is_valid', '=', True)],
+                ['business_risk_id', 'eval_date', 'detectability', 'occurrence', 'severity', 'value',
+                 'threshold_detectability', 'threshold_occurrence', 'threshold_severity', 'threshold_value'],
+                order='eval_date desc, id desc'):
+            evaluations[evaluation.pop('business_risk_id')[0]].append(evaluation)
+
+        return {
+            'categories': {'labels': [group['risk_info_category'] or _('Undefined') for group in categories],
+                           'counts': [group['risk_info_category_count'] for group in categories]},
+            'stages': {'labels': [group['stage'] or _('New') for group in stages],
+                       'counts': [group['stage_count'] for group in stages]},
+            'treatments': {'labels': [task.business_risk_id.display_name for task in treatment_tasks],
+                           'datasets': [{'label': label, 'data': data} for label, data in sorted(datasets.items())]},
+            'timelines': [{'id': risk.id, 'name': risk.name,
+                           'evaluations': downsample(evaluations[risk.id], max_points)} for risk in risks],
+        }
 
     @api.multi
     def _track_subtype(self, init_values):
@@ -660,57 +1155,164 @@ class BusinessRisk(models.Model):
 
     @api.model
     def create(self, vals):
+        if self.env.context.get('business_risk_batch'):
+            # the flag is meant for this create only, not for the records it creates in turn
+            context = dict(self.env.context)
+            del context['business_risk_batch']
+            return super(BusinessRisk, self.with_context(context)).create(vals)
+        return self.browse(self.create_batch([vals], raise_on_error=True)[0]['id'])
+
+    @api.model
+    def _report_key(self, vals, defaults):
+        """
+        The values identifying a reported risk, as indexed by `risk_management_business_risk_report_unique`
+        :param vals: dict: the values of the risk, as for `create`
+        :param defaults: dict: the default values of the key fields, as returned by `default_get`
+        :return: tuple
+        """
+        vals = dict(defaults, **vals)
+        return (vals.get('company_id'), vals.get('risk_info_id'), vals.get('risk_type') or 'T',
+                vals.get('ref_asset_id') or '')
+
+    @api.model
+    def create_batch(self, vals_list, raise_on_error=False):
+        """
+        Report many risks at once. A risk already reported and inactive is reactivated, a risk already reported and
+        active is a duplicate, any other risk is created. The existing risks are looked up with a single query, the
+        activities and followers of the reported risks are added in bulk and the priorities are ranked once.
+        :param vals_list: list of dict: the values of each risk, as for `create`
+        :param raise_on_error: bool: raise on the first duplicate or invalid row instead of reporting it
+        :return: list of dict, one per row of `vals_list`, with the keys `status` ('created', 'reactivated',
+        'duplicate' or 'error'), `id` (the id of the risk or False) and `message`
+        """
+        # the missing values are the ones `create` would default to, e.g. from the context
+        defaults = self.default_get(['company_id', 'risk_info_id', 'risk_type', 'ref_asset_id'])
+        keys = [self._report_key(vals, defaults) for vals in vals_list]
+        existing = {}
+        if keys:
+            self.env.cr.execute("""
+                SELECT company_id, risk_info_id, risk_type, COALESCE(ref_asset_id, ''), min(id)
+                FROM {table}
+                WHERE (company_id, risk_info_id, risk_type, COALESCE(ref_asset_id, '')) IN %s
+                GROUP BY 1, 2, 3, 4
+            """.format(table=self._table), (tuple(set(keys)),))
+            existing = {tuple(row[:4]): row[4] for row in self.env.cr.fetchall()}
+
         # context: no_log, because subtype already handle this
-        context = dict(self.env.context, mail_create_nolog=True)
-        existing = self.env[self._name].with_context(active_test=False).search(
-            [('risk_info_id', '=', vals.get('risk_info_id')),
-             ('risk_type', '=', vals.get('risk_type', 'T')),
-             ('ref_asset_id', '=', vals.get('ref_asset_id', False)),
-             ('company_id', '=', vals.get('company_id', self.env.user.company_id.id))])
-        act_deadline_date = datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY)
-        act_deadline = fields.Date.to_string(act_deadline_date)
-        note = "Check and confirm the existence of the risk."
-        summary = "Next step in Risk Management: Confirm"
-
-        if existing:
-            # if by chance there is more than one existing, which should not be!
-            existing = existing.exists()[0]
-            if not existing.active:
-                # the risk was already submitted but is inactive, just reactivate it
-                vals.update({'active': True})
-                existing.write(vals)
-                # add an activity to verify the risk
-                add_risk_activity(self.env, existing, note, act_deadline, act_to_close=None, summary=summary)
-                return existing
-            else:
-                raise exceptions.UserError(
-                    _("This risk has already been reported."))
-
-        if vals.get('company_id') and not context.get('default_company_id'):
-            context['default_company_id'] = vals.get('company_id')
-
-        risk = super(BusinessRisk, self).create(vals)
-
-        # Next activity
-        add_risk_activity(self.env, existing, note, act_deadline, act_to_close=None, summary=summary)
-
-        # add risk channel as follower
-        new = self.env.ref('risk_management.mt_business_risk_new')
-        obsolete = self.env.ref('risk_management.mt_business_risk_obsolete')
-        status = self.env.ref('risk_management.mt_business_risk_status')
-        self.env['mail.followers'].create({
-            'res_model': self._name,
-            'res_id': risk.id,
-            'channel_id': self.env.ref('risk_management.mail_channel_risk_management_risk').id,
-            'subtype_ids': [(6, False, [new.id, obsolete.id, status.id])]
+        creator = self.with_context(mail_create_nolog=True, business_risk_batch=True)
+        outcomes, reported, created = [], self.browse(), self.browse()
+        with deferred_priorities(self.env):
+            for vals, key in zip(vals_list, keys):
+                risk = self.with_context(active_test=False).browse(existing.get(key))
+                if risk and risk.active:
+                    if raise_on_error:
+                        raise exceptions.UserError(_("This risk has already been reported."))
+                    outcomes.append({'status': 'duplicate', 'id': risk.id,
+                                     'message': _("This risk has already been reported.")})
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        if risk:
+                            # the risk was already submitted but is inactive, just reactivate it
+                            risk.write(dict(vals, active=True))
+                            status = 'reactivated'
+                        else:
+                            risk = creator.create(vals)
+                            created |= risk
+                            status = 'created'
+                except (exceptions.UserError, exceptions.ValidationError, exceptions.AccessError,
+                        psycopg2.Error) as e:
+                    if raise_on_error:
+                        raise
+                    outcomes.append({'status': 'error', 'id': False, 'message': getattr(e, 'name', None) or str(e)})
+                    continue
+                existing[key] = risk.id
+                reported |= risk
+                outcomes.append({'status': status, 'id': risk.id, 'message': ''})
+
+            # Next activity
+            set_risk_step(reported, 'confirm')
+
+            # add risk channel as follower
+            if created:
+                created.message_subscribe(
+                    channel_ids=[self.env.ref('risk_management.mail_channel_risk_management_risk').id],
+                    subtype_ids=[self.env.ref('risk_management.mt_business_risk_new').id,
+                                 self.env.ref('risk_management.mt_business_risk_obsolete').id,
+                                 self.env.ref('risk_management.mt_business_risk_status').id])
+        return outcomes
+
+    @api.model
+    def _cron_date_rollover(self, chunk_size=RISK_ROLLOVER_CHUNK_SIZE):
+        """
+        Refreshes the stored state that depends on today's date: risks whose review date, or whose evaluations'
+        review date, was crossed since the last run get their level, stage, priority and treatment task refreshed.
+        Risks are processed in chunks, each chunk being committed.
+        :param chunk_size: int: number of risks refreshed per transaction
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        today = fields.Date.context_today(self)
+        last_run = params.get_param(RISK_ROLLOVER_PARAM)
+        if last_run and last_run >= today:
+            return
+
+        # risks that have become inactive and risks whose evaluations have become obsolete since the last run
+        risk_where, eval_where, query_params = '', '', [today, today]
+        if last_run:
+            risk_where, eval_where = 'AND review_date > %s', 'AND review_date >= %s'
+            query_params = [today, last_run, today, last_run]
+        self.env.cr.execute("""
+            SELECT id FROM {risk} WHERE review_date <= %s {risk_where}
+            UNION
+            SELECT business_risk_id FROM {evaluation} WHERE review_date < %s {eval_where}
+        """.format(risk=self._table, evaluation=self.env['risk_management.business_risk.evaluation']._table,
+                   risk_where=risk_where, eval_where=eval_where), query_params)
+        risk_ids = sorted(row[0] for row in self.env.cr.fetchall())
+        _logger.info("Date rollover: refreshing %d risks", len(risk_ids))
+
+        commit = not getattr(threading.currentThread(), 'testing', False)
+        for chunk_ids in split_every(chunk_size, risk_ids):
+            self.with_context(active_test=False).browse(chunk_ids)._refresh_date_dependent_fields()
+            if commit:
+                self.env.cr.commit()
+        params.set_param(RISK_ROLLOVER_PARAM, today)
+
+    @api.multi
+    def _refresh_date_dependent_fields(self):
+        """Recomputes in batch the stored fields that depend on today's date, and (de)activates the treatment tasks
+        of the risks accordingly"""
+        with deferred_priorities(self.env):
+            for fname in ('latest_level_value', 'state'):
+                self._recompute_todo(self._fields[fname])
+            self.recompute()
+        self.invalidate_cache(['status'], self.ids)
+        self.filtered(lambda risk: risk.status != 'N').mapped('treatment_task_id').filtered('active').write({
+            'active': False
         })
 
-        return risk
+    @api.multi
+    def write(self, vals):
+        if not RISK_HEATMAP_RISK_FIELDS.intersection(vals):
+            return super(BusinessRisk, self).write(vals)
+        # the evaluations of the risks move to other cells of the heat map
+        heatmap = self.env['risk_management.risk_heatmap'].sudo()
+        evaluation_ids = self.env['risk_management.business_risk.evaluation'].sudo().search(
+            [('business_risk_id', 'in', self.ids), ('is_valid', '=', True)]).ids
+        heatmap._remove_evaluations(evaluation_ids)
+        res = super(BusinessRisk, self).write(vals)
+        heatmap._add_evaluations(evaluation_ids)
+        return res
 
     @api.multi
     def unlink(self):
+        companies = self.mapped('company_id').ids
+        # the evaluations are deleted by the database, along with the risks
+        self.env['risk_management.risk_heatmap'].sudo()._remove_evaluations(
+            self.env['risk_management.business_risk.evaluation'].sudo().search(
+                [('business_risk_id', 'in', self.ids), ('is_valid', '=', True)]).ids)
         res = super(BusinessRisk, self).unlink()
         if res:
+            self.compute_priorities(companies)
             # On deleting a risk, delete all treatment task related to it
             parent_tasks = self.env['project.task'].search(
                 [('business_risk_id', 'in', self.ids)])
@@ -772,7 +1374,7 @@ class BusinessRiskEvaluation(models.Model):
     _inherit = ['risk_management.risk_evaluation.mixin']
 
     business_risk_id = fields.Many2one(comodel_name='risk_management.business_risk', string='Risk', required=True,
-                                       ondelete='cascade')
+                                       ondelete='cascade', index=True)
     risk_type = fields.Selection(
         related='business_risk_id.risk_type', readonly=True)
     threshold_detectability = fields.Integer(
@@ -786,6 +1388,12 @@ class BusinessRiskEvaluation(models.Model):
     value = fields.Integer(
         'Risk Level', compute='_compute_eval_value', store=True)
 
+    @api.model_cr
+    def init(self):
+        # supports the lookup of the latest evaluation of the risks
+        create_index(self._cr, 'risk_management_business_risk_evaluation_latest_index', self._table,
+                     ['business_risk_id', 'create_date DESC', 'id DESC'])
+
     @api.depends('business_risk_id',
                  'detectability',
                  'occurrence',
@@ -806,35 +1414,73 @@ class BusinessRiskEvaluation(models.Model):
 
     @api.model
     def create(self, vals):
-        same_day_eval = self.env['risk_management.business_risk.evaluation'].search([
-            ('eval_date', '=', fields.Date.context_today(self)),
-            ('business_risk_id', '=', vals['business_risk_id']),
-            ('create_uid', '=', self.env.user.id)
-        ])
-        # if another evaluation was created the same day by the same user, just update it
-        if same_day_eval.exists():
-            vals.update({'is_valid': False})
-            if len(same_day_eval.exists()) > 1:
-                # Hardly necessary, but you never know, there may be more than one record in `same_day_eval`
-                same_day_eval.exists()[1:].unlink()
-            same_day_eval = same_day_eval.exists()
-            same_day_eval.write(vals)
-            evaluation = same_day_eval
+        if self.env.context.get('risk_evaluation_batch'):
+            # the flag is meant for this create only, not for the records it creates in turn
+            context = dict(self.env.context)
+            del context['risk_evaluation_batch']
+            return super(BusinessRiskEvaluation, self.with_context(context)).create(vals)
+        outcome = self.create_batch([vals], raise_on_error=True)[0]
+        return self.browse(outcome['id'])
 
-        else:
-            evaluation = super(BusinessRiskEvaluation, self).create(vals)
-            act_deadline_date = datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY)
-            # add an activity to validate the risk evaluation.
-            self.env['mail.activity'].create({
-                'res_id': vals.get('business_risk_id'),
-                'res_model_id': self.env['ir.model']._get_id('risk_management.business_risk'),
-                'activity_type_id': self.env.ref('risk_management.risk_activity_todo').id,
-                'summary': 'Next step in Risk Management: Validate Evaluation',
-                'note': '<p>Validate the risk assessment.</p>',
-                'date_deadline': fields.Date.to_string(act_deadline_date)
-            })
-        self.env['risk_management.business_risk'].compute_priorities()
-        return evaluation
+    @api.model
+    def create_batch(self, vals_list, raise_on_error=False):
+        """
+        Record many evaluations at once, e.g. during an assessment session. An evaluation of a risk by a user who has
+        already evaluated it the same day is merged into the existing evaluation, which has to be validated again;
+        any other evaluation is created. The same-day evaluations are looked up with a single search, the
+        validation activities are added in bulk and the priorities are ranked once.
+        :param vals_list: list of dict: the values of each evaluation, as for `create`
+        :param raise_on_error: bool: raise on the first invalid row instead of reporting it
+        :return: list of dict, one per row of `vals_list`, with the keys `status` ('created', 'merged' or 'error'),
+        `id` (the id of the evaluation or False), `business_risk_id` and `message`
+        """
+        same_day = {}
+        risk_ids = list({vals.get('business_risk_id') for vals in vals_list if vals.get('business_risk_id')})
+        if risk_ids:
+            for evaluation in self.search([('eval_date', '=', fields.Date.context_today(self)),
+                                           ('business_risk_id', 'in', risk_ids),
+                                           ('create_uid', '=', self.env.user.id)], order='id'):
+                same_day.setdefault(evaluation.business_risk_id.id, self.browse())
+                same_day[evaluation.business_risk_id.id] |= evaluation
+
+        creator = self.with_context(risk_evaluation_batch=True)
+        outcomes, created = [], self.browse()
+        with deferred_priorities(self.env):
+            for vals in vals_list:
+                risk_id = vals.get('business_risk_id')
+                try:
+                    with self.env.cr.savepoint():
+                        evaluation = same_day.get(risk_id, self.browse()).exists()
+                        if evaluation:
+                            # another evaluation was created the same day by the same user, just update it
+                            if len(evaluation) > 1:
+                                # Hardly necessary, but you never know, there may be more than one evaluation
+                                evaluation[1:].unlink()
+                                evaluation = evaluation[0]
+                            evaluation.write(dict(vals, is_valid=False))
+                            status = 'merged'
+                        else:
+                            evaluation = creator.create(vals)
+                            created |= evaluation
+                            status = 'created'
+                except (exceptions.UserError, exceptions.ValidationError, exceptions.AccessError,
+                        psycopg2.Error) as e:
+                    if raise_on_error:
+                        raise
+                    outcomes.append({'status': 'error', 'id': False, 'business_risk_id': risk_id,
+                                     'message': getattr(e, 'name', None) or str(e)})
+                    continue
+                same_day[evaluation.business_risk_id.id] = evaluation
+                outcomes.append({'status': status, 'id': evaluation.id,
+                                 'business_risk_id': evaluation.business_risk_id.id, 'message': ''})
+
+            self.env['risk_management.risk_heatmap'].sudo()._add_evaluations(created.ids)
+            # add an activity to validate the risk evaluations
+            set_risk_step(created.mapped('business_risk_id'), 'validate')
+            evaluated = self.browse([outcome['id'] for outcome in outcomes if outcome['id']])
+            self.env['risk_management.business_risk'].compute_priorities(
+                evaluated.mapped('business_risk_id.company_id').ids)
+        return outcomes
 
     @api.multi
     def write(self, vals):
@@ -846,43 +1492,38 @@ class BusinessRiskEvaluation(models.Model):
                         'You cannot change the Risk associated with any evaluation')
                     break
 
+        heatmap = self.env['risk_management.risk_heatmap'].sudo()
+        moves_cells = bool(RISK_HEATMAP_EVALUATION_FIELDS.intersection(vals))
+        if moves_cells:
+            heatmap._remove_evaluations(self.ids)
         res = super(BusinessRiskEvaluation, self).write(vals)
+        if moves_cells:
+            heatmap._add_evaluations(self.ids)
         if res and vals.get('is_valid', False):
-            res_model_id = self.env['ir.model']._get_id(
-                'risk_management.business_risk')
-            act_deadline_date = datetime.date.today() + datetime.timedelta(days=RISK_ACT_DELAY)
-            note = "Select and implement measures to modify risk."
-            summary = "Next step in Risk Management: Treat risk"
-            deadline = fields.Date.to_string(act_deadline_date)
-            for rec in self:
-                # mark previous activities as done
-                self.env['mail.activity'].search(['&', '&', ('res_id', '=', rec.business_risk_id.id),
-                                                  ('res_model_id',
-                                                   '=', res_model_id),
-                                                  '|',
-                                                  ('note', 'ilike',
-                                                   'Validate the risk assessment'),
-                                                  ('note', 'ilike',
-                                                   'Assess the probability of risk occurring and its possible impact,'
-                                                   'as well as the company\'s ability to detect it should it occur.')
-                                                  ]).action_done()
-                if rec.business_risk_id.status == 'N':
-                    # add an activity to treat the risk
-                    add_risk_activity(self.env, rec.business_risk_id, note, deadline, summary=summary)
-
-                    if not rec.business_risk_id.treatment_task_id:
-                        # create a risk treatment task for the risk being evaluated
-                        self.env['project.task'].create({
-                            'name': 'Treatment for %s' % rec.business_risk_id.name,
-                            'description': """
-                                <p>
-                                    Select and implement options for modifying %s, and/or improve risk control for
-                                    this risk.
-                                </p>
-                            """ % rec.business_risk_id.name,
-                            'priority': '1',
-                            'project_id': self.env.ref('risk_management.risk_treatment_project').id,
-                            'business_risk_id': rec.business_risk_id.id,
-                            'user_id': rec.business_risk_id.user_id.id if rec.business_risk_id.user_id else False
-                        })
+            risks = self.mapped('business_risk_id')
+            # mark previous activities as done
+            close_risk_steps(risks, ('evaluate', 'validate'))
+            unacceptable = risks.filtered(lambda risk: risk.status == 'N')
+            # add an activity to treat the risks
+            set_risk_step(unacceptable, 'treat')
+            for risk in unacceptable.filtered(lambda risk: not risk.treatment_task_id):
+                # create a risk treatment task for the risk being evaluated
+                self.env['project.task'].create({
+                    'name': 'Treatment for %s' % risk.name,
+                    'description': """
+                        <p>
+                            Select and implement options for modifying %s, and/or improve risk control for
+                            this risk.
+                        </p>
+                    """ % risk.name,
+                    'priority': '1',
+                    'project_id': self.env.ref('risk_management.risk_treatment_project').id,
+                    'business_risk_id': risk.id,
+                    'user_id': risk.user_id.id if risk.user_id else False
+                })
         return res
+
+    @api.multi
+    def unlink(self):
+        self.env['risk_management.risk_heatmap'].sudo()._remove_evaluations(self.ids)
+        return super(BusinessRiskEvaluation, self).unlink()
@@ -1 +1 @@
-from . import risk_report, risk_profile_report
+from . import risk_report, risk_profile_report, risk_heatmap_report
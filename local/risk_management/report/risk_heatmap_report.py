@@ -0,0 +1,66 @@
+from odoo import models, fields, api
+
+
+class RiskHeatmapWizard(models.TransientModel):
+    _name = 'risk_management.risk_heatmap.wizard'
+
+    company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.user.company_id,
+                                 required=True)
+    asset_model = fields.Selection(selection='_ref_models', string='Asset Type')
+    risk_category_id = fields.Many2one('risk_management.risk.category', string='Category')
+    risk_type = fields.Selection(selection=(('T', 'Threat'), ('O', 'Opportunity')), string='Type')
+    date_from = fields.Date(string='From')
+    date_to = fields.Date(string='To')
+
+    @api.model
+    def _ref_models(self):
+        m = self.env['res.request.link'].search([('object', '!=', 'risk_management.business_risk')])
+        return [(x.object, x.name) for x in m]
+
+    @api.multi
+    def get_report(self):
+        data = {
+            'ids': self.ids,
+            'model': self._name,
+            'form': {
+                'company_id': self.company_id.id,
+                'asset_model': self.asset_model,
+                'risk_category_id': self.risk_category_id.id,
+                'risk_type': self.risk_type,
+                'date_from': self.date_from,
+                'date_to': self.date_to,
+            },
+        }
+        return self.env.ref('risk_management.action_risk_heatmap_report').report_action(self, data=data)
+
+
+class RiskHeatmapReport(models.AbstractModel):
+    _name = 'report.risk_management.risk_heatmap_report'
+
+    @api.model
+    def get_report_values(self, docids, data=None):
+        form = data['form']
+        domain = [('company_id', '=', form['company_id'])]
+        for name in ('asset_model', 'risk_category_id', 'risk_type'):
+            if form.get(name):
+                domain.append((name, '=', form[name]))
+        if form.get('date_from'):
+            domain.append(('period', '>=', form['date_from']))
+        if form.get('date_to'):
+            domain.append(('period', '<=', form['date_to']))
+
+        heatmap = self.env['risk_management.risk_heatmap']
+        matrix = heatmap.get_matrix(domain, rows='occurrence', columns='severity')
+        return {
+            'doc_ids': data['ids'],
+            'doc_model': data['model'],
+            'docs': self.env[data['model']].browse(data['ids']),
+            'company_name': self.env['res.company'].browse(form['company_id']).name,
+            'category_name': self.env['risk_management.risk.category'].browse(form.get('risk_category_id')).name,
+            # the most likely occurrence on the first row
+            'rows': list(reversed(list(zip(heatmap._get_criteria_levels('occurrence'), matrix)))),
+            'columns': heatmap._get_criteria_levels('severity'),
+            'total': sum(map(sum, matrix)),
+            'date_from': form.get('date_from'),
+            'date_to': form.get('date_to'),
+        }
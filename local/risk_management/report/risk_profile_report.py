@@ -10,6 +10,8 @@ class RiskProfileWizard(models.TransientModel):
     company_id = fields.Many2one('res.company', string='Company',  default=lambda self: self.env.user.company_id,
                                  required=True)
     ref_asset_id = fields.Reference(selection='_ref_models', string='Asset')
+    by_company = fields.Boolean(string='Breakdown by Company',
+                                help='Add the summary of the risks of each company the user has access to')
 
     @api.model
     def _ref_models(self):
@@ -25,7 +27,8 @@ class RiskProfileWizard(models.TransientModel):
             'form': {
                 'company_id': self.company_id.id,
                 'asset_id': self.ref_asset_id.id if self.ref_asset_id else False,
-                'asset_type': self.ref_asset_id._name if self.ref_asset_id else False
+                'asset_type': self.ref_asset_id._name if self.ref_asset_id else False,
+                'by_company': self.by_company,
             },
         }
         return self.env.ref('risk_management.action_risk_profile_report').report_action(self, data=data)
@@ -39,23 +42,15 @@ class RiskProfileReport(models.AbstractModel):
         company_id = data['form']['company_id']
         asset_id = data['form']['asset_id']
         asset_type = data['form']['asset_type']
-        risks = self.env['risk_management.business_risk'].search([('company_id', '=', company_id)])
-        if asset_id:
-            asset_repr = asset_type + ',' + str(asset_id)  # asset representation in risk model
-            risks = risks.search([('asset', '=', asset_repr)])
-        profile_summary = {
-            'total_num': len(risks),
-            'total_threat_num': len(risks.filtered(lambda r: r.risk_type == 'T')),
-            'total_opp_num': len(risks.filtered(lambda r: r.risk_type == 'O')),
-            'confirmed_num': len(risks.filtered('is_confirmed')),
-            'confirmed_threat_num': len(risks.filtered('is_confirmed').filtered(lambda r: r.risk_type == 'T')),
-            'confirmed_opp_num': len(risks.filtered('is_confirmed').filtered(lambda r: r.risk_type == 'O')),
-            'unacceptable_num': len(risks.filtered(lambda r: r.status == 'N')),
-            'unacceptable_threat_num': len(risks.filtered(lambda r: r.status == 'N').filtered(
-                lambda r: r.risk_type == 'T')),
-            'unacceptable_opp_num': len(risks.filtered(lambda r: r.status == 'N').filtered(
-                lambda r: r.risk_type == 'O')),
-        }
+        asset_domain = [('asset_model', '=', asset_type), ('asset_res_id', '=', asset_id)] if asset_id else []
+        domain = [('company_id', '=', company_id)] + asset_domain
+        risk_model = self.env['risk_management.business_risk']
+        risks = risk_model.search(domain)
+        company_summaries = []
+        if data['form'].get('by_company'):
+            summaries = risk_model._get_profile_summary(asset_domain, by_company=True)
+            company_summaries = [(company, summaries[company.id]) for company in
+                                 self.env['res.company'].browse(list(summaries)).sorted('name')]
         return {
             'doc_ids': data['ids'],
             'doc_model': data['model'],
@@ -64,7 +59,8 @@ class RiskProfileReport(models.AbstractModel):
             'company_name': self.env['res.company'].browse(company_id).name,
             'asset_name': self.env[asset_type].browse(asset_id).name if asset_type else False,
             'asset_type': self.env[asset_type].browse(asset_id)._description if asset_type else False,
-            'summary': profile_summary
+            'summary': risk_model._get_profile_summary(domain),
+            'company_summaries': company_summaries,
         }
 
 
@@ -3,12 +3,14 @@ odoo.define('risk_management.timeline_graph', function (require) {
     require('web.dom_ready');
     var core = require('web.core');
     var _t = core._t;
-    let ajax = require('web.ajax');
     Chart.plugins.unregister(ChartDataLabels);
 
     // risks ids
     let risk_ids = $('#risk-ids').data('risk') || [];
 
+    // maximum number of evaluations drawn on each timeline, older evaluations are downsampled server side
+    const MAX_POINTS = 50;
+
     const render_chart = function (risks) {
         Chart.defaults.global.elements.line.fill = false;
 
@@ -202,45 +204,19 @@ odoo.define('risk_management.timeline_graph', function (require) {
             }
         })
     };
-    // get validated evaluations for risks ids
-    return ajax.rpc('/web/dataset/call', {
-        model: 'risk_management.business_risk.evaluation',
-        method: 'search_read',
-        args: [
-            ['&', ['business_risk_id', 'in', risk_ids],
-                ['is_valid', '=', 1]
-            ],
-            ['business_risk_id', 'eval_date', 'detectability', 'occurrence', 'severity', 'value',
-                'threshold_detectability', 'threshold_occurrence', 'threshold_severity', 'threshold_value'
-            ]
-        ]
+    // get the validated evaluations of the risks, grouped by risk from the more recent to the older
+    return $.ajax({
+        url: '/risk_management/chart_data',
+        data: {ids: risk_ids.join(','), max_points: MAX_POINTS},
+        dataType: 'json',
+        cache: true
     }).then(function (data) {
-        /* groups evaluations by risk's id and name
-        built an array of risk objects implementing this interface:
-        {id: risk_id, name: risk_name, evaluations: evaluationObjects[]}
-
-         */
-        // Firefox 68 - 70 does not seem to be able to parse eval_date into a Date object
-        let evalDataStr = JSON.stringify(data);
-        let evalData = JSON.parse(evalDataStr);
-        let risk_data = [];
-        risk_ids.forEach(function (risk_id) {
-            let risk = {
-                id: risk_id,
-                name: "",
-                evaluations: []
-            };
-            evalData.forEach(function (evaluation) {
+        let risk_data = data.timelines.map(function (risk) {
+            // Firefox 68 - 70 does not seem to be able to parse eval_date into a Date object
+            risk.evaluations.forEach(function (evaluation) {
                 evaluation.eval_date = new Date(evaluation.eval_date);
-                if (evaluation.business_risk_id[0] === risk_id) {
-                    risk.evaluations.push(evaluation);
-                }
-            });
-            // Sort each risk evaluations from more recent to older
-            risk.evaluations.sort(function (a, b) {
-                return b.eval_date - a.eval_date
             });
-            risk_data.push(risk);
+            return risk;
         });
         // Draw charts
         render_chart(risk_data);
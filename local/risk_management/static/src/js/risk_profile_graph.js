@@ -4,7 +4,6 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
     var core = require('web.core');
     var _t = core._t;
     Chart.plugins.unregister(ChartDataLabels);
-    let ajax = require('web.ajax');
     let ids = $(".page").data('ids');
 
     const randomNum = function () {
@@ -24,33 +23,6 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
         return `rgb(${red}, ${green}, ${blue})`;
     };
 
-    const getPieData = function (risks, field) {
-        // Returns an object containing the field labels and number of occurrences for each field
-
-        /* An  array of objects containing the count for each value of field param;
-        interface [{fieldName: count}, ...];
-        example for stage field [{"id. done": 3}, ...]
-         */
-        let fieldLabelCount = _.countBy(risks, function (risk) {
-            return risk[field];
-        });
-        /*
-        An array of arrays [[fieldName, count], ...]
-         */
-        let labelNumPairs = Object.entries(fieldLabelCount);
-
-        return {
-            labels: labelNumPairs.map(function (pair) {
-                return pair[0];
-            }),
-            occurrences: labelNumPairs.map(function (pair) {
-                return pair[1]
-            })
-        }
-
-    };
-
-
     const pieOptions = {
         title: {
             display: true,
@@ -87,23 +59,22 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
         }
     };
 
-    const renderDoughnutCategory = function (risks) {
+    const renderDoughnutCategory = function (cat_data) {
         /*
-        Renders doughnut chart of risk categories
+        Renders doughnut chart of risk categories, from the number of risks per category
          */
-        let cat_data = getPieData(risks, 'risk_info_category');
         let ctx = $("#per-category-pie");
         let data = {
             labels: cat_data.labels,
             label: _t("Risk Category"),
             datasets: [{
-                data: cat_data.occurrences,
+                data: cat_data.counts,
                 backgroundColor: cat_data.labels.map(function () {
                     return randomRGB();
                 })
             }]
         };
-        if (risks.length > 0) {
+        if (cat_data.labels.length > 0) {
             return new Chart(ctx, {
                 plugins: [ChartDataLabels],
                 type: 'pie',
@@ -116,24 +87,23 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
 
     };
 
-    const renderDoughnutStage = function (risks) {
+    const renderDoughnutStage = function (stage_data) {
         /*
-        Renders doughnut chart of risk management stages
+        Renders doughnut chart of risk management stages, from the number of risks per stage
          */
-        let stage_data = getPieData(risks, 'stage');
         let ctx = $("#per-stage-pie");
         let data = {
             labels: stage_data.labels,
             label: _t('Stages'),
             datasets: [{
-                data: stage_data.occurrences,
+                data: stage_data.counts,
                 backgroundColor: stage_data.labels.map(function () {
                     return randomRGB();
                 })
             }]
         };
 
-        if (risks.length > 0) {
+        if (stage_data.labels.length > 0) {
             return new Chart(ctx, {
                 plugins: [ChartDataLabels],
                 type: 'pie',
@@ -145,76 +115,19 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
         }
     };
 
-    const renderBarTreatment = function (tasks) {
+    const renderBarTreatment = function (treatments) {
         /*
-        Renders bar chart of risk treatment tasks' progress
+        Renders bar chart of risk treatment tasks' progress, from the number of sub-tasks per treatment task and stage
          */
-
-        // parent tasks
-        let treatmentTasks = tasks.filter(function (task) {
-            return !task.parent_id;
-        });
-
-        // sub-tasks
-        let treatmentSubTasks = tasks.filter(function (task) {
-            return !!task.parent_id;
-        });
-
-        // add each sub-task to their corresponding parent task's `child_ids` array attribute
-        treatmentTasks = treatmentTasks.map(function (task) {
-            task.child_ids = [];
-            treatmentSubTasks.forEach(function (tst) {
-                if (tst.parent_id[0] === task.id) {
-                    task.child_ids.push(tst);
-                }
-            });
-            return task;
-        });
-        // filter out task whose child_ids attribute is an empy array
-        treatmentTasks = treatmentTasks.filter(function (task) {
-            return task.child_ids.length > 0;
-        });
-        // bar chart labels
-        let labels = treatmentTasks.map(function (task) {
-            return task.business_risk_id[1];
-        });
-
-        let stageCounts = treatmentTasks.map(function (task) {
-            return _.countBy(task.child_ids, function (child) {
-                return child.stage_id[1];
-            });
-        });
+        let labels = treatments.labels;
 
         // bar chart datasets
-        let datasets = [];
-
-        // common attribute values for all datasets
-        let baseDateset = {};
-
-        // Build datasets
-        stageCounts.forEach(function (counts, idx, arr) {
-            let stages = Object.keys(counts);
-            stages.forEach(function (stage) {
-                let currentDataset = _.find(datasets, {
-                    'label': stage
-                });
-                if (currentDataset === undefined) {
-                    // the dataset does not exist yet in the datasets array; Construct the new dataset and add it to datasets
-                    let dataArr = new Array(arr.length).fill(0);
-                    dataArr[idx] = counts[stage];
-                    datasets.push(
-                        Object.assign({
-                            label: stage,
-                            data: dataArr,
-                            backgroundColor: randomRGB()
-                        }, baseDateset)
-                    );
-                } else {
-
-                    currentDataset.data[idx] = counts[stage];
-                }
-            })
-
+        let datasets = treatments.datasets.map(function (dataset) {
+            return {
+                label: dataset.label,
+                data: dataset.data,
+                backgroundColor: randomRGB()
+            };
         });
 
         let options = {
@@ -251,7 +164,7 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
 
         let ctx = $("#treatment-task-bar");
 
-        if (tasks.length > 0) {
+        if (labels.length > 0) {
             return new Chart(ctx, {
                 type: 'bar',
                 data: {
@@ -265,33 +178,17 @@ odoo.define('risk_management.risk_profile_graph', function (require) {
         }
     };
 
-    const renderGraphs = function (risks, tasks) {
-        renderDoughnutCategory(risks);
-        renderDoughnutStage(risks);
-        renderBarTreatment(tasks)
+    const renderGraphs = function (chartData) {
+        renderDoughnutCategory(chartData.categories);
+        renderDoughnutStage(chartData.stages);
+        renderBarTreatment(chartData.treatments)
     };
 
-    return ajax.rpc('/web/dataset/call', {
-        model: 'risk_management.business_risk',
-        method: 'search_read',
-        args: [
-            [
-                ['id', 'in', ids]
-            ],
-            ['name', 'risk_type', 'risk_info_category', 'stage', 'treatment_task_id']
-        ]
-    }).then(function (risk_data) {
-        ajax.rpc('/web/dataset/call', {
-            model: 'project.task',
-            method: 'search_read',
-            args: [
-                ['|', ['business_risk_id', 'in', ids],
-                    ['parent_id.business_risk_id', 'in', ids]
-                ],
-                ['id', 'business_risk_id', 'name', 'parent_id', 'child_ids', 'stage_id']
-            ]
-        }).then(function (task_data) {
-            renderGraphs(risk_data, task_data);
-        });
-    })
+    // the series are aggregated server side, and revalidated against their ETag by the browser cache
+    return $.ajax({
+        url: '/risk_management/chart_data',
+        data: {ids: (ids || []).join(',')},
+        dataType: 'json',
+        cache: true
+    }).then(renderGraphs);
 });
\ No newline at end of file
@@ -1 +1 @@
-from . import test_process, test_risks, common
+from . import test_process, test_risks, test_benchmark, common
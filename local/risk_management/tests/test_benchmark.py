@@ -0,0 +1,74 @@
+from .common import TestRiskReportCases
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# sizes of the risk register the queries of an evaluation are counted against: the count must not grow with the
+# register, the duration is only logged, the register being too small in a test database for it to be significant
+REGISTER_SIZES = (25, 250)
+
+
+class TestPriorityBenchmark(TestRiskReportCases):
+    """Queries of an evaluation as the risk register grows: ranking the priorities is a single set-based statement,
+    so evaluating a risk must cost the same number of queries whatever the size of the register."""
+
+    def setUp(self):
+        super(TestPriorityBenchmark, self).setUp()
+        self.business_risk = self.env['risk_management.business_risk'].with_context(tracking_disable=True)
+        self.risk_info = self.env['risk_management.risk.info']
+        self.register_size = self.business_risk.with_context(active_test=False).search_count([])
+
+    def _grow_register(self, size):
+        """Adds risks to the register until it holds `size` risks"""
+        risk = self.business_risk
+        for num in range(self.register_size, size):
+            info = self.risk_info.create({
+                'risk_category_id': self.ref('risk_management.risk_cat_1'),
+                'name': 'Benchmark risk %d' % num,
+                'description': '<p>Benchmark risk %d</p>' % num
+            })
+            risk = self.business_risk.create({
+                'risk_info_id': info.id,
+                'detectability': '3',
+                'occurrence': str(num % 5 + 1),
+                'severity': '2'
+            })
+        self.register_size = max(self.register_size, size)
+        return risk
+
+    def _evaluate(self, risk):
+        """Evaluates `risk`; returns the number of queries and the time it took"""
+        cr = self.env.cr
+        query_count = cr.sql_log_count
+        start = time.time()
+        self.env['risk_management.business_risk.evaluation'].create({
+            'business_risk_id': risk.id,
+            'detectability': '2',
+            'occurrence': '4',
+            'severity': '5'
+        })
+        return cr.sql_log_count - query_count, time.time() - start
+
+    def test_evaluation_query_count(self):
+        # warm up the caches
+        self._evaluate(self._grow_register(REGISTER_SIZES[0]))
+        query_counts = []
+        for size in REGISTER_SIZES:
+            risk = self._grow_register(size + 1)
+            query_count, duration = self._evaluate(risk)
+            _logger.info("Risk evaluation with %d risks in the register: %d queries, %.1f ms",
+                         self.register_size, query_count, duration * 1000)
+            query_counts.append(query_count)
+        for size, query_count in zip(REGISTER_SIZES[1:], query_counts[1:]):
+            self.assertLessEqual(query_count, query_counts[0],
+                                 "Evaluating a risk takes more queries with %d risks in the register than with %d"
+                                 % (size, REGISTER_SIZES[0]))
+
+        # priorities are still a ranking of the whole register of each company
+        all_risks = self.business_risk.with_context(active_test=False)
+        for group in all_risks.read_group([], ['company_id'], ['company_id']):
+            company_risks = all_risks.search(group['__domain'])
+            if company_risks.mapped('company_id').risk_priority_scope == 'asset':
+                continue
+            self.assertEqual(sorted(company_risks.mapped('priority')), list(range(1, group['company_id_count'] + 1)))
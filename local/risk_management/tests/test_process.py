@@ -1,5 +1,8 @@
 from .common import TestProcessCases, TestProcessIOCases
 from odoo import exceptions
+from odoo.addons.risk_management.models.risk_propagation import numpy, propagate_exposure
+import base64
+import unittest
 
 
 class TestBusinessProcess(TestProcessCases):
@@ -38,6 +41,64 @@ class TestBusinessProcess(TestProcessCases):
         })
         self.assertFalse(self.accounting.is_core)
 
+    def test_process_graph(self):
+        customer_id = self.ref('risk_management.process_partner_cat_customer')
+        invoice_id = self.ref('risk_management.customer_invoice_io')
+        impact = self.sales.get_impact()
+        affected = {proc['id']: proc['data_ids'] for proc in impact['processes']}
+        self.assertEqual(affected[self.delivery.id], [invoice_id])
+        self.assertEqual(affected[self.accounting.id], [invoice_id])
+        self.assertNotIn(self.hiring.id, affected)
+        self.assertIn(customer_id, [partner['id'] for partner in impact['partners']])
+
+        # the graph cached is cleared by the new data
+        payslip = self.env['risk_management.business_process.input_output'].create({
+            'name': 'Payroll budget', 'business_process_id': self.accounting.id,
+            'user_process_ids': [(4, self.hiring.id)]})
+        affected = {proc['id']: proc['data_ids'] for proc in self.sales.get_impact()['processes']}
+        self.assertEqual(affected[self.hiring.id], [invoice_id, payslip.id])
+        self.assertIn(self.sales.id, [proc['id'] for proc in self.hiring.get_impact('upstream')['processes']])
+        self.assertEqual([(step['kind'], step['id']) for step in self.sales.get_path(self.hiring.id)],
+                         [('process', self.sales.id), ('data', invoice_id), ('process', self.accounting.id),
+                          ('data', payslip.id), ('process', self.hiring.id)])
+        self.assertEqual(self.hiring.get_path(self.sales.id), [])
+
+        graph = self.env['risk_management.business_process'].export_process_graph(self.sales.company_id.id)
+        self.assertIn({'source': 'process_%d' % self.accounting.id, 'target': 'data_%d' % payslip.id},
+                      graph['links'])
+        self.assertIn('partner_%d' % customer_id, [node['id'] for node in graph['nodes']])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_propagate_exposure(self):
+        # 0 -> 1 -> 2, and 0 -> 2, the exposure of 0 being split in halves; 3 is isolated
+        exposure = propagate_exposure(numpy.array([1.0, 0.0, 2.0, 3.0]), numpy.array([0, 1, 0]),
+                                      numpy.array([1, 2, 2]), numpy.array([0.5, 1.0, 0.5]), damping=0.5)
+        self.assertEqual(exposure.round(4).tolist(), [1.0, 0.25, 2.375, 3.0])
+        # a cycle converges
+        exposure = propagate_exposure(numpy.array([1.0, 1.0]), numpy.array([0, 1]), numpy.array([1, 0]),
+                                      numpy.array([1.0, 1.0]), damping=0.5)
+        self.assertEqual(exposure.round(4).tolist(), [2.0, 2.0])
+
+        # a threat to sales at twice its threshold
+        risk = self.env['risk_management.business_risk'].create({
+            'risk_info_id': self.ref('risk_management.risk_info_1'),
+            'ref_asset_id': '%s,%s' % (self.sales._name, self.sales.id),
+            'detectability': '2', 'occurrence': '2', 'severity': '2'})
+        self.env['risk_management.business_risk.evaluation'].create({
+            'business_risk_id': risk.id, 'detectability': '4', 'occurrence': '2', 'severity': '2'})
+        self.assertEqual((risk.latest_level_value, risk.threshold_value), (16, 8))
+
+        proc = self.env['risk_management.business_process']
+        proc.compute_risk_exposure(damping=0.5)
+        self.assertEqual((self.sales.risk_exposure, self.sales.propagated_risk_exposure), (2.0, 2.0))
+        # sales pass half of its exposure on to delivery and half to accounting, delivery all of it to accounting:
+        # 0.5 * (0.5 * 2.0 + 0.5 * 0.5 * 2.0)
+        self.assertEqual((self.accounting.risk_exposure, self.accounting.propagated_risk_exposure), (0.0, 0.75))
+        for rec in proc.search([]):
+            self.assertGreaterEqual(rec.propagated_risk_exposure, rec.risk_exposure)
+        # the hiring process uses no data
+        self.assertEqual((self.hiring.risk_exposure, self.hiring.propagated_risk_exposure), (0.0, 0.0))
+
     def test_compute_sequence(self):
         self.assertEqual(self.sales.sequence, 10)
         self.assertEqual(self.delivery.sequence, 11)
@@ -75,6 +136,22 @@ class TestBusinessProcess(TestProcessCases):
             'risk_management.project_charter_dev_process'))
         self.assertEqual(pmp.sequence, 1100)
 
+    def test_process_ranks(self):
+        """The processes of a company are ranked at once from their data-flow graph"""
+        proc = self.env['risk_management.business_process']
+        company_ids = self.sales.company_id.ids
+        ranks = proc._get_process_ranks(company_ids)
+        # the closest customer ranks the process, not the longest path to it
+        self.assertEqual(ranks[self.accounting.id], ranks[self.sales.id] + 1)
+
+        # a new management process with no output is ranked after the operations, and its peers are ranked again
+        plan = proc.create({'name': 'Strategic Planning', 'process_type': 'M'})
+        self.assertEqual(plan.sequence, max(ranks[pid] for pid in ranks if proc.browse(pid).is_core or
+                                            proc.browse(pid).process_type == 'O') + 150)
+        ranks = proc._get_process_ranks(company_ids)
+        for process in proc.search([('company_id', 'in', company_ids)]):
+            self.assertEqual(process.sequence, ranks[process.id])
+
     def test_write_color(self):
         """When a process color is changed, every process with the same type has their color changed to the same
         color. """
@@ -133,6 +210,42 @@ class TestBusinessProcessIO(TestProcessIOCases):
         self.assertTrue(self.delivery_note.is_customer_voice)
         self.assertFalse(self.project_charter.is_customer_voice)
 
+    def test_compute_attachments(self):
+        attachment = self.env['ir.attachment']
+        docs = attachment
+        for io, name in ((self.quote_request, 'Quote template'), (self.quote_request, 'Quote checklist'),
+                         (self.customer_invoice, 'Invoice template')):
+            docs |= attachment.create({'name': name, 'datas': base64.b64encode(b'content'),
+                                       'res_model': io._name, 'res_id': io.id})
+        ios = self.quote_request | self.customer_invoice | self.project_charter
+        ios.invalidate_cache(['attachment_ids', 'doc_count'])
+        self.assertEqual(ios.mapped('doc_count'), [2, 1, 0])
+        self.assertEqual(self.quote_request.attachment_ids, docs[:2])
+        self.assertEqual(self.customer_invoice.attachment_ids, docs[2])
+
+        method = self.env['risk_management.business_process.method'].create({
+            'name': 'Invoicing policy', 'business_process_id': self.sales.id,
+            'output_ref_id': self.customer_invoice.id})
+        self.assertEqual(method.doc_count, 1)
+        self.assertEqual(method.attachment_ids, docs[2])
+        self.assertEqual(attachment.search(method.attachment_tree_view()['domain']), docs[2])
+
+    def test_customer_voice_closure(self):
+        proc_io = self.env['risk_management.business_process.input_output']
+        relay = proc_io.create({'name': 'Delivery report', 'business_process_id': self.accounting.id,
+                                'ref_input_ids': [(4, self.delivery_note.id)]})
+        summary = proc_io.create({'name': 'Delivery summary', 'business_process_id': self.fin.id,
+                                  'ref_input_ids': [(4, relay.id)]})
+        self.assertTrue(summary.is_customer_voice)
+        voices = proc_io.search([('is_customer_voice', '=', True)])
+        self.assertIn(summary, voices)
+        self.assertNotIn(self.project_charter, voices)
+        # cutting the chain upstream clears the flag downstream
+        relay.write({'ref_input_ids': [(5,)]})
+        self.assertFalse(relay.is_customer_voice)
+        self.assertFalse(summary.is_customer_voice)
+        self.assertEqual(set(proc_io._get_customer_voice_ids()), set(voices.ids) - {relay.id, summary.id})
+
     def test_constraints(self):
         with self.assertRaises(exceptions.ValidationError) as cm:
             self.quote_request.write({'ref_input_ids': [(4, self.customer_invoice.id)]})
@@ -146,6 +259,42 @@ class TestBusinessProcessIO(TestProcessIOCases):
             self.delivery_note.write({'user_process_ids': [(4, self.sales.id)]})
         self.assertIsInstance(cm.exception, exceptions.ValidationError)
 
+    def test_customer_voice_cycles(self):
+        proc_io = self.env['risk_management.business_process.input_output']
+        sales_journal = proc_io.browse(self.ref('risk_management.sales_journal_io'))
+        proc = self.env['risk_management.business_process']
+        company_id = self.sales.company_id.id
+        # sales > accounting > finance > sales
+        with self.assertRaises(exceptions.ValidationError), self.env.cr.savepoint():
+            proc_io.create({'name': 'Sales forecast', 'business_process_id': self.fin.id,
+                            'ref_input_ids': [(4, sales_journal.id)], 'user_process_ids': [(4, self.sales.id)]})
+        # the rejected data is not left in the cached graph
+        self.assertEqual(proc.validate_process_map(company_id), [])
+
+        # sales > accounting > finance > sales again, the data passed on to sales relaying the customer voice only
+        # once the data it references does
+        ledger = proc_io.create({'name': 'Customer ledger', 'business_process_id': self.accounting.id,
+                                 'user_process_ids': [(4, self.fin.id)]})
+        forecast = proc_io.create({'name': 'Sales forecast', 'business_process_id': self.fin.id,
+                                   'ref_input_ids': [(4, ledger.id)], 'user_process_ids': [(4, self.sales.id)]})
+        self.assertFalse(forecast.is_customer_voice)
+        self.assertEqual(proc.validate_process_map(company_id), [])
+        with self.assertRaises(exceptions.ValidationError), self.env.cr.savepoint():
+            ledger.write({'ref_input_ids': [(4, self.customer_invoice.id)]})
+        self.assertFalse(forecast.is_customer_voice)
+        self.assertEqual(proc.validate_process_map(company_id), [])
+        # bypass the constraints, as an import would
+        self.env.cr.execute('INSERT INTO risk_management_input_ids_user_ids_rel (input_id, business_process_id) '
+                            'VALUES (%s, %s)', (sales_journal.id, self.sales.id))
+        proc.clear_caches()
+        cycles = proc.validate_process_map(company_id)
+        self.assertTrue(cycles)
+        for cycle in cycles:
+            self.assertEqual(cycle[0], cycle[-1])
+            steps = [(step['kind'], step['id']) for step in cycle]
+            self.assertIn(('data', sales_journal.id), steps)
+            self.assertIn(('process', self.accounting.id), steps)
+
 
 class TestSecurity(TestProcessIOCases):
     def setUp(self):
@@ -1,6 +1,13 @@
 from .common import TestRiskReportCases
-from odoo import exceptions
+from odoo import exceptions, fields
+from odoo.addons.risk_management.models.risk_simulation import numpy
+from odoo.addons.risk_management.models.risk_utils import downsample
+import base64
+import csv
+import datetime
+import io
 import logging
+import unittest
 
 _logger = logging.getLogger(__name__)
 
@@ -38,6 +45,29 @@ class TestBusinessRisk(TestRiskReportCases):
             self.assertEqual(self.business_risk2.priority, 1)
             self.assertEqual(risk.priority, 2)
 
+    def test_priority_partitions(self):
+        """Priorities are ranked within each company, or within each asset when the company's scope is `asset`"""
+        br = self.env['risk_management.business_risk']
+        company = self.env['res.company'].create({'name': 'Subsidiary'})
+        risk1 = br.create({'risk_info_id': self.risk_info1.id, 'company_id': company.id})
+        risk2 = br.create({'risk_info_id': self.risk_info2.id, 'company_id': company.id,
+                           'ref_asset_id': '%s,%s' % (self.sales._name, self.sales.id)})
+        risk3 = br.create({'risk_info_id': self.risk_info3.id, 'company_id': company.id,
+                           'ref_asset_id': '%s,%s' % (self.sales._name, self.sales.id)})
+        self.assertEqual((risk1 | risk2 | risk3).mapped('priority'), [1, 2, 3])
+
+        # evaluating a risk of the subsidiary does not re-rank the risks of the other companies
+        priority = self.business_risk1.priority
+        risk3.write({'detectability': '1', 'occurrence': '1', 'severity': '1'})
+        risk3.write({'evaluation_ids': [(0, False, {'detectability': '5', 'occurrence': '5', 'severity': '5'})]})
+        self.assertEqual(risk3.priority, 1)
+        self.assertEqual(self.business_risk1.priority, priority)
+
+        company.risk_priority_scope = 'asset'
+        self.assertEqual(risk1.priority, 1)
+        self.assertEqual(risk3.priority, 1)
+        self.assertEqual(risk2.priority, 2)
+
     def test_compute_stage(self):
         """Tests the evolution of the risk through the different stages of risk management"""
         self.assertEqual(self.business_risk1.state, '1')
@@ -77,6 +107,10 @@ class TestBusinessRisk(TestRiskReportCases):
         self.assertEqual(self.business_risk1.state, '5')
         task1.stage_id = self.ref('risk_management.risk_treatment_stage_3')
         self.assertEqual(self.business_risk1.state, '6')
+        # the stage is stored, hence searchable
+        self.assertIn(self.business_risk1, self.env['risk_management.business_risk'].search([('state', '=', '6')]))
+        task1.active = False
+        self.assertEqual(self.business_risk1.state, '4')
 
     def test_compute_status(self):
         """Tests the determination of the risk status"""
@@ -112,6 +146,59 @@ class TestBusinessRisk(TestRiskReportCases):
         self.assertEqual(self.business_risk1.status, 'A')
         self.assertFalse(self.business_risk1.treatment_task_id.active)
 
+    def test_search_status(self):
+        """Searching on `active` and `status` agrees with their computed values"""
+        br = self.env['risk_management.business_risk']
+        self.business_risk1.write({'detectability': '3', 'occurrence': '4', 'severity': '3'})
+        self.business_risk1.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        self.business_risk2.write({'detectability': '3', 'occurrence': '4', 'severity': '3'})
+        self.business_risk2.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        self.assertEqual(self.business_risk1.status, 'N')
+        self.assertEqual(self.business_risk2.status, 'A')
+        self.assertIn(self.business_risk1, br.search([('status', '=', 'N')]))
+        self.assertNotIn(self.business_risk1, br.search([('status', '!=', 'N')]))
+        self.assertIn(self.business_risk2, br.search([('status', 'in', ['A', 'U'])]))
+        self.assertNotIn(self.business_risk2, br.search([('status', '=', 'U')]))
+
+        self.business_risk1.active = False
+        self.assertNotIn(self.business_risk1, br.search([]))
+        inactive = br.search([('active', '=', False)])
+        self.assertIn(self.business_risk1, inactive)
+        self.assertNotIn(self.business_risk2, inactive)
+        self.assertIn(self.business_risk1, br.with_context(active_test=False).search([('status', '=', 'U')]))
+
+    def test_cron_date_rollover(self):
+        """The nightly rollover refreshes the risks whose review date, or whose evaluation's, was crossed"""
+        self.business_risk1.write({'detectability': '3', 'occurrence': '4', 'severity': '3'})
+        self.business_risk1.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        self.assertEqual(self.business_risk1.latest_level_value, 45)
+        self.assertTrue(self.business_risk1.treatment_task_id.active)
+        self.business_risk2.is_confirmed = True
+        self.assertEqual(self.business_risk2.state, '2')
+
+        # the evaluation of risk 1 and risk 2 itself were due for review yesterday
+        yesterday = fields.Date.to_string(fields.Date.from_string(fields.Date.today()) - datetime.timedelta(days=1))
+        last_week = fields.Date.to_string(fields.Date.from_string(fields.Date.today()) - datetime.timedelta(days=7))
+        self.env.cr.execute("UPDATE risk_management_business_risk_evaluation SET review_date = %s "
+                            "WHERE business_risk_id = %s", (yesterday, self.business_risk1.id))
+        self.env.cr.execute("UPDATE risk_management_business_risk SET report_date = %s, review_date = %s "
+                            "WHERE id = %s", (last_week, yesterday, self.business_risk2.id))
+        self.env.invalidate_all()
+        self.env['ir.config_parameter'].set_param('risk_management.date_rollover_last_run', last_week)
+
+        self.env['risk_management.business_risk']._cron_date_rollover()
+        self.assertEqual(self.business_risk1.latest_level_value, 0)
+        self.assertFalse(self.business_risk1.treatment_task_id.active)
+        self.assertEqual(self.business_risk2.stage, 'New')
+        self.assertEqual(self.env['ir.config_parameter'].get_param('risk_management.date_rollover_last_run'),
+                         fields.Date.context_today(self.business_risk1))
+
     def test_compute_latest_eval(self):
         self.business_risk1.write({
             'evaluation_ids': [(0, False, {
@@ -133,6 +220,25 @@ class TestBusinessRisk(TestRiskReportCases):
         # risk level of an opportunity
         self.assertEqual(self.business_risk2.latest_level_value, 75)
 
+    def test_latest_evaluation(self):
+        """The latest evaluation pointer follows the evaluations created and deleted"""
+        self.assertFalse(self.business_risk1.latest_evaluation_id)
+        evaluation = self.env['risk_management.business_risk.evaluation']
+        first = evaluation.create({
+            'business_risk_id': self.business_risk1.id, 'detectability': '1', 'occurrence': '3', 'severity': '5'
+        })
+        self.assertEqual(self.business_risk1.latest_evaluation_id, first)
+        second = evaluation.sudo(self.risk_manager).create({
+            'business_risk_id': self.business_risk1.id, 'detectability': '2', 'occurrence': '3', 'severity': '5'
+        })
+        self.assertEqual(self.business_risk1.latest_evaluation_id, second)
+        self.assertEqual(self.business_risk1.latest_level_value, 30)
+        self.assertEqual(self.business_risk1.last_evaluator_id, self.risk_manager)
+
+        second.sudo().unlink()
+        self.assertEqual(self.business_risk1.latest_evaluation_id, first)
+        self.assertEqual(self.business_risk1.latest_level_value, 15)
+
     def test_create(self):
         """- If a risk that already exist in the database is reported, two things: if it is active, return an error,
         otherwise reactivate the risk
@@ -155,10 +261,394 @@ class TestBusinessRisk(TestRiskReportCases):
         self.assertTrue(self.business_risk1.active)
         self.assertTrue(bool(self.business_risk1.activity_ids))
 
+    def test_create_batch(self):
+        """Risks reported in batch are created, reactivated or reported as duplicates row by row"""
+        self.business_risk2.active = False
+        outcomes = self.env['risk_management.business_risk'].create_batch([
+            {'risk_info_id': self.risk_info1.id},
+            {'risk_info_id': self.business_risk2.risk_info_id.id, 'risk_type': self.business_risk2.risk_type},
+            {'risk_info_id': self.risk_info3.id, 'risk_type': 'O'},
+            {'risk_info_id': self.risk_info3.id, 'risk_type': 'O'},
+            {'risk_type': 'O'},
+        ])
+        self.assertEqual([outcome['status'] for outcome in outcomes],
+                         ['duplicate', 'reactivated', 'created', 'duplicate', 'error'])
+        self.assertEqual(outcomes[0]['id'], self.business_risk1.id)
+        self.assertEqual(outcomes[1]['id'], self.business_risk2.id)
+        self.assertEqual(outcomes[3]['id'], outcomes[2]['id'])
+        self.assertTrue(self.business_risk2.active)
+
+        created = self.env['risk_management.business_risk'].browse(outcomes[2]['id'])
+        self.assertEqual(created.risk_info_id, self.risk_info3)
+        self.assertTrue(bool(created.activity_ids))
+        self.assertTrue(bool(self.business_risk2.activity_ids))
+        self.assertIn(self.env.ref('risk_management.mail_channel_risk_management_risk'),
+                      created.message_follower_ids.mapped('channel_id'))
+
+    def test_create_batch_defaults(self):
+        """The risks are looked up and created with the defaults of the context"""
+        company = self.env['res.company'].create({'name': 'Subsidiary'})
+        br = self.env['risk_management.business_risk'].with_context(default_company_id=company.id)
+        risk = br.create({'risk_info_id': self.business_risk1.risk_info_id.id,
+                          'risk_type': self.business_risk1.risk_type})
+        self.assertNotEqual(risk, self.business_risk1)
+        self.assertEqual(risk.company_id, company)
+        outcome = br.create_batch([{'risk_info_id': risk.risk_info_id.id, 'risk_type': risk.risk_type}])[0]
+        self.assertEqual((outcome['status'], outcome['id']), ('duplicate', risk.id))
+
+    def test_risks_by_asset(self):
+        """The risks of many assets are looked up at once, through the asset reference columns"""
+        br = self.env['risk_management.business_risk']
+        processes = self.sales | self.delivery
+        risk = br.create({'risk_info_id': self.risk_info3.id,
+                          'ref_asset_id': '%s,%s' % (self.sales._name, self.sales.id)})
+        self.assertEqual((risk.asset_model, risk.asset_res_id), (self.sales._name, self.sales.id))
+
+        risks_by_asset = br._get_risks_by_asset(processes)
+        self.assertEqual(risks_by_asset[self.sales.id], risk)
+        self.assertFalse(risks_by_asset[self.delivery.id])
+        self.assertEqual(processes.mapped('risk_count'), [1, 0])
+
+        risk.ref_asset_id = False
+        self.assertFalse(risk.asset_model)
+        self.assertFalse(br._get_risks_by_asset(processes)[self.sales.id])
+
+    def test_grouped_counters(self):
+        """The counters of the catalog are maintained on insert and delete, and searchable"""
+        category = self.env['risk_management.risk.category'].create({'name': 'Weather risks'})
+        self.assertEqual(category.risk_count, 0)
+        info = self.env['risk_management.risk.info'].create({'risk_category_id': category.id,
+                                                             'name': 'Risk of rain',
+                                                             'description': 'It might rain this week'})
+        self.assertEqual(category.risk_count, 1)
+        self.assertIn(category, self.env['risk_management.risk.category'].search([('risk_count', '=', 1)]))
+        self.assertEqual(info.occurrences, 0)
+
+        risk = self.env['risk_management.business_risk'].create({'risk_info_id': info.id})
+        self.assertEqual(info.occurrences, 1)
+        self.assertIn(info, self.env['risk_management.risk.info'].search([('occurrences', '>', 0)]))
+        risk.unlink()
+        self.assertEqual(info.occurrences, 0)
+
+    def test_name_search(self):
+        """Risks are searched by name or description through the search index, keeping the `name_search` contract"""
+        risk_info = self.env['risk_management.risk.info']
+        category = self.env['risk_management.risk.category'].create({'name': 'Weather risks'})
+        flood = risk_info.create({'risk_category_id': category.id, 'name': 'Risk of flooding',
+                                  'description': '<p>The river banks might overflow</p>'})
+        drought = risk_info.create({'risk_category_id': category.id, 'name': 'Risk of drought',
+                                    'description': '<p>The river might dry up</p>'})
+
+        weather = [('risk_category_id', '=', category.id)]
+        self.assertEqual(risk_info.name_search('flooding', weather), [(flood.id, flood.short_name)])
+        self.assertEqual([res[0] for res in risk_info.name_search('overflow', weather)], [flood.id])
+        self.assertEqual(set(res[0] for res in risk_info.name_search('river', weather)), {flood.id, drought.id})
+        self.assertEqual(len(risk_info.name_search('river', weather, limit=1)), 1)
+        self.assertNotIn(drought.id, [res[0] for res in risk_info.name_search('drought', operator='not ilike')])
+
+        # the index follows the changes of the risks
+        drought.write({'description': '<p>The wells might dry up</p>'})
+        self.assertEqual([res[0] for res in risk_info.name_search('wells', weather)], [drought.id])
+        risk_info.refresh_search_index()
+        self.assertEqual([res[0] for res in risk_info.name_search('wells', weather)], [drought.id])
+
+        # the risks missing from the index are still found, by the plain search
+        self.env.cr.execute('DELETE FROM risk_management_risk_info_search WHERE risk_info_id = %s', (flood.id,))
+        self.assertEqual(risk_info.name_search('flooding', weather), [(flood.id, flood.short_name)])
+
+    def test_profile_summary(self):
+        """The summary of the risk profile is counted in one grouped query, for a company or for each company"""
+        br = self.env['risk_management.business_risk']
+        company = self.env['res.company'].create({'name': 'Subsidiary', 'parent_id': self.env.user.company_id.id})
+        br.create({'risk_info_id': self.risk_info3.id, 'company_id': company.id, 'risk_type': 'O'})
+        self.business_risk1.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+        self.business_risk1.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        self.assertEqual(self.business_risk1.status, 'N')
+
+        domain = [('company_id', '=', self.env.user.company_id.id)]
+        risks = br.search(domain)
+        summary = br._get_profile_summary(domain)
+        threats = risks.filtered(lambda r: r.risk_type == 'T')
+        opportunities = risks.filtered(lambda r: r.risk_type == 'O')
+        self.assertEqual((summary['total_num'], summary['total_threat_num'], summary['total_opp_num']),
+                         (len(risks), len(threats), len(opportunities)))
+        self.assertEqual(summary['confirmed_num'], len(risks.filtered('is_confirmed')))
+        self.assertEqual(summary['confirmed_threat_num'], len(threats.filtered('is_confirmed')))
+        self.assertEqual(summary['unacceptable_num'], len(risks.filtered(lambda r: r.status == 'N')))
+        self.assertEqual(summary['unacceptable_threat_num'], len(threats.filtered(lambda r: r.status == 'N')))
+        self.assertEqual(summary['unacceptable_opp_num'], 0)
+
+        summaries = br._get_profile_summary(by_company=True)
+        self.assertEqual(summaries[self.env.user.company_id.id], summary)
+        self.assertEqual((summaries[company.id]['total_num'], summaries[company.id]['total_opp_num']), (1, 1))
+
+    def test_activity_steps(self):
+        """Each step of the risk management process closes the activities it supersedes and schedules its own"""
+        br = self.env['risk_management.business_risk']
+        risks = br.browse([outcome['id'] for outcome in br.create_batch([
+            {'risk_info_id': self.risk_info3.id},
+            {'risk_info_id': self.risk_info3.id, 'risk_type': 'O'},
+        ])])
+        self.assertEqual(set(risks.mapped('activity_ids.risk_step')), {'confirm'})
+        self.assertEqual(len(risks.mapped('activity_ids')), 2)
+
+        risks.write({'is_confirmed': True})
+        self.assertEqual(set(risks.mapped('activity_ids.risk_step')), {'evaluate'})
+        self.assertEqual(len(risks.mapped('activity_ids')), 2)
+
+        risks.write({'detectability': '3', 'occurrence': '4', 'severity': '3'})
+        risks[0].write({'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]})
+        self.assertEqual(sorted(risks[0].activity_ids.mapped('risk_step')), ['evaluate', 'validate'])
+        risks[0].evaluation_ids.write({'is_valid': True})
+        self.assertEqual(risks[0].status, 'N')
+        self.assertEqual(risks[0].activity_ids.mapped('risk_step'), ['treat'])
+        self.assertEqual(risks[1].activity_ids.mapped('risk_step'), ['evaluate'])
+
+    def test_chart_data(self):
+        """The chart series are aggregated server side, and their fingerprint follows the changes of the risks"""
+        br = self.env['risk_management.business_risk']
+        risks = self.business_risk1 | br.create({'risk_info_id': self.risk_info3.id, 'risk_type': 'O'})
+        fingerprint = br._get_chart_fingerprint(risks.ids)
+        self.assertEqual(fingerprint, br._get_chart_fingerprint(risks.ids))
+
+        self.business_risk1.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+        self.business_risk1.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        self.business_risk1.evaluation_ids.write({'is_valid': True})
+        self.assertNotEqual(br._get_chart_fingerprint(risks.ids), fingerprint)
+
+        data = br.get_chart_data(risks.ids)
+        self.assertEqual(sum(data['categories']['counts']), 2)
+        self.assertEqual(sum(data['stages']['counts']), 2)
+        self.assertIn(self.business_risk1.stage, data['stages']['labels'])
+        timelines = {timeline['id']: timeline['evaluations'] for timeline in data['timelines']}
+        self.assertEqual(len(timelines[self.business_risk1.id]), 1)
+        self.assertEqual(timelines[self.business_risk1.id][0]['value'], 45)
+        self.assertFalse(timelines[risks[1].id])
+
+        points = list(range(100))
+        self.assertEqual(downsample(points, 5), [0, 25, 50, 74, 99])
+        self.assertEqual(downsample(points, None), points)
+
+    def test_heatmap(self):
+        """The heat map counts the validated evaluations as they are validated, changed and deleted"""
+        heatmap = self.env['risk_management.risk_heatmap']
+        domain = [('company_id', '=', self.business_risk1.company_id.id),
+                  ('risk_category_id', '=', self.business_risk1.risk_info_id.risk_category_id.id)]
+        before = heatmap.get_matrix(domain)
+        self.business_risk1.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+        self.business_risk1.write({
+            'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '5'})]
+        })
+        evaluation = self.business_risk1.evaluation_ids[0]
+        self.assertEqual(heatmap.get_matrix(domain), before)
+
+        evaluation.is_valid = True
+        matrix = heatmap.get_matrix(domain)
+        self.assertEqual(matrix[2][4], before[2][4] + 1)
+        slices = heatmap.get_slice(domain + [('risk_type', '=', 'T')], ['detectability'])
+        self.assertIn('3', [cell['detectability'] for cell in slices])
+
+        evaluation.write({'severity': '2'})
+        matrix = heatmap.get_matrix(domain)
+        self.assertEqual((matrix[2][4], matrix[2][1]), (before[2][4], before[2][1] + 1))
+
+        cells = heatmap.get_slice(groupby=['company_id', 'risk_category_id', 'occurrence', 'severity', 'period'])
+        heatmap.rebuild()
+        self.assertEqual(heatmap.get_slice(groupby=['company_id', 'risk_category_id', 'occurrence', 'severity',
+                                                    'period']), cells)
+
+        evaluation.unlink()
+        self.assertEqual(heatmap.get_matrix(domain), before)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_simulate_exposure(self):
+        """The exposure of the evaluated risks is simulated by group, reproducibly for a given seed"""
+        br = self.env['risk_management.business_risk']
+        opportunity = br.create({'risk_info_id': self.risk_info3.id, 'risk_type': 'O'})
+        for risk in self.business_risk1 | opportunity:
+            risk.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+            risk.write({'evaluation_ids': [(0, False, {'detectability': '2', 'occurrence': '5', 'severity': '5'})]})
+        domain = [('id', 'in', (self.business_risk1 | opportunity).ids)]
+
+        result = br.simulate_exposure(domain, iterations=2000, seed=42)
+        self.assertEqual((result['risk_count'], result['iterations']), (2, 2000))
+        self.assertEqual([group['group'][0] for group in result['groups']], [self.business_risk1.company_id.id])
+        self.assertEqual(br.simulate_exposure(domain, iterations=2000, seed=42)['portfolio'], result['portfolio'])
+
+        threat = br.simulate_exposure([('id', '=', self.business_risk1.id)], iterations=2000, seed=42)['portfolio']
+        # the threat occurs 90% of the times with an impact of 4 or 5 and a detection factor of 2
+        self.assertTrue(7 < threat['mean'] < 9)
+        self.assertLessEqual(threat['percentiles'][50], threat['percentiles'][99])
+        self.assertEqual(threat['percentiles'][99], 10)
+        self.assertLess(result['portfolio']['mean'], threat['mean'])
+
+    def test_thresholds_preview(self):
+        """New thresholds are previewed without writing anything, then applied in bulk as previewed"""
+        br = self.env['risk_management.business_risk']
+        risks = self.business_risk1 | br.create({'risk_info_id': self.risk_info3.id})
+        for risk in risks:
+            risk.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+            risk.write({'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '4'})]})
+        self.assertEqual(risks.mapped('status'), ['A', 'A'])
+        priorities = {risk.id: risk.priority for risk in br.search([('company_id', '=', risks[0].company_id.id)])}
+
+        diff = risks.preview_thresholds({'severity': '2'})
+        changes = {change['id']: change for change in diff}
+        self.assertEqual(changes[risks[0].id]['threshold_value'], (36, 24))
+        self.assertEqual(changes[risks[0].id]['status'], ('A', 'N'))
+        self.assertEqual(risks.mapped('threshold_value'), [36, 36])
+        self.assertEqual(risks.mapped('severity'), ['3', '3'])
+        for change in diff:
+            self.assertEqual(change['priority'][0], priorities[change['id']])
+
+        self.assertEqual(risks.apply_thresholds({'severity': '2'}), diff)
+        self.assertEqual(risks.mapped('threshold_value'), [24, 24])
+        self.assertEqual(risks.mapped('status'), ['N', 'N'])
+        self.assertEqual(risks.mapped('latest_evaluation_id.threshold_value'), [24, 24])
+        self.assertTrue(all(risks.mapped('treatment_task_id.active')))
+        for change in diff:
+            self.assertEqual(br.browse(change['id']).priority, change['priority'][1])
+        self.assertFalse(risks.preview_thresholds({'severity': '2'}))
+
+    def test_evaluation_batch(self):
+        """A batch of evaluations merges the same-day evaluations and schedules one validation per risk"""
+        br = self.env['risk_management.business_risk']
+        evaluation = self.env['risk_management.business_risk.evaluation']
+        risks = self.business_risk1 | br.create({'risk_info_id': self.risk_info3.id})
+        risks.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+
+        outcomes = evaluation.create_batch([
+            {'business_risk_id': risks[0].id, 'detectability': '3', 'occurrence': '3', 'severity': '2'},
+            {'business_risk_id': risks[1].id, 'detectability': '3', 'occurrence': '3', 'severity': '5'},
+            {'business_risk_id': risks[0].id, 'detectability': '3', 'occurrence': '3', 'severity': '5'},
+            {'detectability': '3'},
+        ])
+        self.assertEqual([outcome['status'] for outcome in outcomes], ['created', 'created', 'merged', 'error'])
+        self.assertEqual(outcomes[0]['id'], outcomes[2]['id'])
+        self.assertEqual(len(risks[0].evaluation_ids), 1)
+        self.assertEqual(risks.mapped('latest_level_value'), [45, 45])
+        for risk in risks:
+            self.assertEqual(sorted(risk.activity_ids.mapped('risk_step')), ['evaluate', 'validate'])
+
+        risks[0].evaluation_ids.is_valid = True
+        outcome = evaluation.create_batch([
+            {'business_risk_id': risks[0].id, 'detectability': '2', 'occurrence': '3', 'severity': '5'}])[0]
+        self.assertEqual((outcome['status'], outcome['id']), ('merged', outcomes[0]['id']))
+        self.assertFalse(risks[0].evaluation_ids.is_valid)
+
+    def test_threshold_cascade(self):
+        """A criteria write on many risks propagates their thresholds and toggles their treatment tasks at once"""
+        br = self.env['risk_management.business_risk']
+        risks = self.business_risk1 | br.create({'risk_info_id': self.risk_info3.id}) | br.create(
+            {'risk_info_id': self.risk_info3.id, 'risk_type': 'O'})
+        risks.write({'detectability': '3', 'occurrence': '4', 'severity': '3', 'is_confirmed': True})
+        risks[0].write({'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '4'})]})
+        risks[1].write({'evaluation_ids': [(0, False, {'detectability': '3', 'occurrence': '3', 'severity': '4'})]})
+        self.assertFalse(risks.mapped('treatment_task_id'))
+
+        risks.write({'severity': '2'})
+        self.assertEqual(risks.mapped('status'), ['N', 'N', 'U'])
+        self.assertEqual(risks[:2].mapped('latest_evaluation_id.threshold_value'), [24, 24])
+        tasks = risks[:2].mapped('treatment_task_id')
+        self.assertEqual(len(tasks), 2)
+        self.assertEqual(tasks.mapped('business_risk_id'), risks[:2])
+
+        risks.write({'severity': '5'})
+        self.assertEqual(risks.mapped('status'), ['A', 'A', 'U'])
+        self.assertEqual(risks[:2].mapped('latest_evaluation_id.threshold_value'), [60, 60])
+        self.assertFalse(any(tasks.mapped('active')))
+
+        risks.write({'severity': '2'})
+        self.assertTrue(all(tasks.mapped('active')))
+        self.assertEqual(risks[:2].mapped('treatment_task_id'), tasks)
+
+        # the thresholds are propagated even when their recomputation is postponed
+        risks.with_context(recompute=False).write({'severity': '4'})
+        self.assertEqual(risks[:2].mapped('latest_evaluation_id.threshold_value'), [48, 48])
+
     def test_write(self):
         pass
 
 
+class TestRiskImport(TestRiskReportCases):
+    def _make_import(self, rows, **vals):
+        content = io.StringIO()
+        writer = csv.writer(content)
+        writer.writerow(['category', 'subcategory', 'risk', 'description', 'risk_type', 'asset', 'detectability',
+                         'occurrence', 'severity'])
+        writer.writerows(rows)
+        vals.update(file=base64.b64encode(content.getvalue().encode('utf-8')), file_name='register.csv',
+                    chunk_size=2)
+        return self.env['risk_management.risk_import'].create(vals)
+
+    def test_import(self):
+        """Rows are reported in chunks, with the dedupe semantics of `create`, and errors are logged per row"""
+        known = self.risk_info1
+        rows = [
+            ['Imported risks', '', 'Risk of flood', 'The river might flood', 'T', '', '2', '3', '4'],
+            [known.risk_category_id.name, known.subcategory or '', known.name, '', 'T', '', '', '', ''],
+            ['Imported risks', '', 'Risk of flood', '', 'O', '', '', '', '9'],
+            ['Imported risks', 'Weather', 'Risk of drought', '', 'O', '', '', '', ''],
+            ['', '', 'Risk without category', '', 'T', '', '', '', ''],
+            ['Rejected risks', '', 'Risk of hail', '', 'X', '', '', '', ''],
+        ]
+        register = self._make_import(rows)
+        register.action_import()
+
+        self.assertEqual(register.state, 'done')
+        self.assertEqual(register.row_offset, 6)
+        self.assertEqual((register.created_count, register.duplicate_count, register.error_count), (2, 1, 3))
+        self.assertIn('Row 4:', register.log)
+        self.assertIn('Row 6:', register.log)
+        self.assertIn('Row 7:', register.log)
+        # the rows rejected leave no catalog entry behind
+        self.assertFalse(self.env['risk_management.risk.category'].search([('name', '=', 'Rejected risks')]))
+        self.assertFalse(self.env['risk_management.risk.info'].search([('name', '=', 'Risk of hail')]))
+
+        flood = self.env['risk_management.business_risk'].search([('risk_info_name', '=', 'Risk of flood')])
+        self.assertEqual(len(flood), 1)
+        self.assertEqual(flood.risk_info_category, 'Imported risks')
+        self.assertEqual((flood.detectability, flood.occurrence, flood.severity), ('2', '3', '4'))
+        self.assertEqual(flood.threshold_value, 24)
+
+    def test_import_asset(self):
+        """The asset of a row must reference an existing record, a row which does not is logged as an error"""
+        rows = [
+            ['Imported risks', '', 'Risk of flood', '', 'T', '%s,%s' % (self.sales._name, self.sales.id), '', '', ''],
+            ['Imported risks', '', 'Risk of storm', '', 'T', 'no.such.model,1', '', '', ''],
+            ['Imported risks', '', 'Risk of drought', '', 'T', '%s,sales' % self.sales._name, '', '', ''],
+            ['Imported risks', '', 'Risk of frost', '', 'T', '%s,0' % self.sales._name, '', '', ''],
+        ]
+        register = self._make_import(rows)
+        register.action_import()
+
+        self.assertEqual(register.state, 'done')
+        self.assertEqual((register.created_count, register.error_count), (1, 3))
+        self.assertEqual([line.split(':')[0] for line in register.log.splitlines()], ['Row 3', 'Row 4', 'Row 5'])
+        flood = self.env['risk_management.business_risk'].search([('risk_info_name', '=', 'Risk of flood')])
+        self.assertEqual(flood.ref_asset_id, self.sales)
+
+    def test_import_resume(self):
+        """An import resumes after the rows it has already processed"""
+        rows = [
+            ['Imported risks', '', 'Risk of flood', '', 'T', '', '', '', ''],
+            ['Imported risks', '', 'Risk of drought', '', 'T', '', '', '', ''],
+            ['Imported risks', '', 'Risk of storm', '', 'T', '', '', '', ''],
+        ]
+        register = self._make_import(rows)
+        register.write({'state': 'failed', 'row_offset': 2})
+        register.action_import()
+
+        self.assertEqual(register.state, 'done')
+        self.assertEqual((register.row_offset, register.created_count), (3, 1))
+        imported = self.env['risk_management.business_risk'].search([('risk_info_category', '=', 'Imported risks')])
+        self.assertEqual(imported.mapped('risk_info_name'), ['Risk of storm'])
+
+
 class TestSecurity(TestRiskReportCases):
     def setUp(self):
         super(TestSecurity, self).setUp()
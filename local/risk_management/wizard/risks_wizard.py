@@ -85,8 +85,8 @@ class BaseRiskLevelWizard(models.AbstractModel):
         risk_model = self.env.context.get('risk_model', False)
         if risk_id and risk_model:
             risk = self.env[risk_model].browse(risk_id)
-            if risk.exists() and risk.evaluation_ids.exists():
-                latest_evaluation = risk.evaluation_ids.sorted()[0]
+            if risk.exists() and risk.latest_evaluation_id:
+                latest_evaluation = risk.latest_evaluation_id
                 return {
                     'detectability': latest_evaluation.detectability,
                     'occurrence': latest_evaluation.occurrence,
@@ -128,8 +128,7 @@ class BaseRiskLevelWizard(models.AbstractModel):
     @api.depends('risk_id')
     def _compute_latest_eval(self):
         for wizard in self:
-            if wizard.risk_id.evaluation_ids:
-                wizard.latest_eval = wizard.risk_id.evaluation_ids.sorted().exists()[0]
+            wizard.latest_eval = wizard.risk_id.latest_evaluation_id
 
 
 class BusinessRiskThresholdWizard(models.TransientModel):